@@ -6,176 +6,37 @@
 
 
 # Import
+import sys #for logging
+
+# Command line mode, e.g. "python -m epml run --queue q.csv --mode pool --jobs 8"
+# Handled before tkinter is imported so it starts quickly and works on headless machines.
+if __name__ == '__main__' and len(sys.argv) > 1:
+	from epml_cli import main
+	sys.exit(main(sys.argv[1:]))
+
 import tkinter as tk
 from tkinter import ttk
+import tkinter.font as tkfont
 from tkinter import filedialog as fd
 from tkinter.messagebox import showinfo
 from tkinter.scrolledtext import ScrolledText
 import webbrowser
 import time
-from configparser import ConfigParser
-import subprocess
-import os
-import csv
-import sys #for logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from epml_engine import getPath, ini_to_text, loadSettings, searchfolder, readQueue, run_ep, runBefore, runAfter, BatchJournal, resumeList, estimateBatch, checkInputs
+from epml_idf import formatDuration
+import epml_engine
 #from tkinter import *
 
 
-# File & String Manipulation Functions
-
-# Convert tuple to string where each entry is a new line
-# Input: t = tuple containing one or more strings
-# Returns: s = string where each entry is on a new line
-def tuple2str(t):
-	s = ''
-	for i in t:
-		s = s + '\n' + i
-	return s
-
-#Remove specified file extension if it is present from a string representing the output file name
-# Input:
-#	c = string with filename
-#	ext = file extension as a string (ex. '.txt')
-# Returns: string with filename but no extension
-# Examples:
-# 1. remExt('myfile.txt','.txt') => 'myfile'
-# 2. remExt('myfile','.txt') => 'myfile'
-def remExt(c, ext):
-	if c[len(c)-len(ext): len(c)] == ext: c = c[:len(c)-len(ext)]
-	return c
-
-# Get file path from a string, assumes string contains filepath
-#prev is a way to handle if fs is not valid
-def getPath(fs,prev):
-	# returns index of last instance of '/' character, or -1 if '/' not found
-	try:
-		i = fs.rindex('/')
-		#handle windows filesystems.
-		if i == -1:
-			i = fs.rindex('\\')
-			if i == -1:
-				print('Warning: new path not found from the following string; using previous instead')
-				print(fs)
-				return prev
-	except (ValueError):
-		print('Warning: new path not found from the following string; using previous instead')
-		print(fs)
-		return prev
-	return str(fs[:i])
-
-# Extract only the name of a file from a filepath
-# Input: 
-#	String fs
-#	String ext = the file extension
-# Returns: String containing just the file name
-# Dependencies: remExt(c, ext)
-# Example: getFileName('/home/random/directories/myfile.txt', '.txt') => 'myfile'
-def getFileName(fs,ext):
-	#Attempting to handle Windows vs Linux file delimiter issues
-	fs = fs.replace('\\','/')
-	i = fs.rindex('/')
-	if i == -1:
-		i = fs.rindex('\\')
-	return remExt(str(fs[i+1:]),ext)
-
-
-#Format a string from typical code text box entry to format that can be stored in .ini file
-# issue is ', ", \, newline, tab will cause formatting errors when reading .ini
-# PROBLEMS
-# .ini does not support multiline variables. 
-# https://stackoverflow.com/questions/33930852/how-to-insert-multi-line-value-using-configparser
-# https://stackoverflow.com/questions/11399665/new-lines-with-configparser
-# Either need to convert them into single line - this creates new problem if the user
-# inputs a string like 
-#    print('one\ntwo')
-# which gets stored as
-#	 print('one
-#	 two')
-# and cannot be converted back easily
-# OR need to save it as something with a tab on each subsequent line
-# example:
-# 	variable = print('one')
-#		print('two')
-#
-# TODO [high priority]: Find a workaround to this bug
-# - worst case, can change it so each pre/postcode variable saves to a different text file, which would allow reading mutiline without any conversions
-
-def text_to_ini(s):
-	#several attempts that don't work
-	
-	# ini does not support triple quote method
-	#s = '\'\'\'' + s + '\'\'\''
-	
-	#Tried splitting by other newline characters, problem is both true new line and new line within a user
-	# created string both use '\n' and there's no good way to differentiate. 
-	'''
-	ss = s.split('\u2028')
-	s2 = ''
-	for line in ss:
-		s2 = s2 + line + '\u2028\t'
-	'''
-	
-	#buggy - if you insert a 
-	# Newline character
-	s = s.replace('\n','\\n')
-	# Tab to "\t"
-	s = s.replace('\t','\\t')
-	# Put a backslash in front of every quote mark in the code
-	s = s.replace('\'',"\\'")
-	s = s.replace('\"','\\"')
-	#s = s.replace('\\','\\\\')
-	
-	return s
-
-#Undo formatting in text_to_ini()
-def ini_to_text(s):
-	#s = s[3:len(s)-3]
-	
-	# Newline character
-	s = s.replace('\\n','\n')
-	# Tab to "\t"
-	s = s.replace('\\t','\t')
-	# Put a backslash in front of every quote mark in the code
-	s = s.replace("\\'",'\'')
-	s = s.replace('\\"','\"')
-	#s = s.replace('\\\\','\\')
-	
-	return s
-
-
 # Load settings =============================================================================================
-cp = ConfigParser()
-setfile = 'ep_multilaunch_settings.ini'
-cp.read(setfile)
-try:
-	sp = cp.get('general','sp')
-	dtime = int(cp.get('general','dtime'))
-	ep_dir = cp.get('general','ep_dir')
-	fpath_select_idf = cp.get('filepaths','fpath_select_idf')
-	fpath_select_epw = cp.get('filepaths','fpath_select_epw')
-	fpath_folder = cp.get('filepaths','fpath_folder')
-	fpath_queue = cp.get('filepaths','fpath_queue')
-	precode = ini_to_text(cp.get('general','preprocessing_code'))
-	postcode = ini_to_text(cp.get('general','postprocessing_code'))
-	precodepy = ini_to_text(cp.get('general','preprocessing_code_python'))
-	postcodepy = ini_to_text(cp.get('general','postprocessing_code_python'))
-	useLogTemp = cp.get('general','use_log_file')
-	if 'T' in useLogTemp: useLog = True
-	else: useLog = False
-except (NameError, ValueError, KeyError, IOError): #note ConfigParser.NoOptionError is not catchable. could use Exception
-	print("Warning: Could not get settings from ",setfile," \n Using default settings")
-	sp = 'parallel'
-	dtime = 30
-	ep_dir = 'C:\EnergyPlusV9-4-0\energyplus'
-	fpath_select_idf = '/'
-	fpath_select_epw = '/'
-	fpath_folder = '/'
-	fpath_queue = '/'
-	precode = ''
-	postcode = ''
-	precodepy = ''
-	postcodepy = ''
-	useLog = False
+setfile = epml_engine.setfile
+settings = loadSettings(setfile)
+# Keys of epml_engine.journal_settings changed with Apply Settings since the window opened; a resumed batch uses these
+# instead of the values its journal recorded
+changed_settings = set()
 
 # Set up ability to switch output between log file or console
 # https://stackoverflow.com/questions/11124093/redirect-python-print-output-to-logger#11124247
@@ -186,261 +47,19 @@ log = open('epml_out.log','w')
 # Function to save all settings that go in the .ini file
 # Called whenever new directory is selected to save filepath & whenever advanced settings are applied
 def saveSettings():
-	global sp
-	global dtime
-	global ep_dir
-	settings_str = '[general]\nsp = '+sp+'\ndtime = '+str(dtime)+'\nep_dir = '+ep_dir+'\n'
-	
-	global precode
-	global postcode
-	global precodepy
-	global postcodepy
 	# Handle log vs console setting
-	global useLog
 	#print('\nAll output will be written to epml_out.log. Please check log for any errors\n')
-	if useLog:
+	if settings['useLog']:
 		sys.stdout = log
 	else:
 		sys.stdout = console
 	
-	#Replace() is for handling new line: .ini can't read a true newline, but can write literal "\n" in a string
-	process_code_str = '\n' + 'preprocessing_code = ' + text_to_ini(precode) + '\npostprocessing_code = ' + text_to_ini(postcode) + '\npreprocessing_code_python = ' + text_to_ini(precodepy) + '\npostprocessing_code_python = ' + text_to_ini(postcodepy) +  '\nuse_log_file = ' + str(useLog) + '\n'
-	#process_code_str = '\n' + 'preprocessing_code = ' + text_to_ini(precode) + '\npostprocessing_code = ' + postcode.replace('\n','\\n') + '\npreprocessing_code_python = ' + precodepy.replace('\n','\\n') + '\npostprocessing_code_python = ' + postcodepy.replace('\n','\\n') +  '\nuse_log_file = ' + str(useLog) + '\n'
-	
-	# Get file paths stored in global variables
-	global fpath_select_idf
-	global fpath_select_epw
-	global fpath_folder
-	global fpath_queue
-	
-	fpath_str = '\n[filepaths]\nfpath_select_idf = '+fpath_select_idf+'\nfpath_select_epw = '+fpath_select_epw+'\nfpath_folder = '+fpath_folder+'\nfpath_queue = '+fpath_queue+'\n'
-	
-	# Combine strings
-	set_contents = settings_str + process_code_str + fpath_str
-	
 	# Overwrite settings ini file with new settings and filepaths
-	global setfile
-	stxt = open(setfile, "w")
-	stxt.write(set_contents)
-	stxt.close()
+	set_contents = epml_engine.saveSettings(settings, setfile)
 	
 	print('saved settings as:\n',set_contents)
 	
 
-# Functions for running simulations ==========================================================================
-
-def searchfolder(folderpath):
-	idffiles = []
-	idfpaths = []
-	epwpaths = []
-	weatherfile = 'NONE'
-	# Perform search to detect all .idf files in the parent and subdirectories
-	#  and get their full directory paths
-	for root, dirs, files in os.walk(folderpath):
-		for file in files:
-			#Find all .idf files. Autoignores "failsafe.idf" file used as a backup when another fails.
-			if file.endswith('.idf') and 'failsafe' not in file:
-				idfpaths.append(os.path.join(root,file))
-				idffiles.append(file)
-			#Find all .epw files
-			elif file.endswith('.epw'):
-				epwpaths.append(os.path.join(root,file))
-
-	# Get number of simulations
-	numSims = len(idffiles)
-	print('Found ', numSims, ' .idf simulation files.')
-	print(idffiles)
-
-	# Alphabetize the list of simulations (they are random otherwise)
-	simtuples = [(idffiles[i], idfpaths[i]) for i in range(0, numSims)]
-	simsSorted = sorted(simtuples, key=lambda s: s[0])
-	
-	# handles if it finds more than 1 .epw file
-	if len(epwpaths) > 1:
-		print('WARNING: Detected multiple weather files, using first one.')
-	# save weather file
-	if len(epwpaths) > 0:
-		weatherfile = epwpaths[0]
-	
-	# Throw error if no epw file found
-	if weatherfile == 'NONE' or len(epwpaths) < 1:
-		print('ERROR: No .epw file found!')
-	else: #Got valid weather file
-		print('Using weather file: ', weatherfile)
-	
-	return [idfpaths, weatherfile]
-
-# sims2run and wfiles are lists of strings
-def run_ep_series(sims2run,wfiles):
-	print("Queued ", len(sims2run), " E+ sims:")
-	folderDelim = '/'
-	errorcount = 0
-	worked = True
-
-	for sim,wfile in zip(sims2run,wfiles):
-		if not len(sim) == 0:
-			# Create run command
-			runcmd = ep_dir + ' --readvars --output-directory \"' + remExt(sim,'.idf') + '\" -w \"' + wfile + '\" \"' + sim + '\"'
-
-			print(runcmd)
-
-			#Launch subprocess in the shell
-			epproc = subprocess.run(runcmd, capture_output=True, shell=True)
-			print(epproc.stdout)
-			print(epproc.stderr)
-
-			#Display result. 0 = success; else failure
-			print(" returned: ", epproc.returncode)
-			# Detect error
-			if epproc.returncode != 0:
-				errorcount = errorcount + 1
-				worked = False
-				if epproc.returncode == 1:
-					print('ERROR: Incorrect filepath for output-directory, weather, and/or sim ', sim)
-				else:
-					print('WARNING: Simulation ', sim, ' has errors, check .err file!')
-			#else: #Successful run, now do postprocessing
-				#epoutfilename = remExt(sim,'.idf') + folderDelim + 'eplusmtr.csv'
-	
-	return worked
-
-def run_ep_parallel(sims2run,wfiles):
-	# Folder delimiter
-	folderDelim = '/'
-	pn = 0
-	global ep_dir
-	global dtime
-
-	#Initialize a list to hold all subprocesses, each which runs one simulation
-	simprocesses = []
-	simp_out = []
-	
-	# "Launch code" from which simulation will be launched in Python -> Command line
-	# run_PPPP.py - change port number = PPPP, filenames for .idf and .epw
-	# uses a "template" launch code file called run_TEMPLATE.py and changes a few things.
-	run_template = "run_TEMPLATE.py"
-	runtempfile = open(run_template, 'r')
-	run_contents = runtempfile.read()
-	
-	# create directory to put launchcodes
-	if not os.path.exists("launchcodes"):
-		os.makedirs("launchcodes")
-	
-	#Create launch code for each simulation
-	for sim,wfile in zip(sims2run,wfiles):
-		if not len(sim) == 0:
-			# This part needs to be in loop for all simulations
-			run_filename = "launchcodes" + folderDelim + "run_" + str(pn) + ".py"
-			runfile = open(run_filename, "a")
-			runfile.truncate(0) #delete existing contents
-			# Replace variables (keystrings) from the template with their actual values for this simulation
-			print('sim = ',sim)
-			print('simname = ',getFileName(sim,'.idf'))
-			runtowrite = run_contents.replace("PPPP",getFileName(sim,'.idf'))
-			#don't replace to avoid errors
-			runtowrite = runtowrite.replace("SIMULATION_FILENAME",sim.replace('\\','/'))
-			runtowrite = runtowrite.replace("WEATHER_FILENAME",wfile.replace('\\','/'))
-			runtowrite = runtowrite.replace("ENERGYPLUS_DIRECTORY",ep_dir)
-			runtowrite = runtowrite.replace("OUTPUT_DIRECTORY",remExt(sim,'.idf'))
-			
-			runfile.write(runtowrite)
-			runfile.close()
-			pn = pn + 1
-	
-	last = pn
-	pn = 0
-	
-	# Iteratively start codes to run each simulation in parallel
-	# each run_####.py code is needed to handle the relaunch and the parallelization
-	# time.sleep(seconds) is a delay to prevent crashing the computer during warmup/initialization
-	while pn < last:
-		#edit - changed to launchcodes\run####.py folder
-		pname = "Py launchcodes" + folderDelim + "run_" + str(pn) + ".py"
-		print("Launching: ", pname)
-		p = subprocess.Popen(pname, shell=True)
-		#TODO [Low priority]: make outputs fromm the run_####.py go to log not command line when useLog = True
-		# https://stackoverflow.com/questions/2502833/store-output-of-subprocess-popen-call-in-a-string
-		#p = subprocess.Popen(pname, stdout=subprocess.PIPE)
-		simprocesses.append(p)
-		#out,err = p.communicate()
-		#simp_out.append(out)
-		time.sleep(dtime)
-		pn = pn+1
-
-	# At this point, all simulations are running in parallel
-	print('\nAll simulations launched! Please wait while simulations run.\n')
-
-	# Wait for all simulations to complete
-	for sp in simprocesses:
-		sp.wait()
-	
-	worked = True
-	errorcount = 0
-	'''
-	for so in sim_out:
-		if 'ERROR' in so or 'failsafe' in so:
-			worked = False
-			errorcount = errorcount + 1
-	'''
-	# All simulations complete
-	print("Done running simulations!\n")
-	
-	return worked
-
-# Run preprocessing code
-def runBefore():
-	global precode
-	global precodepy
-	
-	# Bash cannot handle multiline commands. It only runs the first line
-	'''
-	execute_bash = subprocess.run(precode, capture_output=True, shell=True)
-	print(execute_bash.stdout)
-	print(execute_bash.stderr)
-	'''
-	precode_list = precode.split('\n')
-	
-	for line in precode_list:
-		print('Run >> ', line)
-		execute_bash = subprocess.run(line, capture_output=True, shell=True)
-		print(execute_bash.stdout)
-		print(execute_bash.stderr)
-	
-	# Run Python. 
-	# Python can handle multiline including loops, etc. 
-	exec(precodepy)
-	
-	'''
-	precode_list = precode.split('\n')
-	
-	for line in precode_list:
-		execute_code = subprocess.run(line, capture_output=True, shell=True)
-	
-	precodepy_list = precodepy.split('\n')
-	
-	for line in precodepy_list:
-		exec(line)
-	'''
-
-# Run postprocessing code
-def runAfter():
-	global postcode
-	global postcodepy
-	
-	# Run Bash code, one line at a time.
-	postcode_list = postcode.split('\n')
-	
-	for line in postcode_list:
-		print('Run >> ', line)
-		execute_bash = subprocess.run(line, capture_output=True, shell=True)
-		print(execute_bash.stdout)
-		print(execute_bash.stderr)
-	
-	# Run Python. 
-	# Python can handle multiline including loops, etc. 
-	exec(postcodepy)
-
-
 # Create GUI in Tkinter ======================================================================================
 # Root window
 w = tk.Tk()
@@ -466,10 +85,14 @@ tab2 = ttk.Frame(tabs)
 tab3 = ttk.Frame(tabs)
 tab4 = ttk.Frame(tabs)
 tab5 = ttk.Frame(tabs)
+tab6 = ttk.Frame(tabs)
+tab7 = ttk.Frame(tabs)
 tabs.add(tab1, text='Select Files to Run')
 tabs.add(tab2, text='Autodetect in Folder')
 tabs.add(tab3, text='Queue File')
+tabs.add(tab6, text='Batch Status')
 tabs.add(tab4, text='Advanced Settings')
+tabs.add(tab7, text='Run Options')
 tabs.add(tab5, text='About')
 tabs.pack(expand = 1, fill="both")
 
@@ -478,7 +101,7 @@ tabs.pack(expand = 1, fill="both")
 w.config(background = "white")
 
 # Status messages
-status_running = 'Running simulations, please wait...\nThis window may show (Not Responding) while simulations run.\n Do not close this window! It will respond again when simulations are complete.'
+status_running = 'Running simulations, please wait...\nSee the Batch Status tab for progress of each simulation.'
 status_success = 'Simulations Completed Successfully!'
 status_ready = 'Simulations Ready!'
 status_failed = 'Error: Simulations Failed! Please check log and .err files.'
@@ -489,6 +112,154 @@ color_failed = '#c81a1d' #Bread
 color_running = '#ffd900' #LemonDrop
 color_success = '#3ed75f' #CRG_Growing_Green
 
+# File lists =================================================================================================
+# A tk.Listbox holding 100,000 rows (each with its own color) is slow to fill and uses a lot of memory, so the file lists
+# only put the rows that are visible into the Listbox and redraw them when scrolled. The full list is kept as plain
+# Python lists. Grid .listbox and .scrollbar like a normal Listbox and Scrollbar.
+class VirtualList:
+	# Input: parent = tab, selectmode = as for tk.Listbox
+	def __init__(self, parent, selectmode='browse'):
+		self.listbox = tk.Listbox(parent, selectmode=selectmode, activestyle='none')
+		self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+		# Value of each row (e.g. .idf path), text shown, and {row: [background, foreground]} for rows not in row_color
+		self.values = []
+		self.texts = []
+		self.colors = {}
+		self.selected = set()
+		# First row shown, and number of rows that fit
+		self.top = 0
+		self.rows = 20
+		self.listbox.bind('<Configure>', self.resize)
+		self.listbox.bind('<<ListboxSelect>>', self.syncSelection)
+		self.listbox.bind('<MouseWheel>', self.wheel)
+		self.listbox.bind('<Button-4>', lambda e: self.scroll(-3))
+		self.listbox.bind('<Button-5>', lambda e: self.scroll(3))
+
+	# Colors of a normal row
+	row_color = ['gray', 'black']
+
+	# Replace every row
+	# Input: values = list of row values, texts = list of text shown (default: the values), colors = {row: [bg, fg]}
+	def setItems(self, values, texts=None, colors=None):
+		self.values = list(values)
+		self.texts = list(values) if texts is None else list(texts)
+		self.colors = {} if colors is None else colors
+		self.selected = set()
+		self.top = 0
+		self.render()
+
+	# Add rows at the end
+	def append(self, values):
+		self.values.extend(values)
+		self.texts.extend(values)
+		self.render()
+
+	def setColors(self, colors):
+		self.colors = colors
+		self.render()
+
+	def size(self):
+		return len(self.values)
+
+	def get(self, i):
+		return self.values[i]
+
+	# Remove the selected rows
+	# Returns: list of values removed
+	def deleteSelected(self):
+		removed = [self.values[i] for i in sorted(self.selected)]
+		keep = [i for i in range(len(self.values)) if i not in self.selected]
+		colors = {}
+		for n, i in enumerate(keep):
+			if i in self.colors:
+				colors[n] = self.colors[i]
+		self.values = [self.values[i] for i in keep]
+		self.texts = [self.texts[i] for i in keep]
+		self.colors = colors
+		self.selected = set()
+		self.render()
+		return removed
+
+	# Show the visible rows
+	def render(self):
+		n = len(self.values)
+		self.top = max(0, min(self.top, n - self.rows))
+		end = min(n, self.top + self.rows)
+		self.listbox.delete(0, tk.END)
+		if end > self.top:
+			self.listbox.insert(tk.END, *self.texts[self.top:end])
+		for i in range(self.top, end):
+			bg, fg = self.colors.get(i, self.row_color)
+			self.listbox.itemconfig(i - self.top, bg = bg, fg = fg)
+			if i in self.selected:
+				self.listbox.selection_set(i - self.top)
+		if n == 0:
+			self.scrollbar.set(0, 1)
+		else:
+			self.scrollbar.set(self.top / n, end / n)
+
+	# Scrollbar command: ('moveto', fraction) or ('scroll', number, 'units' or 'pages')
+	def yview(self, *args):
+		if args[0] == 'moveto':
+			self.top = int(float(args[1]) * len(self.values))
+			self.render()
+		elif args[0] == 'scroll':
+			step = int(args[1])
+			if args[2] == 'pages':
+				step = step * self.rows
+			self.scroll(step)
+
+	def scroll(self, step):
+		self.top = self.top + step
+		self.render()
+		return 'break'
+
+	def wheel(self, event):
+		# Windows reports multiples of 120, macOS small numbers
+		steps = max(1, abs(event.delta) // 120) * 3
+		return self.scroll(-steps if event.delta > 0 else steps)
+
+	# Work out how many rows fit when the window is resized
+	def resize(self, event):
+		line = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace') + 2 * int(self.listbox.cget('selectborderwidth'))
+		rows = max(1, event.height // max(1, line))
+		if not rows == self.rows:
+			self.rows = rows
+			self.render()
+
+	# Copy clicks in the Listbox to the selected set
+	def syncSelection(self, event=None):
+		for j in range(self.listbox.size()):
+			if self.listbox.selection_includes(j):
+				self.selected.add(self.top + j)
+			else:
+				self.selected.discard(self.top + j)
+
+
+# Background checks ==================================================================================
+# Searching a folder, checking the .idf files and estimating their run times read every file (and the first check starts
+# EnergyPlus to get its version), which takes a while for a big folder or a network share. They run on a background
+# thread so the window keeps responding, and the results are shown from the Tk thread with w.after(), like batches.
+
+# Milliseconds between checks for a finished background job
+check_poll_ms = 100
+check_executor = ThreadPoolExecutor(max_workers=1)
+
+# Run work(*args) on the background thread, then done(result) on the Tk thread; result is None if work raised an error
+def inBackground(work, done, *args):
+	future = check_executor.submit(work, *args)
+	def poll():
+		if not future.done():
+			w.after(check_poll_ms, poll)
+			return
+		try:
+			result = future.result()
+		except (Exception) as e:
+			print('ERROR: Background check failed: ', e)
+			result = None
+		done(result)
+	w.after(check_poll_ms, poll)
+
 # 1 - Manual select =======================================================================================
 epwfilename = ''
 numIDF = 0
@@ -498,8 +269,6 @@ numIDF = 0
 # https://www.pythontutorial.net/tkinter/tkinter-open-file-dialog/
 def select_idfs():
 	
-	global fpath_select_idf
-	
 	filetypes = (
 		('idf files','*.idf'),
 		('text files', '*.txt'),
@@ -508,31 +277,42 @@ def select_idfs():
 
 	filenames = fd.askopenfilenames(
 		title='Browse files',
-		initialdir=fpath_select_idf,
+		initialdir=settings['fpath_select_idf'],
 		filetypes=filetypes
 	)
 	
 	global numIDF
-	for fi in range(len(filenames)):
-		opened_files_box.insert(1,filenames[fi])
-		opened_files_box.itemconfig(fi, bg = 'gray')
-		numIDF = numIDF + 1
+	opened_files_box.append(filenames)
+	numIDF = opened_files_box.size()
 		
 	# Save current filepath to .idf file
-	fpath_select_idf = getPath(filenames[0],fpath_select_idf)
-	print('Next .idf files directory: ',fpath_select_idf)
+	settings['fpath_select_idf'] = getPath(filenames[0],settings['fpath_select_idf'])
+	print('Next .idf files directory: ',settings['fpath_select_idf'])
 	saveSettings()
 	
-	global epwfilename
-	if epwfilename == '':
-		status1.config(text = 'Select .epw above.', background=color_select, foreground='black')
-	else:
-		status1.config(text = status_ready, background=color_ready, foreground='black')
+	flagInvalidSelected()
 	
+# Color the selected .idf files that will not run in red (see checkInputs()) and show the status, once checked in the
+# background
+def flagInvalidSelected():
+	idfs = list(opened_files_box.values)
+	epw = epwfilename
+	status1.config(text = 'Checking .idf files...', background=color_select, foreground='black')
+	def show(invalid):
+		# Files or weather changed while checking; the newer check shows its own result
+		if list(opened_files_box.values) != idfs or epwfilename != epw:
+			return
+		if invalid is None:
+			invalid = {}
+		opened_files_box.setColors({i: [color_failed, 'white'] for i in invalid})
+		if epw == '':
+			status1.config(text = 'Select .epw above.' + invalidText(invalid), background=color_select, foreground='black')
+		else:
+			status1.config(text = status_ready + invalidText(invalid), background=color_ready, foreground='black')
+	inBackground(checkInputs, show, idfs, [epw] * len(idfs), dict(settings))
 
 def select_epw():
 	# Get filepath last used. 
-	global fpath_select_epw
 	
 	filetypes = (
 		('EnergyPlus Weather files','*.epw'),
@@ -543,7 +323,7 @@ def select_epw():
 	global epwfilename
 	epwfilename = fd.askopenfilename(
 		title='Browse files',
-		initialdir=fpath_select_epw,
+		initialdir=settings['fpath_select_epw'],
 		filetypes=filetypes
 	)
 	print('Got: ', epwfilename)
@@ -551,29 +331,26 @@ def select_epw():
 	selected_epw.insert(tk.END, epwfilename)
 	
 	# Save current filepath to .epw file
-	fpath_select_epw = getPath(epwfilename,fpath_select_epw)
-	print('Next epw file directory: ',fpath_select_epw)
+	settings['fpath_select_epw'] = getPath(epwfilename,settings['fpath_select_epw'])
+	print('Next epw file directory: ',settings['fpath_select_epw'])
 	saveSettings()
 	
 	if numIDF < 1:
 		status1.config(text = 'Select .idf above.', background=color_select, foreground='black')
 	else:
-		status1.config(text = status_ready, background=color_ready, foreground='black')
+		flagInvalidSelected()
 
 
 # From https://www.pythontutorial.net/tkinter/tkinter-listbox/
 def remove_opened_files_selected():
-	i_select = opened_files_box.curselection()
-	selected_filenames = []
 	global numIDF
-	for i in i_select:
-		print('i = ',i)
-		selected_filenames.append(opened_files_box.get(i))
-		print('Removing: ', opened_files_box.get(i))
-		opened_files_box.delete(i)
-		numIDF = numIDF - 1
-		
-	if numIDF < 1:
+	for filename in opened_files_box.deleteSelected():
+		print('Removing: ', filename)
+	numIDF = opened_files_box.size()
+	
+	if numIDF > 0:
+		flagInvalidSelected()
+	else:
 		if epwfilename == '':
 			status1.config(text = 'Select .idf and .epw above.', background=color_select, foreground='black')
 		else:
@@ -595,11 +372,7 @@ button_select_epw = tk.Button(tab1, text = 'Select .epw file', command = select_
 selected_epw = tk.Text(tab1,bg='white',height=1)
 
 # list opened files
-opened_files_box = tk.Listbox(tab1, selectmode='multiple')#,yscrollcommand=yscrollbar.set)
-
-yscrollbar = ttk.Scrollbar(tab1,orient=tk.VERTICAL,command=opened_files_box.yview)
-
-opened_files_box['yscrollcommand'] = yscrollbar.set
+opened_files_box = VirtualList(tab1, selectmode='multiple')
 
 button_remove_idfs = tk.Button(tab1, text='Remove selected files', command=remove_opened_files_selected)
 
@@ -613,7 +386,6 @@ def run_simulations_select():
 	w.after(10, lambda: run_simulations_select_2())
 
 def run_simulations_select_2():
-	runBefore()
 	global numIDF
 	if not epwfilename == '' and numIDF > 0:
 		print('Run simulations via select files method')
@@ -626,26 +398,10 @@ def run_simulations_select_2():
 		#tk.messagebox.showinfo('EnergyPlus Parallel Launch Simulation in Progress','Simulations in progress. Please wait.\nEnergyPlus Parallel Launch window may say (Not Responding), this is normal and it will respond again once simulations are complete.')
 		
 		# generate list of current simulations
-		idfs_manual = []
-		epw_manual = []
-		for i in range(numIDF):
-			idfs_manual.append(opened_files_box.get(i))
-			epw_manual.append(epwfilename)
+		idfs_manual = list(opened_files_box.values)
+		epw_manual = [epwfilename] * numIDF
 		
-		res1 = False
-		if sp == 'parallel':
-			print('run parallel')
-			res1 = run_ep_parallel(idfs_manual,epw_manual)
-		else:
-			print('run series')
-			res1 = run_ep_series(idfs_manual,epw_manual)
-		#time.sleep(2) #only for testing
-		#only the last status1 message appears, after the sleep
-		if res1 == True:
-			runAfter()
-			status1.config(text = status_success, background=color_success, foreground='black')
-		else:
-			status1.config(text = status_failed, background=color_failed, foreground='white')
+		startBatch(idfs_manual,epw_manual,status1)
 	else:
 		status1.config(text = 'Error: Invalid .idf filenames inputted. Could not run anything.', background=color_failed, foreground='white')
 
@@ -662,8 +418,8 @@ tab1.grid_rowconfigure(3,weight=2)
 
 instructions.grid(column=0,row=1,columnspan=3,sticky='ew')
 button_select_idfs.grid(column=0,row=2,sticky='ew')
-opened_files_box.grid(column=0,row=3,sticky='nsew',columnspan=2)
-yscrollbar.grid(column=2,row=3,sticky='ns')
+opened_files_box.listbox.grid(column=0,row=3,sticky='nsew',columnspan=2)
+opened_files_box.scrollbar.grid(column=2,row=3,sticky='ns')
 #button_remove_idfs.grid(column=0,row=4)
 button_remove_idfs.grid(column=1,row=2,sticky='ew')
 instructions2.grid(column=0,row=4,sticky='ew')
@@ -673,7 +429,7 @@ status1.grid(column=0,row=6,columnspan=3,sticky='ew')
 run1.grid(column=1,row=7,sticky='ew')
 
 # 2 - Autodetect =====================================================================================
-i_auto_str = 'Automatically detects all .idf files and the .epw file from the selected directory and all subdirectories.'
+i_auto_str = 'Automatically detects all .idf files from the selected directory and all subdirectories, each with the nearest .epw file.'
 i_auto = tk.Label(tab2, text = i_auto_str)
 #i_auto_2 = tk.Label(tab2, text = 'Select folder')
 
@@ -684,50 +440,103 @@ list_idf_autodetect = []
 epw_autodetect = []
 list_epw_autodetect = []
 
+# Check the .idf files and estimate their run times; runs on the background thread
+# Input: idfs, epws = lists of .idf and .epw paths, checksettings = copy of settings
+# Returns: [invalid dictionary from checkInputs(), list of estimates of the files that will run, batch estimate]
+def checkEstimates(idfs, epws, checksettings):
+	invalid = checkInputs(idfs, epws, checksettings)
+	torun = [idfs[fi] for fi in range(len(idfs)) if fi not in invalid and not len(idfs[fi]) == 0]
+	estimates, total = estimateBatch(torun, checksettings)
+	return [invalid, estimates, total]
+
+# Show each .idf with its estimated run time in a listbox, and flag the ones that will not run
+# Input: listbox = VirtualList, idfs, epws = lists of .idf and .epw paths, checked = result of checkEstimates()
+# Returns: status text with the estimated time for the whole batch and the number of invalid files
+def showEstimates(listbox, idfs, epws, checked):
+	invalid, estimates, total = checked
+	torun = [idfs[fi] for fi in range(len(idfs)) if fi not in invalid and not len(idfs[fi]) == 0]
+	estimates = list(reversed(estimates))
+	texts = []
+	for fi in range(len(idfs)):
+		if fi in invalid:
+			texts.append(idfs[fi] + '    INVALID: ' + '; '.join(invalid[fi]))
+		elif len(idfs[fi]) == 0:
+			texts.append('(blank row, skipped)')
+		else:
+			texts.append(idfs[fi] + '    (~' + formatDuration(estimates.pop()) + ')')
+	listbox.setItems(idfs, texts, {fi: [color_failed, 'white'] for fi in invalid})
+	return str(len(torun)) + ' simulations, estimated batch time ~' + formatDuration(total) + invalidText(invalid)
+
+# Returns: status text warning about invalid files, '' if there are none
+def invalidText(invalid):
+	if len(invalid) == 0:
+		return ''
+	return '\n' + str(len(invalid)) + ' invalid .idf files (in red) will not run, see the list or log'
+
+# Search a folder, then check and estimate what it found; runs on the background thread
+# Returns: [list of .idf files, nearest .epw for each, result of checkEstimates()]
+def searchAndCheck(folderpath, checksettings):
+	list_idf_epw = searchfolder(folderpath, checksettings)
+	# list_idf_epw = [ [list of idf files] [nearest epw file for each idf] ]
+	return [list_idf_epw[0], list_idf_epw[1], checkEstimates(list_idf_epw[0], list_idf_epw[1], checksettings)]
+
 def select_folder():
-	global fpath_folder
+	global list_idf_autodetect
+	global list_epw_autodetect
 	
-	folderpath = str(fd.askdirectory(initialdir=fpath_folder))
+	folderpath = str(fd.askdirectory(initialdir=settings['fpath_folder']))
 	print('Got: ', folderpath)
 	
 	selected_folder.delete('1.0',tk.END)
 	selected_folder.insert(tk.END, folderpath)
 	
-	list_idf_epw = searchfolder(folderpath)
-	# list_idf_epw = [ [list of idf files] [epw filename] ]
+	# Nothing can be run until the search is done
+	list_idf_autodetect = []
+	list_epw_autodetect = []
+	opened_files_2.setItems([])
+	status2.config(text = 'Searching folder and checking .idf files...', background=color_select, foreground='black')
+	inBackground(searchAndCheck, lambda found: showFolder(folderpath, found), folderpath, dict(settings))
+
+# Show the result of searching a folder, on the Tk thread
+# Input: folderpath = folder searched, found = result of searchAndCheck(), or None if it failed
+def showFolder(folderpath, found):
 	global list_idf_autodetect
-	list_idf_autodetect = list_idf_epw[0]
-	global epw_autodetect
-	epw_autodetect = list_idf_epw[1]
+	global list_epw_autodetect
+	# Another folder was selected while this one was searched; its own search shows it
+	if selected_folder.get('1.0', 'end-1c') != folderpath:
+		return
+	if found is None:
+		status2.config(text = 'Error: Could not search the selected folder, see the log.', background=color_failed, foreground='white')
+		return
+	list_idf_autodetect, list_epw_autodetect, checked = found
 	
-	#Clear listbox
-	opened_files_2.delete(0,tk.END)
-	#Insert detected files into listbox
-	for fi in range(len(list_idf_autodetect)):
-		opened_files_2.insert(1,list_idf_autodetect[fi])
-		opened_files_2.itemconfig(fi, bg = 'gray')
+	#Show detected files in listbox with their estimated run times
+	eta = showEstimates(opened_files_2, list_idf_autodetect, list_epw_autodetect, checked)
 	
+	# Show the weather file, or how many there are if the subfolders have their own
+	global epw_autodetect
+	epws = sorted(set(list_epw_autodetect) - {''})
+	if len(epws) == 1:
+		epw_autodetect = epws[0]
+	else:
+		epw_autodetect = str(len(epws)) + ' weather files, each .idf uses the one nearest to it'
 	selected_epw_2.delete('1.0',tk.END)
 	selected_epw_2.insert(tk.END, epw_autodetect)
 	
 	if len(list_idf_autodetect) < 1:
 		print('ERROR: None/Invalid .idf in folder selected!')
 		status2.config(text = 'Error: No .idf files found in selected folder!', background=color_failed, foreground='white')
-	elif epw_autodetect == 'NONE':
+	elif '' in list_epw_autodetect:
 		print('ERROR: No .epw found in selected folder!')
-		status2.config(text = 'Error: No .epw file found in selected folder!', background=color_failed, foreground='white')
+		status2.config(text = 'Error: No .epw file found in the folder or parent folders of ' + str(list_epw_autodetect.count('')) + ' .idf files!', background=color_failed, foreground='white')
+		list_epw_autodetect = []
 	else:
-		# Expand epw_autodetect into list to be compatible
-		global list_epw_autodetect
-		for i in range(len(list_idf_autodetect)):
-			list_epw_autodetect.append(epw_autodetect)
-		
 		# Save current folder path to settings file
-		fpath_folder = getPath(folderpath,fpath_folder)
-		print('Next folder search directory: ',fpath_folder)
+		settings['fpath_folder'] = getPath(folderpath,settings['fpath_folder'])
+		print('Next folder search directory: ',settings['fpath_folder'])
 		saveSettings()
 		
-		status2.config(text = status_ready, background=color_ready, foreground='black')
+		status2.config(text = status_ready + '\n' + eta, background=color_ready, foreground='black')
 
 button_select_folder = tk.Button(tab2, text = 'Browse Folder', command = select_folder)
 
@@ -736,7 +545,6 @@ def run_simulations_folder():
 	w.after(10, lambda: run_simulations_folder_2())
 
 def run_simulations_folder_2():
-	runBefore()
 	global list_epw_autodetect
 	global list_idf_autodetect
 	if len(list_epw_autodetect) > 0 and len(list_idf_autodetect) > 0:
@@ -747,19 +555,7 @@ def run_simulations_folder_2():
 			list_idf_autodetect[i] = list_idf_autodetect[i].replace('\\','/')
 		
 		#status2.config(text = status_running, background=color_running, foreground='black')
-		if sp == 'parallel':
-			print('run parallel')
-			res2 = run_ep_parallel(list_idf_autodetect,list_epw_autodetect)
-		else:
-			print('run series')
-			res2 = run_ep_series(list_idf_autodetect,list_epw_autodetect)
-		
-		#Interpret and return result message
-		if res2 == True:
-			runAfter()
-			status2.config(text = status_success, background=color_success, foreground='black')
-		else:
-			status2.config(text = status_failed, background=color_failed, foreground='white')
+		startBatch(list_idf_autodetect,list_epw_autodetect,status2)
 	else:
 		status2.config(text = 'Error: Invalid folderpath. Could not run anything.', background=color_failed, foreground='white')
 
@@ -767,12 +563,8 @@ run2 = tk.Button(tab2, text='Run Simulations', command=run_simulations_folder)
 
 status2 = tk.Label(tab2, text = 'Select folder above.', background=color_select, foreground='black',borderwidth=2,height=3)
 # list opened files
-opfiles2_label = tk.Label(tab2, text = 'Input Simulation Files (.idf)')
-opened_files_2 = tk.Listbox(tab2, selectmode='multiple')#,yscrollcommand=yscrollbar.set)
-
-yscrollbar2 = ttk.Scrollbar(tab2,orient=tk.VERTICAL,command=opened_files_2.yview)
-
-opened_files_2['yscrollcommand'] = yscrollbar2.set
+opfiles2_label = tk.Label(tab2, text = 'Input Simulation Files (.idf) with estimated run times')
+opened_files_2 = VirtualList(tab2, selectmode='multiple')
 selepw2_label = tk.Label(tab2, text = 'Weather file (.epw)')
 selected_epw_2 = tk.Text(tab2,bg='white',height=1)
 
@@ -786,8 +578,8 @@ i_auto.grid(column=0,row=1,columnspan=3,sticky='ew')
 button_select_folder.grid(column=0,row=2,sticky='ew')
 selected_folder.grid(column=1,row=2,columnspan=2,sticky='ew')
 opfiles2_label.grid(column=0,row=3,columnspan=3,sticky='ew')
-opened_files_2.grid(column=0,row=4,sticky='nsew',columnspan=2)
-yscrollbar2.grid(column=2,row=4,sticky='ns')
+opened_files_2.listbox.grid(column=0,row=4,sticky='nsew',columnspan=2)
+opened_files_2.scrollbar.grid(column=2,row=4,sticky='ns')
 selepw2_label.grid(column=0,row=5,columnspan=3,sticky='ew')
 selected_epw_2.grid(column=0,row=6,columnspan=3,sticky='ew')
 status2.grid(column=0,row=7,columnspan=3,sticky='ew')
@@ -800,25 +592,65 @@ i_q = tk.Label(tab3, text = i_q_str)
 queue_file_text = tk.Text(tab3,bg='white',height=1)
 
 queue_file = ''
+# Simulations read from the queue file when it was selected
+list_idf_queue = []
+list_epw_queue = []
+
+# Returns: status text with the number of rows, blank rows, duplicate rows, and weather files in a queue
+def queueSummary(idfs, epws):
+	sims = [row for row in zip(idfs, epws) if not len(row[0]) == 0]
+	duplicates = len(sims) - len(set(sims))
+	return 'Queue: ' + str(len(idfs)) + ' rows, ' + str(len(idfs) - len(sims)) + ' blank, ' + str(duplicates) + ' duplicates, ' + str(len(set(epws) - {''})) + ' weather files'
 
 def select_queue():
 	global queue_file
-	global fpath_queue
+	global list_idf_queue
+	global list_epw_queue
 	
-	queue_file = str(fd.askopenfilename(title='Browse Queue File',initialdir=fpath_queue))
+	queue_file = str(fd.askopenfilename(title='Browse Queue File',initialdir=settings['fpath_queue']))
 	print('Got: ', queue_file)
 	
 	queue_file_text.delete('1.0',tk.END)
 	queue_file_text.insert(tk.END, queue_file)
 	
 	# Save current filepath to queue file
-	fpath_queue = getPath(queue_file,fpath_queue)
-	print('Next queue file directory: ',fpath_queue)
+	settings['fpath_queue'] = getPath(queue_file,settings['fpath_queue'])
+	print('Next queue file directory: ',settings['fpath_queue'])
 	saveSettings()
 	
-	#TODO [medium priority]: Move reading of queue file to here & display the input files and weather file before running like in Autodetect mode
-	
-	status3.config(text = status_ready, background=color_ready, foreground='black')
+	# Read the queue once, and show the queued files with their estimated run times before running
+	try:
+		list_idf_queue, list_epw_queue = readQueue(queue_file)
+	except (KeyError, IOError, OSError, UnicodeDecodeError):
+		list_idf_queue = []
+		list_epw_queue = []
+		opened_files_3.setItems([])
+		status3.config(text = 'Error: Invalid queue_file. Could not run anything.', background=color_failed, foreground='white')
+		return
+	# Nothing can be run until the queue is checked
+	idfs = list_idf_queue
+	epws = list_epw_queue
+	list_idf_queue = []
+	list_epw_queue = []
+	opened_files_3.setItems([])
+	status3.config(text = 'Checking .idf files...\n' + queueSummary(idfs, epws), background=color_select, foreground='black')
+	inBackground(checkEstimates, lambda checked: showQueue(queue_file, idfs, epws, checked), idfs, epws, dict(settings))
+
+# Show the queue once it is checked, on the Tk thread
+# Input: path = queue file checked, idfs, epws = its rows, checked = result of checkEstimates(), or None if it failed
+def showQueue(path, idfs, epws, checked):
+	global list_idf_queue
+	global list_epw_queue
+	# Another queue file was selected while this one was checked
+	if path != queue_file:
+		return
+	if checked is None:
+		status3.config(text = 'Error: Could not check the queue, see the log.', background=color_failed, foreground='white')
+		return
+	list_idf_queue = idfs
+	list_epw_queue = epws
+	eta = showEstimates(opened_files_3, idfs, epws, checked)
+	status3.config(text = status_ready + '\n' + queueSummary(idfs, epws) + '\n' + eta, background=color_ready, foreground='black')
 
 button_select_queue = tk.Button(tab3, text = 'Browse Queue File', command = select_queue)
 
@@ -827,41 +659,19 @@ def run_simulations_queue():
 	w.after(10, lambda: run_simulations_queue_2())
 
 def run_simulations_queue_2():
-	runBefore()
-	global queue_file
-	if not queue_file == '':
-		try:
-			list_idf_queue = []
-			list_epw_queue = []
-			#read csv with headers
-			with open(queue_file) as csvfile:
-				readCSV = csv.DictReader(csvfile, delimiter=',')
-				for row in readCSV:
-					list_idf_queue.append(row['Filepath'])
-					list_epw_queue.append(row['Weather'])
-			print('Run simulations via queue method')
-			#status3.config(text = status_running, background=color_running, foreground='black')
-			if sp == 'parallel':
-				print('run parallel')
-				res3 = run_ep_parallel(list_idf_queue,list_epw_queue)
-			else:
-				print('run series')
-				res3 = run_ep_series(list_idf_queue,list_epw_queue)
-			
-			#Interpret and return result message
-			if res3 == True:
-				runAfter
-				status3.config(text = status_success, background=color_success, foreground='black')
-			else:
-				status3.config(text = status_failed, background=color_failed, foreground='white')
-		except (KeyError):
-			status3.config(text = 'Error: Invalid queue_file. Could not run anything.', background=color_failed, foreground='white')
+	if len(list_idf_queue) > 0:
+		print('Run simulations via queue method')
+		#status3.config(text = status_running, background=color_running, foreground='black')
+		startBatch(list_idf_queue,list_epw_queue,status3)
 	else:
 		status3.config(text = 'Error: Invalid queue_file. Could not run anything.', background=color_failed, foreground='white')
 
 run3 = tk.Button(tab3, text='Run Simulations', command=run_simulations_queue)
 
 status3 = tk.Label(tab3, text = 'Select queue file .csv above.', background=color_select, foreground='black',borderwidth=2, height=5)
+# list queued files
+opfiles3_label = tk.Label(tab3, text = 'Queued Simulation Files (.idf) with estimated run times')
+opened_files_3 = VirtualList(tab3)
 
 # Tab 3 grid
 tab3.grid_columnconfigure(0,weight=1)
@@ -872,35 +682,227 @@ i_q.grid(column=0,row=1,columnspan=3,sticky='ew')
 button_select_queue.grid(column=0,row=2,sticky='ew')
 #i_auto_2.grid(column=0,row=2,sticky='ew')
 queue_file_text.grid(column=1,row=2,columnspan=2,sticky='ew')
-status3.grid(column=0,row=3,columnspan=3,sticky='ew')
-run3.grid(column=1,row=4,sticky='ew')
+opfiles3_label.grid(column=0,row=3,columnspan=3,sticky='ew')
+opened_files_3.listbox.grid(column=0,row=4,sticky='nsew',columnspan=2)
+opened_files_3.scrollbar.grid(column=2,row=4,sticky='ns')
+status3.grid(column=0,row=5,columnspan=3,sticky='ew')
+run3.grid(column=1,row=6,sticky='ew')
+
+
+# Batch Status =======================================================================================
+# Batches run on a background thread so the window keeps responding. The engine reports the status of each
+# simulation through batch_events (a thread-safe queue), which is read here with w.after() every batch_poll_ms.
+# Events are applied to the table in one go per poll, so very large batches do not flood tkinter with redraws.
+
+# Milliseconds between updates of the Batch Status tab
+batch_poll_ms = 250
+# Most progress events handled per update, so the window stays responsive if thousands arrive at once
+batch_max_events = 5000
+
+batch_events = queue.Queue()
+batch_cancel = threading.Event()
+batch_executor = ThreadPoolExecutor(max_workers=1)
+batch_future = None
+# Status label of the tab that started the current batch
+batch_label = None
+# Status of each simulation in the table: index in the batch -> [status, start time]
+batch_rows = {}
+batch_counts = {}
+
+# Runs on the background thread: preprocessing, simulations if it worked, then postprocessing if all succeeded
+# runsettings is a copy of settings so changes in Advanced Settings do not affect a running batch
+# Progress is also written to the batch journal; resume adds to the last batch's journal instead of starting a new one
+def batchJob(idfs, epws, runsettings, resume):
+	if not runBefore(runsettings, batch_cancel):
+		print('ERROR: Preprocessing failed, not running the simulations')
+		return False
+	if resume:
+		journal = BatchJournal(runsettings['journal'], events=batch_events)
+	else:
+		journal = BatchJournal(runsettings['journal'], idfs, epws, batch_events, runsettings)
+	try:
+		worked = run_ep(idfs, epws, runsettings, journal, batch_cancel)
+	finally:
+		journal.close()
+	if worked:
+		worked = runAfter(runsettings, batch_cancel)
+	return worked
+
+# Start running a batch in the background
+# Input:
+#	idfs, epws = lists of .idf and .epw paths
+#	label = status label of the tab that started it, gets the final success/failure message
+#	resume = True when resuming the last batch from its journal
+#	runsettings = settings to run with, defaults to a copy of the current settings
+def startBatch(idfs, epws, label, resume=False, runsettings=None):
+	global batch_future
+	global batch_label
+	if batch_future is not None and not batch_future.done():
+		label.config(text = 'Error: A batch is already running.\nWait for it to finish or cancel it in the Batch Status tab.', background=color_failed, foreground='white')
+		return
+	
+	# Clear the previous batch from the table and list every simulation as queued
+	batch_cancel.clear()
+	while not batch_events.empty():
+		batch_events.get_nowait()
+	status_table.delete(*status_table.get_children())
+	batch_rows.clear()
+	for s in batch_statuses:
+		batch_counts[s] = 0
+	for i in range(len(idfs)):
+		if not len(idfs[i]) == 0:
+			status_table.insert('', tk.END, iid=str(i), values=(idfs[i], epml_engine.status_queued, '', ''))
+			batch_rows[i] = [epml_engine.status_queued, None]
+			batch_counts[epml_engine.status_queued] = batch_counts[epml_engine.status_queued] + 1
+	updateBatchSummary()
+	
+	label.config(text = status_running, background=color_running, foreground='black')
+	batch_label = label
+	button_cancel.config(state='normal')
+	batch_future = batch_executor.submit(batchJob, list(idfs), list(epws), dict(settings if runsettings is None else runsettings), resume)
+	w.after(batch_poll_ms, pollBatch)
+
+# Read progress events from the engine and update the table
+def pollBatch():
+	changed = set()
+	for n in range(batch_max_events):
+		try:
+			i, sim, status, rc = batch_events.get_nowait()
+		except (queue.Empty):
+			break
+		if i not in batch_rows:
+			continue
+		row = batch_rows[i]
+		batch_counts[row[0]] = batch_counts[row[0]] - 1
+		batch_counts[status] = batch_counts[status] + 1
+		row[0] = status
+		if status == epml_engine.status_running:
+			row[1] = time.time()
+		changed.add((i, rc))
+	
+	for i, rc in changed:
+		row = batch_rows[i]
+		status_table.set(str(i), 'status', row[0])
+		if rc is not None:
+			status_table.set(str(i), 'rc', str(rc))
+		if row[0] != epml_engine.status_running and row[1] is not None:
+			status_table.set(str(i), 'time', str(round(time.time() - row[1])))
+	if len(changed) > 0:
+		updateBatchSummary()
+	
+	if batch_future.done() and batch_events.empty():
+		finishBatch()
+	else:
+		w.after(batch_poll_ms, pollBatch)
+
+# Batch finished: show the result in the tab that started it
+def finishBatch():
+	button_cancel.config(state='disabled')
+	try:
+		worked = batch_future.result()
+	except (Exception) as e:
+		print('ERROR: Batch stopped by an error: ', e)
+		worked = False
+	if batch_cancel.is_set():
+		batch_label.config(text = 'Batch cancelled.', background=color_failed, foreground='white')
+	elif worked:
+		batch_label.config(text = status_success, background=color_success, foreground='black')
+	else:
+		batch_label.config(text = status_failed, background=color_failed, foreground='white')
+	updateBatchSummary()
+
+def updateBatchSummary():
+	summary = ''
+	for s in batch_statuses:
+		summary = summary + s.capitalize() + ': ' + str(batch_counts.get(s, 0)) + '    '
+	batch_summary.config(text = summary)
+
+def cancel_batch():
+	if batch_future is not None and not batch_future.done():
+		print('Cancelling batch')
+		batch_cancel.set()
+		batch_summary.config(text = 'Cancelling, please wait...')
+
+# Run the unfinished and failed simulations of the last batch again, from the batch journal
+def resume_batch():
+	if len(settings['journal']) == 0:
+		status6.config(text = 'Error: No batch journal file set in Run Options.', background=color_failed, foreground='white')
+		return
+	try:
+		idfs, epws, resumesettings = resumeList(settings['journal'], settings, changed_settings)
+	except (ValueError, IOError, OSError) as e:
+		status6.config(text = 'Error: Cannot resume: ' + str(e), background=color_failed, foreground='white')
+		return
+	startBatch(idfs, epws, status6, True, resumesettings)
+
+# Closing the window cancels any running batch so no simulations are left running in the background
+def close_window():
+	batch_cancel.set()
+	w.destroy()
+
+w.protocol('WM_DELETE_WINDOW', close_window)
+
+batch_statuses = [epml_engine.status_queued, epml_engine.status_running, epml_engine.status_ok, epml_engine.status_failed, epml_engine.status_cancelled, epml_engine.status_cached, epml_engine.status_timeout, epml_engine.status_invalid]
+
+batch_summary = tk.Label(tab6, text = 'No batch running.', background=color_select, foreground='black', height=2)
+status_table = ttk.Treeview(tab6, columns=('sim', 'status', 'rc', 'time'), show='headings')
+status_table.heading('sim', text='Simulation (.idf)')
+status_table.heading('status', text='Status')
+status_table.heading('rc', text='Return code')
+status_table.heading('time', text='Run time (s)')
+status_table.column('sim', width=450)
+status_table.column('status', width=100)
+status_table.column('rc', width=100)
+status_table.column('time', width=100)
+yscrollbar6 = ttk.Scrollbar(tab6, orient=tk.VERTICAL, command=status_table.yview)
+status_table['yscrollcommand'] = yscrollbar6.set
+button_cancel = tk.Button(tab6, text='Cancel Batch', command=cancel_batch, state='disabled')
+button_resume = tk.Button(tab6, text='Resume Last Batch', command=resume_batch)
+status6 = tk.Label(tab6, text = 'Resume runs the unfinished and failed simulations of the last batch again,\neven if MultiLaunch was closed or crashed.', background=color_select, foreground='black',borderwidth=2,height=3)
+
+# Batch Status grid
+tab6.grid_columnconfigure(0,weight=1)
+tab6.grid_rowconfigure(2,weight=1)
+
+batch_summary.grid(column=0,row=1,columnspan=2,sticky='ew')
+status_table.grid(column=0,row=2,sticky='nsew')
+yscrollbar6.grid(column=1,row=2,sticky='ns')
+button_cancel.grid(column=0,row=3,columnspan=2,sticky='e')
+button_resume.grid(column=0,row=3,sticky='w')
+status6.grid(column=0,row=4,columnspan=2,sticky='ew')
 
 
 # 4 - Advanced Settings
-i_seriesparallel_str = 'Run simulations in series or parallel?'
+i_seriesparallel_str = 'Run simulations in series, parallel, or a pool?'
 i_seriesparallel = tk.Label(tab4, text = i_seriesparallel_str)
 
 sp_tk = tk.StringVar()
 rb_series = ttk.Radiobutton(tab4, text='Series', value='series', variable=sp_tk)
 rb_parallel = ttk.Radiobutton(tab4, text='Parallel', value='parallel', variable=sp_tk)
-sp_tk.set(sp)
+rb_pool = ttk.Radiobutton(tab4, text='Pool', value='pool', variable=sp_tk)
+sp_tk.set(settings['sp'])
+
+jobs_label = tk.Label(tab4, text = 'Pool: max simultaneous simulations (0 = number of CPU cores)')
+jobs_tk = tk.StringVar()
+jobs_tk.set(str(settings['jobs']))
+jobs_entry = tk.Entry(tab4, textvariable = jobs_tk)
 
 dtime_tk = tk.StringVar()
-dtime_tk.set(str(dtime))
+dtime_tk.set(str(settings['dtime']))
 dtime_entry = tk.Entry(tab4, textvariable = dtime_tk)
 
-dtime_label = tk.Label(tab4, text = 'Wait time between launches in seconds')
+dtime_label = tk.Label(tab4, text = 'Max wait time for warmup between launches in seconds (0 = no wait)')
 
 ep_dir_label = tk.Label(tab4, text = 'EnergyPlus installation directory')
 ep_dir_tk = tk.StringVar()
-ep_dir_tk.set(ep_dir)
+ep_dir_tk.set(settings['ep_dir'])
 ep_dir_entry = tk.Entry(tab4, textvariable = ep_dir_tk)
 
 uselog_label = tk.Label(tab4, text = 'Output to Log File (epml_out.log) or Console/Terminal/Command Prompt Window')
 uselog_tk = tk.BooleanVar()
 uselog_true = ttk.Radiobutton(tab4, text='Log File', value=True, variable=uselog_tk)
 uselog_false = ttk.Radiobutton(tab4, text='Console (for debugging)', value=False, variable=uselog_tk)
-uselog_tk.set(useLog)
+uselog_tk.set(settings['useLog'])
 
 # Entry won't allow multiline
 '''
@@ -939,7 +941,7 @@ precode_subframe.grid_propagate(False)
 precode_label = tk.Label(tab4, text = 'Preprocessing code to execute before all simulations - Console/Bash code')
 precode_tk = tk.Text(precode_subframe)
 # replace is to convert newline stored as literal string "\n" to an actual new line - see saveSettings function for explanation
-precode_tk.insert(tk.END, ini_to_text(precode))
+precode_tk.insert(tk.END, ini_to_text(settings['precode']))
 precode_ysb = ttk.Scrollbar(precode_subframe,orient=tk.VERTICAL,command=precode_tk.yview)
 precode_tk['yscrollcommand'] = precode_ysb.set
 
@@ -959,7 +961,7 @@ precodepy_subframe.grid_propagate(False)
 precodepy_label = tk.Label(tab4, text = 'Preprocessing code to execute before all simulations - Python code')
 #precodepy_tk = tk.Text(tab4,height=24)
 precodepy_tk = tk.scrolledtext.ScrolledText(precodepy_subframe)
-precodepy_tk.insert(tk.END, ini_to_text(precodepy))
+precodepy_tk.insert(tk.END, ini_to_text(settings['precodepy']))
 precodepy_tk.pack(side='left', fill='both', expand=True)
 #precodepy_tk.grid(column=0,row=1,sticky='nsew')
 
@@ -969,7 +971,7 @@ postcode_label = tk.Label(tab4, text = 'Postprocessing code to execute after all
 #postcode_tk = tk.Text(tab4,height=24)
 postcode_tk = tk.scrolledtext.ScrolledText(postcode_subframe)
 #postcode_tk.insert(tk.END, postcode.replace('\\n','\n'))
-postcode_tk.insert(tk.END, ini_to_text(postcode))
+postcode_tk.insert(tk.END, ini_to_text(settings['postcode']))
 postcode_tk.pack(side='left', fill='both', expand=True)
 
 postcodepy_subframe = tk.Frame(tab4,height=50)
@@ -978,37 +980,40 @@ postcodepy_label = tk.Label(tab4, text = 'Postprocessing code to execute after a
 #postcodepy_tk = tk.Text(tab4,height=24)
 postcodepy_tk = tk.scrolledtext.ScrolledText(postcodepy_subframe)
 #postcodepy_tk.insert(tk.END, postcodepy.replace('\\n','\n'))
-postcodepy_tk.insert(tk.END, ini_to_text(postcodepy))
+postcodepy_tk.insert(tk.END, ini_to_text(settings['postcodepy']))
 postcodepy_tk.pack(side='left', fill='both', expand=True)
 
 # When "Apply Settings" button pushed, get the new settings from the various widgets.
 def getSettings():
+	before = {key: settings[key] for key in epml_engine.journal_settings}
 	# Modifies each of the global variables that correspond to the settings.
-	global sp
-	sp = sp_tk.get()
+	settings['sp'] = sp_tk.get()
+	
+	try:
+		dtime_temp = settings['dtime']
+		settings['dtime'] = int(dtime_tk.get())
+	except (ValueError):
+		settings['dtime'] = dtime_temp
+		dtime_tk.set(str(settings['dtime']))
 	
-	global dtime
 	try:
-		dtime_temp = dtime
-		dtime = int(dtime_tk.get())
+		jobs_temp = settings['jobs']
+		settings['jobs'] = int(jobs_tk.get())
 	except (ValueError):
-		dtime = dtime_temp
-		dtime_tk.set(str(dtime))
+		settings['jobs'] = jobs_temp
+		jobs_tk.set(str(settings['jobs']))
+	
+	settings['ep_dir'] = ep_dir_tk.get()
 	
-	global ep_dir
-	ep_dir = ep_dir_tk.get()
+	settings['useLog'] = uselog_tk.get()
 	
-	global useLog
-	useLog = uselog_tk.get()
+	settings['precode'] = precode_tk.get("1.0", "end-1c")
+	settings['precodepy'] = precodepy_tk.get("1.0", "end-1c")
+	settings['postcode'] = postcode_tk.get("1.0", "end-1c")
+	settings['postcodepy'] = postcodepy_tk.get("1.0", "end-1c")
 	
-	global precode
-	precode = precode_tk.get("1.0", "end-1c")
-	global precodepy
-	precodepy = precodepy_tk.get("1.0", "end-1c")
-	global postcode
-	postcode = postcode_tk.get("1.0", "end-1c")
-	global postcodepy
-	postcodepy = postcodepy_tk.get("1.0", "end-1c")
+	getRunOptions()
+	changed_settings.update(key for key in before if settings[key] != before[key])
 	
 	#Call saveSettings function to save these variables
 	saveSettings()
@@ -1039,6 +1044,9 @@ tab4.grid_rowconfigure(14,weight=1)
 i_seriesparallel.grid(column=0,row=1,sticky='w')
 rb_parallel.grid(column=1,row=1,sticky='ew')
 rb_series.grid(column=2,row=1,sticky='ew')
+rb_pool.grid(column=1,row=2,sticky='ew')
+jobs_label.grid(column=0,row=2,sticky='w')
+jobs_entry.grid(column=2,row=2,sticky='ew')
 dtime_label.grid(column=0,row=3,sticky='w')
 dtime_entry.grid(column=1,row=3,columnspan=2,sticky='ew')
 ep_dir_label.grid(column=0,row=4,sticky='w')
@@ -1068,6 +1076,123 @@ postcodepy_tk.grid(column=0,row=14,rowspan=2,columnspan=3,sticky='ew')
 button_save_settings.grid(column=2,row=16,sticky='ew')
 
 
+# Run Options ========================================================================================
+# Settings for how the engine runs each simulation. One row per setting: a label and an entry (or checkbox).
+# To add a setting, add it to setting_fields in epml_engine.py and call addRunOption() below.
+
+# settings key -> [tk variable, type] for every row in this tab
+run_option_vars = {}
+
+# There are more rows than fit in the window, so they go in a frame on a canvas with a scrollbar; the Apply button stays
+# below the canvas where it can always be reached
+run_options_canvas = tk.Canvas(tab7, highlightthickness=0)
+run_options_scrollbar = ttk.Scrollbar(tab7, orient=tk.VERTICAL, command=run_options_canvas.yview)
+run_options_canvas.configure(yscrollcommand=run_options_scrollbar.set)
+run_options_frame = ttk.Frame(run_options_canvas)
+run_options_window = run_options_canvas.create_window((0, 0), window=run_options_frame, anchor='nw')
+# Scroll over the whole frame, and stretch the frame to the width of the canvas
+run_options_frame.bind('<Configure>', lambda event: run_options_canvas.configure(scrollregion=run_options_canvas.bbox('all')))
+run_options_canvas.bind('<Configure>', lambda event: run_options_canvas.itemconfigure(run_options_window, width=event.width))
+
+# Scroll the Run Options with the mouse wheel while the mouse is over them (the canvas or any row on it)
+# Windows and macOS send <MouseWheel> with delta, X11 sends button 4 (up) and 5 (down)
+def scrollRunOptions(event):
+	if not str(event.widget).startswith(str(run_options_canvas)):
+		return
+	if event.num == 4 or getattr(event, 'delta', 0) > 0:
+		run_options_canvas.yview_scroll(-1, 'units')
+	elif event.num == 5 or getattr(event, 'delta', 0) < 0:
+		run_options_canvas.yview_scroll(1, 'units')
+
+for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+	w.bind_all(sequence, scrollRunOptions, add='+')
+
+# Add a row to the Run Options tab
+# Input:
+#	key = settings dictionary key
+#	text = label shown to the user
+#	kind = 'int', 'float', 'str', or 'bool'
+def addRunOption(key, text, kind='int'):
+	row = len(run_option_vars) + 1
+	label = tk.Label(run_options_frame, text = text)
+	if kind == 'bool':
+		var = tk.BooleanVar()
+		entry = ttk.Checkbutton(run_options_frame, variable = var)
+	else:
+		var = tk.StringVar()
+		entry = tk.Entry(run_options_frame, textvariable = var)
+	var.set(settings[key])
+	label.grid(column=0,row=row,sticky='w')
+	entry.grid(column=1,row=row,sticky='ew')
+	run_option_vars[key] = [var, kind]
+
+# Copy the Run Options entries into settings. Invalid numbers are reset to the previous value.
+def getRunOptions():
+	for key in run_option_vars:
+		var, kind = run_option_vars[key]
+		try:
+			if kind == 'int':
+				settings[key] = int(var.get())
+			elif kind == 'float':
+				settings[key] = float(var.get())
+			else:
+				settings[key] = var.get()
+		except (ValueError, tk.TclError):
+			var.set(settings[key])
+
+addRunOption('retries', 'Parallel/pool: times to rerun after a warmup convergence error')
+addRunOption('backoff', 'Seconds to wait before rerunning after a warmup convergence error')
+addRunOption('retries_input', 'Times to rerun after another input (.idf) error')
+addRunOption('backoff_input', 'Seconds to wait before rerunning after an input error')
+addRunOption('retries_infra', 'Times to rerun if EnergyPlus could not run or crashed')
+addRunOption('backoff_infra', 'Seconds to wait before rerunning if EnergyPlus could not run or crashed')
+addRunOption('timeout_min', 'Minutes before a running simulation is killed (0 = no limit)')
+addRunOption('stall_min', 'Minutes without new output before a simulation is killed as stuck (0 = off)')
+addRunOption('retries_timeout', 'Times to rerun a simulation that was killed for time')
+addRunOption('backoff_timeout', 'Seconds to wait before rerunning a simulation that was killed for time')
+addRunOption('max_load', 'Hold launches while CPU load per core is over this % (0 = off)')
+addRunOption('min_free_mem_mb', 'Hold launches unless this much memory (MB) stays free')
+addRunOption('min_free_disk_mb', 'Hold launches while the output drive has less free space (MB)')
+addRunOption('history_file', 'Run history file: run time and memory of past simulations (blank = none)', 'str')
+addRunOption('longest_first', 'Pool: start the simulations that took longest last time first', 'bool')
+addRunOption('failsafe', 'Parallel/pool: failsafe .idf to run if it still fails (blank = none)', 'str')
+addRunOption('log_max_kb', 'Max size of each simulation\'s console log in kB (0 = no limit)')
+addRunOption('log_backups', 'Number of old console logs to keep when the limit is reached')
+addRunOption('use_cache', 'Series/pool: reuse results of simulations whose inputs have not changed', 'bool')
+addRunOption('cache_dir', 'Result cache folder', 'str')
+addRunOption('cache_max_mb', 'Max size of the result cache in MB (0 = no limit)')
+addRunOption('validate', 'Check .idf files before the batch and skip ones that cannot run', 'bool')
+addRunOption('folder_index', 'Autodetect: folder index file, for faster searches of large folders (blank = none)', 'str')
+addRunOption('folder_include', 'Autodetect: only run .idf files matching these patterns, separated by ; (blank = all)', 'str')
+addRunOption('folder_exclude', 'Autodetect: skip files and folders matching these patterns, separated by ;', 'str')
+addRunOption('aggregate', 'After a batch, combine eplusout.csv/eplusmtr.csv of successful simulations into one results store', 'bool')
+addRunOption('results_store', 'Results store folder', 'str')
+addRunOption('results_columns', 'Results store: only keep columns matching these patterns, separated by ; (blank = all)', 'str')
+addRunOption('readvars', 'Convert outputs to CSV with ReadVarsESO (off = read eplusout.sql, needs Output:SQLite)', 'bool')
+addRunOption('retention', 'Clean up the output folder of each successful simulation as soon as it finishes', 'bool')
+addRunOption('retention_keep', 'Clean up: keep these outputs, separated by ;', 'str')
+addRunOption('retention_compress', 'Clean up: gzip compress these outputs, separated by ; (all others are deleted)', 'str')
+addRunOption('scratch_dir', 'Local scratch folder to run simulations in, then move outputs to their folder (blank = none)', 'str')
+addRunOption('writeback_jobs', 'Scratch: most output folders moved back at once')
+addRunOption('stage_dir', 'Local folder to copy each unique .epw and Schedule:File file into before running (blank = none)', 'str')
+addRunOption('stage_max_mb', 'Max size of the stage folder in MB (0 = no limit)')
+addRunOption('sim_hook', 'Shell command run on each simulation as soon as it succeeds, e.g. python summary.py {outdir} (blank = none)', 'str')
+addRunOption('sim_hook_python', 'Python function run on each simulation as soon as it succeeds, module:function or file.py:function (blank = none)', 'str')
+addRunOption('sim_hook_jobs', 'Max postprocessing hooks running at once')
+addRunOption('code_timeout_min', 'Minutes before pre/postprocessing code still running is killed (0 = no limit)')
+addRunOption('journal', 'Batch journal file, for resuming the last batch (blank = none)', 'str')
+
+button_save_options = tk.Button(tab7, text = 'Apply', command = getSettings)
+
+run_options_frame.grid_columnconfigure(0,weight=1)
+run_options_frame.grid_columnconfigure(1,weight=1)
+tab7.grid_columnconfigure(0,weight=1)
+tab7.grid_rowconfigure(0,weight=1)
+run_options_canvas.grid(column=0,row=0,sticky='nsew')
+run_options_scrollbar.grid(column=1,row=0,sticky='ns')
+button_save_options.grid(column=0,row=1,columnspan=2,sticky='e')
+
+
 # 5 - About
 i_about_title = tk.Label(tab5, text = 'EnergyPlus MultiLaunch',font=('Arial',18,'bold'))
 i_about_str = '\nSuperlauncher for running many EnergyPlus simulations in series or parallel.\n\nVersion: 0.50   Updated: 2023-06-05\n\nLicensed under the GNU General Public License v3\nCreated by Brian Woo-Shem\nSanta Clara University, School of Engineering, Department of Mechanical Engineering\n'
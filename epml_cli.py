@@ -0,0 +1,345 @@
+# epml_cli.py
+# EnergyPlus MultiLaunch Command Line Interface
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Runs batches without the GUI, for cron, SLURM, headless Linux machines, etc.
+# Usage:
+#	python -m epml run --queue q.csv --mode parallel --jobs 8
+#	python -m epml run --folder Z:/EnergyPlus/batch1 --mode pool
+#	python -m epml run --idf a.idf b.idf --epw weather.epw --mode series
+#	python -m epml resume
+#	python -m epml aggregate --queue q.csv --columns "*Drybulb*"      (see epml_results.py)
+#	python -m epml query --queue q.csv --columns "*Drybulb*" --out drybulb.csv      (reads eplusout.sql files)
+#	python -m epml sweep model_sweep.json --mode pool --jobs 8      (see epml_sweep.py)
+#	python -m epml serve --queue q.csv --host 0.0.0.0 --port 8765      (see epml_cluster.py)
+#	python -m epml worker --coordinator http://coordinator-host:8765 --slots 8
+# Exit code is 0 if every simulation succeeded, 1 if any failed, 2 if the batch could not be started.
+
+
+# Import
+import argparse
+import sys
+import os
+import subprocess
+import csv
+import epml_engine
+import epml_cluster
+import epml_results
+import epml_sweep
+
+
+# Build the command line argument parser
+def buildParser():
+	parser = argparse.ArgumentParser(prog='python -m epml', description='EnergyPlus MultiLaunch: run many EnergyPlus simulations in series, parallel, or a pool. Run without arguments to open the GUI.')
+	subparsers = parser.add_subparsers(dest='command')
+	
+	run = subparsers.add_parser('run', help='Run a batch of simulations')
+	addSourceArgs(run)
+	addSettingsArgs(run)
+	run.set_defaults(func=cmd_run)
+	
+	resume = subparsers.add_parser('resume', help='Run the unfinished and failed simulations of the last batch again')
+	resume.add_argument('--journal', help='Batch journal to resume (default: journal_file from settings)')
+	addSettingsArgs(resume)
+	resume.set_defaults(func=cmd_resume)
+	
+	serve = subparsers.add_parser('serve', help='Coordinate a batch run by worker agents on other computers')
+	addSourceArgs(serve)
+	serve.add_argument('--host', default='127.0.0.1', help='Address to listen on, 0.0.0.0 for all networks (default: %(default)s)')
+	serve.add_argument('--port', type=int, default=8765, help='Port to listen on (default: %(default)s)')
+	serve.add_argument('--token', default=os.environ.get('EPML_TOKEN', ''), help='Shared token workers must send (default: EPML_TOKEN environment variable)')
+	serve.add_argument('--local-workers', type=int, default=0, help='Also start this many workers on this computer, for testing')
+	serve.add_argument('--slots', type=int, default=1, help='Slots of each local worker (default: %(default)s)')
+	addSettingsArgs(serve)
+	serve.set_defaults(func=cmd_serve)
+	
+	aggregate = subparsers.add_parser('aggregate', help='Combine the outputs of a batch that already ran into the results store')
+	addSourceArgs(aggregate)
+	aggregate.add_argument('--store', help='Store folder (default: results_store from settings)')
+	aggregate.add_argument('--columns', help='";" separated glob patterns of columns to keep (default: results_columns from settings)')
+	addSettingsArgs(aggregate)
+	aggregate.set_defaults(func=cmd_aggregate)
+	
+	query = subparsers.add_parser('query', help='Read columns from the eplusout.sql files of a batch that already ran')
+	addSourceArgs(query)
+	query.add_argument('--columns', required=True, help='";" separated glob patterns of columns to read, e.g. "*Drybulb*;Electricity:Facility*"')
+	query.add_argument('--out', required=True, help='CSV file to write, one row per value: Filepath, Column, Date/Time, Value')
+	addSettingsArgs(query)
+	query.set_defaults(func=cmd_query)
+	
+	sweep = subparsers.add_parser('sweep', help='Run a parametric sweep of a template .idf (see epml_sweep.py)')
+	sweep.add_argument('sweepfile', help='Sweep .json file with the template, weather file, and parameters')
+	addSettingsArgs(sweep)
+	sweep.set_defaults(func=cmd_sweep)
+	
+	worker = subparsers.add_parser('worker', help='Run simulations for a coordinator started with serve')
+	worker.add_argument('--coordinator', required=True, help='Coordinator address, e.g. http://host:8765')
+	worker.add_argument('--slots', type=int, help='Most simulations run at once on this computer (default: jobs setting, 0 = number of CPU cores)')
+	worker.add_argument('--name', help='Name shown by the coordinator (default: host:process id)')
+	worker.add_argument('--token', default=os.environ.get('EPML_TOKEN', ''), help='Shared token of the coordinator (default: EPML_TOKEN environment variable)')
+	addSettingsArgs(worker)
+	worker.set_defaults(func=cmd_worker)
+	
+	return parser
+
+# Same three ways of selecting simulations as the GUI tabs
+def addSourceArgs(p):
+	source = p.add_mutually_exclusive_group(required=True)
+	source.add_argument('--queue', help='Queue .csv file with Filepath and Weather columns')
+	source.add_argument('--folder', help='Run every .idf file in this folder and its subfolders')
+	source.add_argument('--idf', nargs='+', help='One or more .idf files to run with --epw')
+	p.add_argument('--epw', help='Weather file for --idf, or to replace the ones detected by --folder')
+	p.add_argument('--include', help='--folder: ";" separated glob patterns of .idf files to run (default: folder_include from settings)')
+	p.add_argument('--exclude', help='--folder: ";" separated glob patterns of files and folders to skip (default: folder_exclude from settings)')
+
+# Arguments that override values from the settings .ini file
+def addSettingsArgs(p):
+	p.add_argument('--settings', default=epml_engine.setfile, help='Settings .ini file (default: %(default)s)')
+	p.add_argument('--mode', choices=['series', 'parallel', 'pool'], help='Series, parallel, or pool (default: from settings)')
+	p.add_argument('--jobs', type=int, help='Max simultaneous simulations for pool mode, 0 = number of CPU cores')
+	p.add_argument('--dtime', type=int, help='Max wait time for warmup between launches in seconds, 0 = no wait')
+	p.add_argument('--ep-dir', help='EnergyPlus executable')
+	p.add_argument('--no-prepost', action='store_true', help='Do not run the preprocessing and postprocessing code from settings')
+	p.add_argument('--no-cache', action='store_true', help='Run every simulation even if a cached result exists')
+	p.add_argument('--no-readvars', action='store_true', help='Do not convert outputs to CSV with ReadVarsESO; results are read from eplusout.sql')
+
+# Load settings from the .ini file and apply any command line overrides
+# Returns: settings dictionary
+def getSettings(args):
+	settings = epml_engine.loadSettings(args.settings)
+	if args.mode is not None:
+		settings['sp'] = args.mode
+	if args.jobs is not None:
+		settings['jobs'] = args.jobs
+	if args.dtime is not None:
+		settings['dtime'] = args.dtime
+	if args.ep_dir is not None:
+		settings['ep_dir'] = args.ep_dir
+	if args.no_cache:
+		settings['use_cache'] = False
+	if args.no_readvars:
+		settings['readvars'] = False
+	return settings
+
+# Get the simulations to run from the --queue, --folder, or --idf arguments
+# Returns: [list of .idf paths, list of .epw paths]
+# Raises ValueError if nothing can be run
+def getBatch(args, settings):
+	if args.queue is not None:
+		idfs, epws = epml_engine.readQueue(args.queue)
+	elif args.folder is not None:
+		if args.include is not None:
+			settings['folder_include'] = args.include
+		if args.exclude is not None:
+			settings['folder_exclude'] = args.exclude
+		idfs, epws = epml_engine.searchfolder(args.folder, settings)
+		if args.epw is not None:
+			epws = [args.epw] * len(idfs)
+		if '' in epws:
+			raise ValueError('No .epw file found for ' + str(epws.count('')) + ' .idf files in ' + args.folder)
+	else:
+		if args.epw is None:
+			raise ValueError('--idf requires --epw')
+		idfs = args.idf
+		epws = [args.epw] * len(idfs)
+	if len(idfs) < 1:
+		raise ValueError('No .idf files to run')
+	return [idfs, epws]
+
+# Get the batch from the arguments, printing any error
+# Returns: [list of .idf paths, list of .epw paths], or None if nothing can be run
+def getBatchOrError(args, settings):
+	try:
+		return getBatch(args, settings)
+	except (KeyError) as e:
+		print('ERROR: Invalid queue file, missing column ', e, file=sys.stderr)
+	except (ValueError, IOError, OSError) as e:
+		print('ERROR: ', e, file=sys.stderr)
+	return None
+
+# "run" command
+def cmd_run(args):
+	settings = getSettings(args)
+	batch = getBatchOrError(args, settings)
+	if batch is None:
+		return 2
+	idfs, epws = batch
+	journal = epml_engine.BatchJournal(settings['journal'], idfs, epws, settings=settings)
+	return runBatch(args, settings, idfs, epws, journal)
+
+# "resume" command
+def cmd_resume(args):
+	settings = getSettings(args)
+	path = settings['journal']
+	if args.journal is not None:
+		path = args.journal
+	if len(path) == 0:
+		print('ERROR: No batch journal set in settings', file=sys.stderr)
+		return 2
+	try:
+		# Settings given on the command line are used instead of the batch's
+		explicit = [key for key, given in [('sp', args.mode is not None), ('readvars', args.no_readvars)] if given]
+		idfs, epws, settings = epml_engine.resumeList(path, settings, explicit)
+	except (ValueError, IOError, OSError) as e:
+		print('ERROR: Cannot resume: ', e, file=sys.stderr)
+		return 2
+	journal = epml_engine.BatchJournal(path, events=None)
+	return runBatch(args, settings, idfs, epws, journal)
+
+# "sweep" command. Sweeps are not journaled: their variants are deleted as they finish, so there is nothing to resume.
+def cmd_sweep(args):
+	settings = getSettings(args)
+	try:
+		sweep = epml_sweep.Sweep(args.sweepfile)
+	except (KeyError) as e:
+		print('ERROR: Invalid sweep file, missing ', e, file=sys.stderr)
+		return 2
+	except (ValueError, TypeError, IOError, OSError) as e:
+		print('ERROR: Invalid sweep file: ', e, file=sys.stderr)
+		return 2
+	problems = sweep.check(settings)
+	if len(problems) > 0:
+		print('ERROR: Not running sweep: ', '; '.join(problems), file=sys.stderr)
+		return 2
+	sweep.writeTable()
+	print('Sweep of ', sweep.count, ' ', sweep.method, ' points in ', sweep.folder)
+	idfs, epws = sweep.batch()
+	return runBatch(args, settings, idfs, epws, epml_engine.BatchJournal(''), sweep)
+
+# Run a batch with pre/postprocessing, recording progress in the journal
+# Input: sweep = epml_sweep.Sweep if the batch is its variants, else None
+# Returns: exit code
+def runBatch(args, settings, idfs, epws, journal, sweep=None):
+	if not args.no_prepost and not epml_engine.runBefore(settings):
+		journal.close()
+		print('Error: Preprocessing failed, not running the simulations.', file=sys.stderr)
+		return 1
+	try:
+		worked = epml_engine.run_ep(idfs, epws, settings, journal, sweep=sweep)
+	finally:
+		journal.close()
+	if not worked:
+		print('Error: Simulations Failed! Please check log and .err files.', file=sys.stderr)
+		return 1
+	if not args.no_prepost and not epml_engine.runAfter(settings):
+		print('Error: Postprocessing failed! Please check the log.', file=sys.stderr)
+		return 1
+	print('Simulations Completed Successfully!')
+	return 0
+
+# "serve" command: hand the batch out to workers, with the journal and pre/postprocessing of a normal run
+def cmd_serve(args):
+	settings = getSettings(args)
+	batch = getBatchOrError(args, settings)
+	if batch is None:
+		return 2
+	idfs, epws = batch
+	# Before the server starts, so no worker picks up a job before preprocessing is done
+	if not args.no_prepost and not epml_engine.runBefore(settings):
+		print('Error: Preprocessing failed, not running the simulations.', file=sys.stderr)
+		return 1
+	journal = epml_engine.BatchJournal(settings['journal'], idfs, epws, settings=settings)
+	try:
+		coordinator = epml_cluster.Coordinator(idfs, epws, journal, epml_engine.checkInputs(idfs, epws, settings))
+		server = epml_cluster.startServer(coordinator, args.host, args.port, args.token)
+	except (OSError) as e:
+		journal.close()
+		print('ERROR: Cannot listen on ', args.host, ':', args.port, ': ', e, file=sys.stderr)
+		return 2
+	
+	workers = []
+	if args.local_workers > 0:
+		url = 'http://127.0.0.1:' + str(server.server_address[1])
+		env = dict(os.environ, EPML_TOKEN=args.token)
+		for n in range(args.local_workers):
+			workers.append(subprocess.Popen(epml_cluster.localWorkerCmd(url, args.slots, args.settings, args.ep_dir, n + 1), env=env))
+	
+	try:
+		worked = epml_cluster.run_ep_coordinator(server, workerprocs=workers)
+	finally:
+		journal.close()
+		for p in workers:
+			p.wait()
+	if settings['aggregate'] and not coordinator.cancelled:
+		epml_engine.aggregateResults([idfs[i] for i in sorted(coordinator.results) if coordinator.results[i][0] == epml_engine.status_ok], settings)
+	if not worked:
+		print('Error: Simulations Failed! Please check log and .err files.', file=sys.stderr)
+		return 1
+	if not args.no_prepost and not epml_engine.runAfter(settings):
+		print('Error: Postprocessing failed! Please check the log.', file=sys.stderr)
+		return 1
+	print('Simulations Completed Successfully!')
+	return 0
+
+# "aggregate" command: combine outputs without running anything; failed simulations are skipped by epml_results.py
+def cmd_aggregate(args):
+	settings = getSettings(args)
+	if args.store is not None:
+		settings['results_store'] = args.store
+	if args.columns is not None:
+		settings['results_columns'] = args.columns
+	batch = getBatchOrError(args, settings)
+	if batch is None:
+		return 2
+	if not epml_engine.aggregateResults(batch[0], settings):
+		return 1
+	return 0
+
+# "query" command: read columns from eplusout.sql of each simulation and write them to one CSV file
+def cmd_query(args):
+	settings = getSettings(args)
+	batch = getBatchOrError(args, settings)
+	if batch is None:
+		return 2
+	outdirs = []
+	seen = set()
+	for sim in batch[0]:
+		outdir = epml_engine.remExt(sim, '.idf')
+		if outdir not in seen:
+			seen.add(outdir)
+			outdirs.append(outdir)
+	patterns = [p.strip() for p in args.columns.split(';') if len(p.strip()) > 0]
+	results = epml_results.querySims(outdirs, patterns, epml_engine.getMaxJobs(settings['jobs']))
+	missing = 0
+	with open(args.out, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['Filepath', 'Column', 'Date/Time', 'Value'])
+		for outdir, found in zip(outdirs, results):
+			if found is None:
+				print('WARNING: No readable ', epml_results.sql_file, ' in ', outdir, file=sys.stderr)
+				missing = missing + 1
+				continue
+			for column in found:
+				times, values = found[column]
+				for t, v in zip(times, values):
+					writer.writerow([outdir, column, t, v])
+	print('Read ', len(outdirs) - missing, ' of ', len(outdirs), ' simulations into ', args.out)
+	if missing > 0:
+		return 1
+	return 0
+
+# "worker" command
+def cmd_worker(args):
+	settings = getSettings(args)
+	slots = args.slots
+	if slots is None:
+		slots = epml_engine.getMaxJobs(settings['jobs'])
+	if epml_cluster.runWorker(args.coordinator, max(1, slots), settings, args.name, args.token):
+		return 0
+	return 2
+
+# Entry point
+# Input: argv = list of command line arguments, not including the program name
+# Returns: exit code
+def main(argv=None):
+	parser = buildParser()
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 2
+	return args.func(args)
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,416 @@
+# epml_cluster.py
+# EnergyPlus MultiLaunch Coordinator & Worker
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Runs one batch across several computers. The coordinator holds the queue (same Filepath/Weather model as a queue .csv)
+# and worker agents on each host ask it for jobs, run EnergyPlus, and report the exit status and run time back.
+# Each worker runs up to its own number of slots at once. All hosts must see the .idf, .epw, and output folders at the
+# same paths (shared drive / NFS); only the job list and results go over the network.
+# Usage:
+#	python -m epml serve --queue q.csv --host 0.0.0.0 --port 8765
+#	python -m epml worker --coordinator http://coordinator-host:8765 --slots 8
+#	python -m epml serve --queue q.csv --local-workers 3 --slots 2     (test on one computer)
+#
+# Protocol: workers POST a JSON message to /poll on the coordinator every pool_poll_time seconds:
+#	{"worker": name, "free": number of jobs wanted, "finished": [{"id", "status", "rc", "started", "finished"}, ...]}
+#	where status is ok, failed, or timeout. With postprocessing hooks, a successful simulation is only reported once its
+#	hooks are done, with "hook": true or false; a simulation whose hooks failed is reported as failed.
+# and get back:
+#	{"jobs": [{"id", "idf", "epw", "outdir"}, ...], "done": true when the batch is finished, "cancel": true to stop}
+# The poll is also the worker's heartbeat: jobs of a worker not heard from for worker_timeout seconds are queued again.
+
+
+# Import
+import time
+import os
+import sys
+import json
+import hmac
+import socket
+import threading
+import urllib.request
+import urllib.error
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from epml_engine import SimRun, nextStep, paceReady, killProcess, report, cancelled, pool_poll_time, remExt, Admission, RunHistory, startRetention, startWriteBack, startStage, startHooks
+from epml_engine import status_queued, status_running, status_ok, status_failed, status_cancelled, status_timeout, status_invalid
+
+
+# Seconds without a poll before a worker is considered lost and its jobs are given to other workers
+worker_timeout = 60
+# Seconds to wait for a network request to the coordinator
+request_timeout = 10
+# Header with the shared token, if one is set. The token is read from --token or the EPML_TOKEN environment variable.
+token_header = 'X-EPML-Token'
+
+
+# Coordinator ================================================================================================
+
+# Holds the batch and hands out jobs to workers. Called from the HTTP server's threads, so every method takes the lock.
+class Coordinator:
+	# Input:
+	#	sims2run and wfiles are lists of strings, blank entries are skipped
+	#	events = optional queue.Queue (or BatchJournal) that receives progress events, as for run_ep()
+	#	invalid = indexes that failed the input checks (epml_engine.checkInputs()); they are never handed out
+	def __init__(self, sims2run, wfiles, events=None, invalid=()):
+		self.lock = threading.Lock()
+		self.sims2run = sims2run
+		self.wfiles = wfiles
+		self.events = events
+		self.pending = deque(i for i in range(len(sims2run)) if not len(sims2run[i]) == 0)
+		self.total = len(self.pending)
+		for i in self.pending:
+			report(events, i, sims2run[i], status_queued)
+		# index -> worker running it
+		self.assigned = {}
+		# index -> [status, rc, worker, run time]
+		self.results = {}
+		for i in invalid:
+			self.pending.remove(i)
+			self.results[i] = [status_invalid, None, None, 0.0]
+			report(events, i, sims2run[i], status_invalid)
+		# worker -> time of last poll
+		self.seen = {}
+		# Workers that have been told the batch is over
+		self.released = set()
+		self.cancelled = False
+
+	# Handle one poll from a worker
+	# Input: msg = dictionary decoded from the worker's JSON
+	# Returns: dictionary to send back
+	def poll(self, msg):
+		worker = str(msg['worker'])
+		with self.lock:
+			self.seen[worker] = time.time()
+			for f in msg.get('finished', []):
+				self.finish(worker, f)
+			jobs = []
+			if not self.cancelled:
+				for n in range(max(0, int(msg.get('free', 0)))):
+					if len(self.pending) == 0:
+						break
+					i = self.pending.popleft()
+					self.assigned[i] = worker
+					jobs.append({'id': i, 'idf': self.sims2run[i], 'epw': self.wfiles[i], 'outdir': remExt(self.sims2run[i], '.idf')})
+					report(self.events, i, self.sims2run[i], status_running)
+			reply = {'jobs': jobs, 'done': self.isDone(), 'cancel': self.cancelled}
+			if reply['done'] or reply['cancel']:
+				self.released.add(worker)
+			return reply
+
+	# Record a finished job. Only called with the lock held.
+	def finish(self, worker, f):
+		i = int(f['id'])
+		if i in self.results:
+			return
+		if self.assigned.get(i) == worker:
+			del self.assigned[i]
+		elif i in self.pending:
+			# Late report from a worker that was thought lost, and the job has not been given to anyone else yet
+			self.pending.remove(i)
+		else:
+			# Job was given to another worker after this one was lost; use that worker's result
+			return
+		status = f['status']
+		if status not in [status_ok, status_timeout]:
+			status = status_failed
+		if f.get('hook') is False:
+			print('ERROR: Postprocessing hook failed for ', self.sims2run[i], ' on ', worker)
+			status = status_failed
+		runtime = float(f['finished']) - float(f['started'])
+		self.results[i] = [status, f['rc'], worker, runtime]
+		print(self.sims2run[i], ' on ', worker, ' returned: ', f['rc'], ' in ', round(runtime), ' s')
+		report(self.events, i, self.sims2run[i], status, f['rc'])
+
+	# Queue the jobs of lost workers again
+	def expire(self):
+		with self.lock:
+			now = time.time()
+			for worker in list(self.seen):
+				if now - self.seen[worker] < worker_timeout:
+					continue
+				lost = [i for i in self.assigned if self.assigned[i] == worker]
+				if len(lost) > 0:
+					print('WARNING: Lost contact with worker ', worker, ', queueing its ', len(lost), ' simulations again')
+				for i in reversed(lost):
+					del self.assigned[i]
+					self.pending.appendleft(i)
+					report(self.events, i, self.sims2run[i], status_queued)
+				del self.seen[worker]
+
+	# Stop handing out jobs; workers kill their running simulations on their next poll
+	def cancel(self):
+		with self.lock:
+			self.cancelled = True
+			for i in list(self.assigned) + list(self.pending):
+				report(self.events, i, self.sims2run[i], status_cancelled)
+			self.assigned.clear()
+			self.pending.clear()
+
+	def isDone(self):
+		return len(self.results) == self.total
+
+	# Returns: True if every job succeeded
+	def worked(self):
+		return not self.cancelled and self.isDone() and all(r[0] == status_ok for r in self.results.values())
+
+	# Print how many simulations each worker ran and for how long
+	def printSummary(self):
+		workers = {}
+		for status, rc, worker, runtime in self.results.values():
+			if worker is None:
+				continue
+			w = workers.setdefault(worker, [0, 0, 0.0])
+			w[0] = w[0] + 1
+			w[1] = w[1] + (status != status_ok)
+			w[2] = w[2] + runtime
+		for worker in sorted(workers):
+			print(worker, ': ', workers[worker][0], ' simulations, ', workers[worker][1], ' failed, ', round(workers[worker][2]), ' s total')
+		ok = sum(1 for r in self.results.values() if r[0] == status_ok)
+		print("Done running simulations! ", ok, " of ", self.total, " succeeded.\n")
+
+# HTTP handler for the coordinator. The Coordinator and token are attributes of the server.
+class CoordinatorHandler(BaseHTTPRequestHandler):
+	def do_POST(self):
+		token = self.server.token
+		if len(token) > 0 and not hmac.compare_digest(self.headers.get(token_header, ''), token):
+			self.send_error(403)
+			return
+		if self.path != '/poll':
+			self.send_error(404)
+			return
+		try:
+			msg = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+			reply = self.server.coordinator.poll(msg)
+		except (ValueError, KeyError, TypeError) as e:
+			self.send_error(400, str(e))
+			return
+		body = json.dumps(reply).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	# Polls are too frequent to print
+	def log_message(self, format, *args):
+		pass
+
+# Start the coordinator's HTTP server in the background
+# Input: coordinator = Coordinator, host, port = address to listen on (port 0 = any free port), token = shared token
+# Returns: ThreadingHTTPServer; server.server_address has the actual port
+def startServer(coordinator, host, port, token=''):
+	server = ThreadingHTTPServer((host, port), CoordinatorHandler)
+	server.daemon_threads = True
+	server.coordinator = coordinator
+	server.token = token
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+# Run a batch on remote workers
+# Input:
+#	sims2run and wfiles are lists of strings
+#	server = HTTP server from startServer(), already listening
+#	cancel = optional threading.Event, set it to cancel the batch
+#	workerprocs = optional list of local worker subprocesses; the batch fails if they all exit before it is done
+# Returns: True if all simulations succeeded, else False
+def run_ep_coordinator(server, cancel=None, workerprocs=None):
+	coord = server.coordinator
+	print('Queued ', coord.total, ' E+ sims for workers at http://', server.server_address[0], ':', server.server_address[1], sep='')
+	while not coord.isDone():
+		if cancelled(cancel):
+			print('Batch cancelled!')
+			coord.cancel()
+			break
+		if workerprocs is not None and len(workerprocs) > 0 and all(p.poll() is not None for p in workerprocs):
+			print('ERROR: All local workers stopped before the batch finished')
+			coord.cancel()
+			break
+		coord.expire()
+		time.sleep(pool_poll_time)
+
+	# Give every worker that is still polling a chance to hear the batch is over
+	stop = time.time() + worker_timeout
+	while time.time() < stop and len(set(coord.seen) - coord.released) > 0:
+		time.sleep(pool_poll_time)
+	server.shutdown()
+	coord.printSummary()
+	return coord.worked()
+
+
+# Worker =====================================================================================================
+
+# Send a poll to the coordinator
+# Returns: reply dictionary
+# Raises OSError (including urllib errors) or ValueError if the coordinator cannot be reached or replies with garbage
+def sendPoll(url, msg, token=''):
+	req = urllib.request.Request(url.rstrip('/') + '/poll', data=json.dumps(msg).encode('utf-8'), headers={'Content-Type': 'application/json'})
+	if len(token) > 0:
+		req.add_header(token_header, token)
+	with urllib.request.urlopen(req, timeout=request_timeout) as resp:
+		return json.loads(resp.read())
+
+# Run jobs from a coordinator until it says the batch is done
+# Uses the same reruns, failsafe, console logs, and warmup pacing as pool mode, from this host's settings.
+# Input:
+#	url = coordinator address, e.g. http://host:8765
+#	slots = most simulations run at once on this host
+#	settings = settings dictionary from loadSettings()
+#	name = worker name shown by the coordinator, default host:pid
+#	token = shared token, if the coordinator was started with one
+# Returns: True if the batch finished, False if cancelled or the coordinator was lost
+def runWorker(url, slots, settings, name=None, token=''):
+	if name is None:
+		name = socket.gethostname() + ':' + str(os.getpid())
+	print('Worker ', name, ' running up to ', slots, ' simulations from ', url)
+	running = []
+	# Reruns waiting for their backoff time
+	waiting = []
+	# Reports not yet delivered to the coordinator
+	outbox = []
+	watch = None
+	lostsince = None
+	# Same admission checks as the supervisor; jobs are not known before they are claimed, so no history is used
+	admission = Admission(settings, RunHistory(''))
+	lastoutdir = '.'
+	# Output retention of this worker's simulations, so they are cleaned up on the computer that ran them
+	retention = startRetention(settings)
+	# With a scratch folder, results are reported once they are written back to the output folder
+	writeback = startWriteBack(settings, retention)
+	# Inputs staged on this computer, kept for every job of the batch
+	stage = startStage(settings)
+	# Postprocessing hooks run on the computer that ran the simulation
+	try:
+		hooks = startHooks(settings)
+	except Exception as e:
+		print('ERROR: Cannot load postprocessing hook ', settings['sim_hook_python'], ': ', e)
+		stopWorker(writeback, retention, stage, None)
+		return False
+
+	while True:
+		# Collect finished simulations; reruns keep their slot while they wait for their backoff time
+		for r in running[:]:
+			rc = r.proc.poll()
+			if rc is None:
+				r.checkMemory()
+				r.timedout = r.overdue(settings)
+				if len(r.timedout) == 0:
+					continue
+				print('ERROR: ', r.sim, ' ', r.timedout, ', killing it')
+				killProcess(r.proc)
+				rc = r.proc.returncode
+			r.simlog.close()
+			running.remove(r)
+			r.returncode = rc
+			if not r.failsafe_next:
+				r.simreturncode = rc
+			step = nextStep(r, settings)
+			if step == 'retry' or step == 'failsafe':
+				r.failsafe_next = step == 'failsafe'
+				waiting.append(r)
+				continue
+			print(r.sim, ' returned: ', r.simreturncode)
+			if writeback is not None:
+				writeback.submit(r, step)
+				continue
+			# Reported once its hooks are done
+			if step == status_ok and hooks is not None:
+				hooks.submit(r, retention, True)
+				continue
+			if step == status_ok and retention is not None:
+				retention.submit([r.outdir])
+			outbox.append({'id': r.i, 'status': step, 'rc': r.simreturncode, 'started': r.started, 'finished': time.time()})
+		if writeback is not None:
+			for r, step in writeback.collect():
+				if step == status_ok and hooks is not None:
+					hooks.submit(r, None, True)
+					continue
+				outbox.append({'id': r.i, 'status': step, 'rc': r.simreturncode, 'started': r.started, 'finished': time.time()})
+		if hooks is not None:
+			for r, ok in hooks.collect():
+				step = status_ok if ok else status_failed
+				outbox.append({'id': r.i, 'status': step, 'rc': r.simreturncode, 'started': r.started, 'finished': time.time(), 'hook': ok})
+		for r in waiting[:]:
+			if r.notbefore > time.time():
+				continue
+			waiting.remove(r)
+			if r.launch(settings, r.failsafe_next):
+				running.append(r)
+			else:
+				outbox.append({'id': r.i, 'status': status_failed, 'rc': r.simreturncode, 'started': r.started, 'finished': time.time()})
+
+		# Ask for one new job at a time while a warmup is in progress, like pool mode
+		free = 0
+		if paceReady(watch, settings['dtime']) and admission.admitAny(running, lastoutdir):
+			free = slots - len(running) - len(waiting)
+			if settings['dtime'] > 0:
+				free = min(free, 1)
+		try:
+			reply = sendPoll(url, {'worker': name, 'free': free, 'finished': outbox}, token)
+		except (OSError, ValueError) as e:
+			refused = isinstance(e, urllib.error.HTTPError) and e.code == 403
+			if refused:
+				print('ERROR: Coordinator refused this worker, check the token')
+			elif lostsince is None:
+				print('WARNING: Cannot reach coordinator: ', e)
+				lostsince = time.time()
+			elif time.time() - lostsince > worker_timeout:
+				print('ERROR: Lost coordinator, stopping')
+			if refused or time.time() - lostsince > worker_timeout:
+				for r in running:
+					killProcess(r.proc)
+					r.simlog.close()
+				stopWorker(writeback, retention, stage, hooks, True)
+				return False
+			time.sleep(pool_poll_time)
+			continue
+		lostsince = None
+		outbox = []
+
+		if reply.get('cancel'):
+			print('Batch cancelled by coordinator')
+			for r in running:
+				killProcess(r.proc)
+				r.simlog.close()
+			stopWorker(writeback, retention, stage, hooks, True)
+			return False
+		for job in reply['jobs']:
+			r = SimRun(job['id'], job['idf'], job['epw'])
+			r.outdir = job['outdir']
+			r.started = time.time()
+			lastoutdir = r.outdir
+			if stage is not None:
+				stage.stageRuns([r])
+			if r.launch(settings):
+				running.append(r)
+				watch = r.watch
+			else:
+				outbox.append({'id': r.i, 'status': status_failed, 'rc': None, 'started': r.started, 'finished': time.time()})
+		if reply['done'] and len(running) == 0 and len(waiting) == 0 and len(outbox) == 0 and (writeback is None or not writeback.busy()) and (hooks is None or not hooks.busy()):
+			print('Batch finished, worker stopping')
+			stopWorker(writeback, retention, stage, hooks)
+			return True
+		time.sleep(pool_poll_time)
+
+# Wait for a worker's write-backs, postprocessing hooks and output clean ups, and trim its stage folder, before it stops
+# Input: cancel = True to skip the hooks that have not started
+def stopWorker(writeback, retention, stage, hooks, cancel=False):
+	if writeback is not None:
+		writeback.finish()
+	if hooks is not None:
+		hooks.finish(cancel)
+	if stage is not None:
+		stage.finish()
+	if retention is not None:
+		retention.finish()
+
+# Command line to start a worker on this computer, for --local-workers
+# The token is passed in the EPML_TOKEN environment variable rather than on the command line.
+# Input: url = coordinator address, slots, settingsfile = settings .ini, ep_dir = EnergyPlus override or None, n = worker number
+# Returns: list of arguments for subprocess.Popen
+def localWorkerCmd(url, slots, settingsfile, ep_dir, n):
+	cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'epml.py'), 'worker', '--coordinator', url, '--slots', str(slots), '--settings', settingsfile, '--name', 'local' + str(n)]
+	if ep_dir is not None:
+		cmd = cmd + ['--ep-dir', ep_dir]
+	return cmd
@@ -0,0 +1,2585 @@
+# epml_engine.py
+# EnergyPlus MultiLaunch Engine
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Settings, file search, and simulation running functions used by the GUI (epml.py) and the command line (epml_cli.py).
+# Does not import tkinter, so it can be used on headless machines, from cron, SLURM, etc.
+
+
+# Import
+import sys
+import time
+from configparser import ConfigParser, Error as ConfigParserError
+import subprocess
+import os
+import csv
+import signal
+import hashlib
+import heapq
+import shutil
+import json
+import fnmatch
+import gzip
+import tempfile
+import shlex
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+from collections import deque
+from epml_idf import RuntimeEstimator, validateMany, referencedFile, scheduleFiles, replaceFields
+
+
+# File & String Manipulation Functions
+
+# Convert tuple to string where each entry is a new line
+# Input: t = tuple containing one or more strings
+# Returns: s = string where each entry is on a new line
+def tuple2str(t):
+	s = ''
+	for i in t:
+		s = s + '\n' + i
+	return s
+
+#Remove specified file extension if it is present from a string representing the output file name
+# Input:
+#	c = string with filename
+#	ext = file extension as a string (ex. '.txt')
+# Returns: string with filename but no extension
+# Examples:
+# 1. remExt('myfile.txt','.txt') => 'myfile'
+# 2. remExt('myfile','.txt') => 'myfile'
+def remExt(c, ext):
+	if c[len(c)-len(ext): len(c)] == ext: c = c[:len(c)-len(ext)]
+	return c
+
+# Get file path from a string, assumes string contains filepath
+#prev is a way to handle if fs is not valid
+def getPath(fs,prev):
+	# returns index of last instance of '/' character, or -1 if '/' not found
+	try:
+		i = fs.rindex('/')
+		#handle windows filesystems.
+		if i == -1:
+			i = fs.rindex('\\')
+			if i == -1:
+				print('Warning: new path not found from the following string; using previous instead')
+				print(fs)
+				return prev
+	except (ValueError):
+		print('Warning: new path not found from the following string; using previous instead')
+		print(fs)
+		return prev
+	return str(fs[:i])
+
+# Extract only the name of a file from a filepath
+# Input: 
+#	String fs
+#	String ext = the file extension
+# Returns: String containing just the file name
+# Dependencies: remExt(c, ext)
+# Example: getFileName('/home/random/directories/myfile.txt', '.txt') => 'myfile'
+def getFileName(fs,ext):
+	#Attempting to handle Windows vs Linux file delimiter issues
+	fs = fs.replace('\\','/')
+	i = fs.rindex('/')
+	if i == -1:
+		i = fs.rindex('\\')
+	return remExt(str(fs[i+1:]),ext)
+
+
+#Format a string from typical code text box entry to format that can be stored in .ini file
+# issue is ', ", \, newline, tab will cause formatting errors when reading .ini
+# PROBLEMS
+# .ini does not support multiline variables. 
+# https://stackoverflow.com/questions/33930852/how-to-insert-multi-line-value-using-configparser
+# https://stackoverflow.com/questions/11399665/new-lines-with-configparser
+# Either need to convert them into single line - this creates new problem if the user
+# inputs a string like 
+#    print('one\ntwo')
+# which gets stored as
+#	 print('one
+#	 two')
+# and cannot be converted back easily
+# OR need to save it as something with a tab on each subsequent line
+# example:
+# 	variable = print('one')
+#		print('two')
+#
+# TODO [high priority]: Find a workaround to this bug
+# - worst case, can change it so each pre/postcode variable saves to a different text file, which would allow reading mutiline without any conversions
+
+def text_to_ini(s):
+	#several attempts that don't work
+	
+	# ini does not support triple quote method
+	#s = '\'\'\'' + s + '\'\'\''
+	
+	#Tried splitting by other newline characters, problem is both true new line and new line within a user
+	# created string both use '\n' and there's no good way to differentiate. 
+	'''
+	ss = s.split('\u2028')
+	s2 = ''
+	for line in ss:
+		s2 = s2 + line + '\u2028\t'
+	'''
+	
+	#buggy - if you insert a 
+	# Newline character
+	s = s.replace('\n','\\n')
+	# Tab to "\t"
+	s = s.replace('\t','\\t')
+	# Put a backslash in front of every quote mark in the code
+	s = s.replace('\'',"\\'")
+	s = s.replace('\"','\\"')
+	#s = s.replace('\\','\\\\')
+	
+	return s
+
+#Undo formatting in text_to_ini()
+def ini_to_text(s):
+	#s = s[3:len(s)-3]
+	
+	# Newline character
+	s = s.replace('\\n','\n')
+	# Tab to "\t"
+	s = s.replace('\\t','\t')
+	# Put a backslash in front of every quote mark in the code
+	s = s.replace("\\'",'\'')
+	s = s.replace('\\"','\"')
+	#s = s.replace('\\\\','\\')
+	
+	return s
+
+
+# Settings ==================================================================================================
+# Default settings file, in the directory the program is run from
+setfile = 'ep_multilaunch_settings.ini'
+
+# Every setting stored in the .ini file as (key in settings dictionary, .ini section, .ini option, type, default)
+# Types: 'str', 'int', 'bool', and 'code' for pre/postprocessing code which needs text_to_ini() formatting.
+# To add a setting, add a row here; loadSettings() and saveSettings() handle the rest.
+setting_fields = [
+	('sp', 'general', 'sp', 'str', 'parallel'),
+	('dtime', 'general', 'dtime', 'int', 30),
+	# Max simultaneous simulations for pool mode. 0 = use number of CPU cores
+	('jobs', 'general', 'jobs', 'int', 0),
+	# Parallel/pool: times to rerun a failed simulation for each kind of failure (see classifyFailure), seconds to wait
+	# before the first rerun (doubled for each further rerun), and .idf to run if it still fails ('' = none)
+	('retries', 'general', 'retries', 'int', 10),
+	('retries_input', 'general', 'retries_input', 'int', 0),
+	('retries_infra', 'general', 'retries_infra', 'int', 2),
+	('backoff', 'general', 'backoff', 'int', 0),
+	('backoff_input', 'general', 'backoff_input', 'int', 0),
+	('backoff_infra', 'general', 'backoff_infra', 'int', 10),
+	('retries_timeout', 'general', 'retries_timeout', 'int', 1),
+	('backoff_timeout', 'general', 'backoff_timeout', 'int', 0),
+	# Minutes before a simulation is killed: wall-clock limit per run, and time without any output growing (0 = off)
+	('timeout_min', 'general', 'timeout_min', 'int', 0),
+	('stall_min', 'general', 'stall_min', 'int', 60),
+	# Hold launches while the load per core is over this percent (0 = off), or free memory or disk would go under these MB
+	('max_load', 'general', 'max_load', 'int', 0),
+	('min_free_mem_mb', 'general', 'min_free_mem_mb', 'int', 512),
+	('min_free_disk_mb', 'general', 'min_free_disk_mb', 'int', 1024),
+	# Run time and peak memory of past simulations (blank = do not keep)
+	('history_file', 'general', 'history_file', 'str', 'epml_history.csv'),
+	# Pool: start the simulations that took longest last time first
+	('longest_first', 'general', 'longest_first', 'bool', True),
+	('failsafe', 'general', 'failsafe', 'str', 'failsafe.idf'),
+	# Size cap of each simulation's console output log in kB (0 = no cap), and number of rotated logs kept
+	('log_max_kb', 'general', 'log_max_kb', 'int', 10240),
+	('log_backups', 'general', 'log_backups', 'int', 1),
+	# Reuse outputs of simulations whose inputs have not changed (series and pool only), cache folder, and its size limit in MB (0 = no limit)
+	('use_cache', 'general', 'use_cache', 'bool', True),
+	('cache_dir', 'general', 'cache_dir', 'str', 'epml_cache'),
+	('cache_max_mb', 'general', 'cache_max_mb', 'int', 10240),
+	# Check every .idf for problems that would stop EnergyPlus before the batch starts, and skip the ones that have them
+	('validate', 'general', 'validate', 'bool', True),
+	# Autodetect: folder index file (blank = search every folder each time), and ';' separated glob patterns of files to
+	# include (blank = all) and files and folders to exclude
+	('folder_index', 'general', 'folder_index', 'str', 'epml_folder_index.json'),
+	('folder_include', 'general', 'folder_include', 'str', ''),
+	('folder_exclude', 'general', 'folder_exclude', 'str', ''),
+	# After a batch, combine eplusout.csv/eplusmtr.csv of the successful simulations into one columnar store (see
+	# epml_results.py), the store folder, and ';' separated glob patterns of columns to keep (blank = all)
+	('aggregate', 'general', 'aggregate', 'bool', False),
+	('results_store', 'general', 'results_store', 'str', 'epml_results'),
+	('results_columns', 'general', 'results_columns', 'str', ''),
+	# Convert the .eso output to eplusout.csv/eplusmtr.csv with ReadVarsESO after each simulation. Off = skip it and read
+	# the results from eplusout.sql instead (the .idf needs an Output:SQLite object, see epml_results.querySql())
+	('readvars', 'general', 'readvars', 'bool', True),
+	# Clean up the output folder of each successful simulation as soon as it finishes: ';' separated glob patterns of
+	# files kept as they are and of files gzip compressed; every other file is deleted (see OutputRetention)
+	('retention', 'general', 'retention', 'bool', False),
+	('retention_keep', 'general', 'retention_keep', 'str', 'eplusout.err;eplusout.csv;eplusmtr.csv;eplusout.sql;eplustbl.*;epml_stdout.log*'),
+	('retention_compress', 'general', 'retention_compress', 'str', 'eplusout.eso;eplusout.mtr'),
+	# Run each simulation in a folder under this local scratch folder (blank = in its output folder), and the most
+	# output folders written back to their final place at once (see WriteBack)
+	('scratch_dir', 'general', 'scratch_dir', 'str', ''),
+	('writeback_jobs', 'general', 'writeback_jobs', 'int', 2),
+	# Copy each unique .epw and Schedule:File file of a batch once into this local folder and run from the copies
+	# (blank = off), and the size limit of the folder in MB (0 = no limit) (see InputStage)
+	('stage_dir', 'general', 'stage_dir', 'str', ''),
+	('stage_max_mb', 'general', 'stage_max_mb', 'int', 2048),
+	# Postprocessing run on each simulation as soon as it succeeds: shell command, Python function (module:function or
+	# file.py:function), and the most hooks running at once (see SimHooks)
+	('sim_hook', 'general', 'sim_hook', 'str', ''),
+	('sim_hook_python', 'general', 'sim_hook_python', 'str', ''),
+	('sim_hook_jobs', 'general', 'sim_hook_jobs', 'int', 2),
+	# Journal of the last batch, for resuming it (blank = no journal)
+	('journal', 'general', 'journal_file', 'str', 'epml_journal.csv'),
+	('ep_dir', 'general', 'ep_dir', 'str', 'C:\\EnergyPlusV9-4-0\\energyplus'),
+	# Minutes before pre/postprocessing code still running is killed (0 = no limit)
+	('code_timeout_min', 'general', 'code_timeout_min', 'int', 0),
+	('precode', 'general', 'preprocessing_code', 'code', ''),
+	('postcode', 'general', 'postprocessing_code', 'code', ''),
+	('precodepy', 'general', 'preprocessing_code_python', 'code', ''),
+	('postcodepy', 'general', 'postprocessing_code_python', 'code', ''),
+	('useLog', 'general', 'use_log_file', 'bool', False),
+	('fpath_select_idf', 'filepaths', 'fpath_select_idf', 'str', '/'),
+	('fpath_select_epw', 'filepaths', 'fpath_select_epw', 'str', '/'),
+	('fpath_folder', 'filepaths', 'fpath_folder', 'str', '/'),
+	('fpath_queue', 'filepaths', 'fpath_queue', 'str', '/'),
+]
+
+# Get a dictionary of all settings with their default values
+def defaultSettings():
+	return {f[0]: f[4] for f in setting_fields}
+
+# Load settings from .ini file
+# Any setting that is missing or invalid keeps its default value, so older .ini files still work.
+# Input: setfile = path to .ini file
+# Returns: settings dictionary, keys are the first column of setting_fields
+def loadSettings(setfile=setfile):
+	settings = defaultSettings()
+	cp = ConfigParser()
+	try:
+		found = cp.read(setfile)
+	except (ConfigParserError, IOError, OSError):
+		found = []
+	if len(found) == 0:
+		print("Warning: Could not get settings from ",setfile," \n Using default settings")
+		return settings
+	for key, section, option, kind, default in setting_fields:
+		try:
+			value = cp.get(section, option)
+		except (ConfigParserError, KeyError):
+			print("Warning: No setting ", option, " in ", setfile, "; using default: ", default)
+			continue
+		try:
+			if kind == 'int':
+				settings[key] = int(value)
+			elif kind == 'bool':
+				settings[key] = 'T' in value
+			elif kind == 'code':
+				settings[key] = ini_to_text(value)
+			else:
+				settings[key] = value
+		except (ValueError):
+			print("Warning: Invalid setting ", option, " = ", value, "; using default: ", default)
+	return settings
+
+# Save all settings to the .ini file
+# Input:
+#	settings = settings dictionary
+#	setfile = path to .ini file
+# Returns: string written to the file
+def saveSettings(settings, setfile=setfile):
+	set_contents = ''
+	section = ''
+	for key, sec, option, kind, default in setting_fields:
+		if sec != section:
+			if section != '':
+				set_contents = set_contents + '\n'
+			set_contents = set_contents + '[' + sec + ']\n'
+			section = sec
+		value = settings.get(key, default)
+		#.ini can't read a true newline, but can write literal "\n" in a string
+		if kind == 'code':
+			value = text_to_ini(value)
+		set_contents = set_contents + option + ' = ' + str(value) + '\n'
+	
+	# Overwrite settings ini file with new settings and filepaths
+	stxt = open(setfile, "w")
+	stxt.write(set_contents)
+	stxt.close()
+	
+	return set_contents
+
+
+# Folder search ==============================================================================================
+# Autodetect finds every .idf under a folder and gives each one the .epw closest to it: the first .epw in its own folder,
+# else in the nearest parent folder up to the selected one. Walking a big network share takes minutes, so the folders
+# seen are kept in an index file (settings['folder_index']) with the modified time of each folder. A folder's modified
+# time changes whenever a file or subfolder is added, removed or renamed in it, so on the next search only changed
+# folders are listed again; the others just need one stat each. Folders are listed/checked on several threads.
+# folder_include and folder_exclude are ';' separated glob patterns matched against each path relative to the selected
+# folder and against its name, e.g. "baseline_*.idf" or "*/old*". Excluded folders are not searched at all.
+
+# Threads listing folders at once, mostly waiting on the drive or network
+folder_scan_threads = 16
+index_version = 1
+
+# Index of the .idf/.epw files and subfolders in each folder, saved as JSON
+class FolderIndex:
+	# Input: path = index file, blank = do not keep an index
+	def __init__(self, path):
+		self.path = path
+		# absolute folder path -> [modified time ns, [subfolder names], [.idf and .epw file names]]
+		self.dirs = {}
+		self.changed = False
+		if len(path) == 0 or not os.path.isfile(path):
+			return
+		try:
+			with open(path) as f:
+				data = json.load(f)
+			if data.get('version') == index_version:
+				self.dirs = data['dirs']
+		except (IOError, OSError, ValueError, KeyError) as e:
+			print('WARNING: Cannot read folder index ', path, ': ', e)
+
+	# List one folder, or reuse its entry if it has not changed
+	# Returns: [modified time ns, [subfolder names], [.idf and .epw file names]]
+	def scanDir(self, d):
+		mtime = os.stat(d).st_mtime_ns
+		entry = self.dirs.get(d)
+		if entry is not None and entry[0] == mtime:
+			return entry
+		subdirs = []
+		files = []
+		with os.scandir(d) as it:
+			for e in it:
+				try:
+					if e.is_dir(follow_symlinks=False):
+						subdirs.append(e.name)
+					elif e.name.lower().endswith(('.idf', '.epw')):
+						files.append(e.name)
+				except (OSError):
+					pass
+		return [mtime, sorted(subdirs), sorted(files)]
+
+	# Search a folder and its subfolders, updating the index
+	# Input: root = folder, exclude = list of glob patterns
+	# Returns: dictionary of absolute folder path -> list of .idf and .epw file names in it, for every folder searched
+	def search(self, root, exclude):
+		root = os.path.abspath(root)
+		found = {}
+		with ThreadPoolExecutor(max_workers=folder_scan_threads) as ex:
+			futures = {ex.submit(self.scanDir, root): root}
+			while len(futures) > 0:
+				done, notdone = wait(futures, return_when=FIRST_COMPLETED)
+				for fut in done:
+					d = futures.pop(fut)
+					try:
+						entry = fut.result()
+					except (OSError) as e:
+						print('WARNING: Cannot search ', d, ': ', e)
+						continue
+					if self.dirs.get(d) is not entry:
+						self.dirs[d] = entry
+						self.changed = True
+					found[d] = entry[2]
+					for name in entry[1]:
+						sub = os.path.join(d, name)
+						if not matchesAny(relPath(sub, root), name, exclude):
+							futures[ex.submit(self.scanDir, sub)] = sub
+		# Forget folders under root that no longer exist or are now excluded
+		for d in list(self.dirs):
+			if d not in found and (d + os.sep).startswith(root + os.sep):
+				del self.dirs[d]
+				self.changed = True
+		return found
+
+	# Write the index file (to a temporary file first, so a crash cannot leave it half written)
+	def save(self):
+		if len(self.path) == 0 or not self.changed:
+			return
+		tmp = self.path + '.tmp'
+		try:
+			with open(tmp, 'w') as f:
+				json.dump({'version': index_version, 'dirs': self.dirs}, f)
+			os.replace(tmp, self.path)
+			self.changed = False
+		except (IOError, OSError) as e:
+			print('WARNING: Cannot save folder index ', self.path, ': ', e)
+
+# Returns: path relative to root with '/' separators
+def relPath(path, root):
+	return os.path.relpath(path, root).replace('\\', '/')
+
+# Split a ';' separated list of glob patterns
+def splitPatterns(text):
+	return [p.strip() for p in text.split(';') if len(p.strip()) > 0]
+
+# Returns: True if the relative path or the name matches one of the glob patterns
+def matchesAny(rel, name, patterns):
+	return any(fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+# Find every .idf in a folder and its subfolders, each with the nearest .epw
+# Input: folderpath = folder to search, settings = settings dictionary (folder_index, folder_include, folder_exclude),
+#	or None for the defaults
+# Returns: [list of .idf paths sorted by path, list of .epw paths for each .idf ('' where none was found)]
+def searchfolder(folderpath, settings=None):
+	if settings is None:
+		settings = defaultSettings()
+	include = splitPatterns(settings['folder_include'])
+	exclude = splitPatterns(settings['folder_exclude'])
+	root = os.path.abspath(folderpath)
+	index = FolderIndex(settings['folder_index'])
+	found = index.search(root, exclude)
+	index.save()
+
+	idfpaths = []
+	# folder -> first .epw in it
+	epwin = {}
+	for d in found:
+		for file in found[d]:
+			rel = relPath(os.path.join(d, file), root)
+			if matchesAny(rel, file, exclude):
+				continue
+			if file.lower().endswith('.epw'):
+				if d not in epwin:
+					epwin[d] = os.path.join(d, file)
+				else:
+					print('WARNING: Detected multiple weather files in ', d, ', using ', epwin[d])
+			#Autoignores "failsafe.idf" file used as a backup when another fails.
+			elif 'failsafe' not in file and (len(include) == 0 or matchesAny(rel, file, include)):
+				idfpaths.append(os.path.join(d, file))
+	idfpaths.sort()
+	print('Found ', len(idfpaths), ' .idf simulation files in ', len(found), ' folders.')
+
+	# Nearest .epw: own folder first, then each parent up to the selected folder
+	wfiles = []
+	for idf in idfpaths:
+		d = os.path.dirname(idf)
+		while d not in epwin and not d == root and (d + os.sep).startswith(root + os.sep):
+			d = os.path.dirname(d)
+		wfiles.append(epwin.get(d, ''))
+	missing = wfiles.count('')
+	if missing > 0:
+		print('ERROR: No .epw file found for ', missing, ' .idf files!')
+	epws = sorted(set(wfiles) - {''})
+	if len(epws) > 10:
+		print('Using ', len(epws), ' weather files')
+	else:
+		for epw in epws:
+			print('Using weather file: ', epw, ' for ', wfiles.count(epw), ' .idf files')
+	return [idfpaths, wfiles]
+
+
+# Functions for running simulations ==========================================================================
+
+# Read a queue file
+# Input: queue_file = path to a .csv file with (at least) the columns Filepath and Weather
+# Returns: [list of .idf paths, list of .epw paths], one entry per row
+# Raises KeyError if a column is missing, IOError/OSError if the file cannot be read
+def readQueue(queue_file):
+	list_idf_queue = []
+	list_epw_queue = []
+	#read csv with headers
+	with open(queue_file) as csvfile:
+		readCSV = csv.DictReader(csvfile, delimiter=',')
+		for row in readCSV:
+			list_idf_queue.append(row['Filepath'])
+			list_epw_queue.append(row['Weather'])
+	return [list_idf_queue, list_epw_queue]
+
+# Launch pacing =============================================================================================
+# EnergyPlus warmup is the most CPU intensive part of a simulation, so launches are spaced out until the previous
+# simulation has finished warming up. Progress is read from the simulation's console output (epml_stdout.log) and
+# .err file in its output directory. dtime is the ceiling: the next launch is released after dtime seconds even if
+# no progress was detected. dtime = 0 turns pacing off.
+
+# Name of the file each simulation's console output is written to, inside its output directory
+stdout_name = 'epml_stdout.log'
+
+# Console output lines that mark the progress of a simulation
+warmup_marker = 'Warming up'
+started_marker = 'Starting Simulation at'
+# .err file lines that mark the end of a simulation
+finished_markers = ('EnergyPlus Completed', 'EnergyPlus Terminated')
+
+# Watches the console output and .err file of one running simulation to tell how far along it is
+# Phases: 'starting' -> 'warmup' -> 'simulating' -> 'done'
+# Only reads new console output on each poll, so it stays cheap for long simulations.
+class ProgressWatch:
+	# Input: outdir = output directory, proc = EnergyPlus process or None, offset = bytes of the console log to skip,
+	#	e.g. the output of earlier attempts a rerun's log is appended to
+	def __init__(self, outdir, proc=None, offset=0):
+		self.stdoutfile = os.path.join(outdir, stdout_name)
+		self.errfile = os.path.join(outdir, 'eplusout.err')
+		self.proc = proc
+		self.launched = time.time()
+		self.offset = offset
+		self.partial = ''
+		self.phase = 'starting'
+		self.warmupdays = 0
+
+	# Read any new console output and update the phase
+	# Returns: current phase string
+	def poll(self):
+		if self.phase == 'done':
+			return self.phase
+		if self.proc is not None and self.proc.poll() is not None:
+			self.phase = 'done'
+			return self.phase
+		try:
+			# Log was rotated: start again from the top of the new file
+			if os.path.getsize(self.stdoutfile) < self.offset:
+				self.offset = 0
+			with open(self.stdoutfile, 'rb') as f:
+				f.seek(self.offset)
+				new = f.read()
+			self.offset = self.offset + len(new)
+			lines = (self.partial + new.decode('utf-8', errors='replace')).split('\n')
+			# Keep the last incomplete line for next time
+			self.partial = lines.pop()
+			for line in lines:
+				if warmup_marker in line:
+					self.phase = 'warmup'
+					self.warmupdays = self.warmupdays + 1
+				elif started_marker in line:
+					self.phase = 'simulating'
+		except (IOError, OSError):
+			pass
+		# Ignore .err files left behind by an earlier run of the same simulation
+		try:
+			if os.path.getmtime(self.errfile) >= self.launched:
+				with open(self.errfile, 'rb') as f:
+					f.seek(max(0, os.path.getsize(self.errfile) - 4096))
+					tail = f.read().decode('utf-8', errors='replace')
+				for m in finished_markers:
+					if m in tail:
+						self.phase = 'done'
+		except (IOError, OSError):
+			pass
+		return self.phase
+
+	# Returns: True once the first warmup has finished or the simulation has ended
+	def warmedUp(self):
+		return self.poll() in ('simulating', 'done')
+
+# Decide when the next simulation may be launched
+# Input:
+#	watch = ProgressWatch of the previously launched simulation, or None if nothing was launched yet
+#	maxwait = ceiling in seconds; 0 or less disables pacing
+# Returns: True if the next launch can go ahead
+def paceReady(watch, maxwait):
+	if watch is None or maxwait <= 0:
+		return True
+	if time.time() - watch.launched >= maxwait:
+		return True
+	return watch.warmedUp()
+
+# Progress events & cancelling =============================================================================
+# The run_ep_* functions can report the status of each simulation to a queue.Queue (or anything with put()), so
+# another thread such as the GUI can show live progress. Each event is a tuple:
+#	(index of the simulation in sims2run, .idf path, status, return code or None)
+# and a threading.Event can be set to cancel the batch, which kills every running simulation.
+
+# Simulation statuses
+status_queued = 'queued'
+status_running = 'running'
+status_ok = 'ok'
+status_failed = 'failed'
+status_cancelled = 'cancelled'
+# Result reused from the cache without running EnergyPlus
+status_cached = 'cached'
+# Killed for running too long or not making progress (see SimRun.overdue())
+status_timeout = 'timeout'
+# Not run because the .idf failed the checks before the batch (see checkInputs())
+status_invalid = 'invalid'
+
+# Send a progress event if anyone is listening
+def report(events, i, sim, status, rc=None):
+	if events is not None:
+		events.put((i, sim, status, rc))
+
+# Returns: True if the batch has been cancelled
+def cancelled(cancel):
+	return cancel is not None and cancel.is_set()
+
+# Extra subprocess.Popen arguments so each simulation runs in its own process group.
+# Needed so killProcess() also stops EnergyPlus itself, not just the shell that started it.
+def popenGroup():
+	if os.name == 'nt':
+		return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+	return {'start_new_session': True}
+
+# Kill a process started with popenGroup() and everything it started
+def killProcess(p):
+	if p.poll() is not None:
+		return
+	if os.name == 'nt':
+		subprocess.run('taskkill /F /T /PID ' + str(p.pid), capture_output=True, shell=True)
+	else:
+		try:
+			os.killpg(p.pid, signal.SIGKILL)
+		except (OSError):
+			p.kill()
+	p.wait()
+
+# Console output logs =======================================================================================
+# EnergyPlus console output is streamed to epml_stdout.log in each simulation's output directory instead of being
+# held in memory. A background thread per running simulation copies the output from a pipe to the file in small
+# chunks, so memory use stays flat however much EnergyPlus prints. When the file reaches log_max_kb it is rotated to
+# epml_stdout.log.1, .2, ... keeping log_backups old files; with log_backups = 0 it is just started over. The end of
+# the output, which has any errors, is always kept.
+
+# Bytes read from the pipe at a time
+log_chunk = 65536
+
+# Copies one simulation's console output from a pipe to its log file
+class SimLog:
+	# Input:
+	#	pipe = stdout of the EnergyPlus process
+	#	path = log file
+	#	maxbytes = size cap, 0 = no cap
+	#	backups = number of rotated logs to keep
+	#	append = add to the existing log (for reruns) instead of starting a new one
+	def __init__(self, pipe, path, maxbytes, backups, append=False):
+		self.pipe = pipe
+		self.path = path
+		self.maxbytes = maxbytes
+		self.backups = backups
+		self.file = open(path, 'ab' if append else 'wb')
+		self.size = self.file.tell()
+		# Size of the log before this run, where its output starts
+		self.start = self.size
+		self.thread = threading.Thread(target=self.pump, daemon=True)
+		self.thread.start()
+
+	def pump(self):
+		try:
+			while True:
+				chunk = self.pipe.read1(log_chunk) if hasattr(self.pipe, 'read1') else self.pipe.read(log_chunk)
+				if len(chunk) == 0:
+					break
+				if self.maxbytes > 0 and self.size + len(chunk) > self.maxbytes and self.size > 0:
+					self.rotate()
+				self.file.write(chunk)
+				self.file.flush()
+				self.size = self.size + len(chunk)
+		except (IOError, OSError, ValueError) as e:
+			print('WARNING: Lost console output for ', self.path, ': ', e)
+		finally:
+			self.pipe.close()
+
+	# Move the full log to .1 (and .1 to .2, etc.) and start a new one
+	def rotate(self):
+		self.file.close()
+		if self.backups > 0:
+			for n in range(self.backups - 1, 0, -1):
+				old = self.path + '.' + str(n)
+				if os.path.exists(old):
+					os.replace(old, self.path + '.' + str(n + 1))
+			os.replace(self.path, self.path + '.1')
+		self.file = open(self.path, 'wb')
+		self.size = 0
+
+	# Wait for the rest of the output after the process ended, then close the file
+	def close(self):
+		self.thread.join()
+		self.file.close()
+
+# Result cache ===============================================================================================
+# Outputs of successful simulations are kept in a content-addressed store (settings['cache_dir']) so re-running a batch
+# only launches the simulations whose inputs changed. The key is a hash of the .idf contents, the .epw contents, the
+# contents of every file named by a Schedule:File object in the .idf, the EnergyPlus executable (path, size, and
+# modified time), and the command line flags. If the .idf names files by relative paths, its folder is part of the key
+# too, so identical .idf files in different folders are not treated as the same simulation. Outputs are copied into
+# the cache on a background thread, with the size, modified time, and sha256 of each file in the entry's manifest: the
+# supervisor only hard-links the finished files into a snapshot folder in the cache, which takes no time whatever the
+# size of the outputs, and the copy is made from the snapshot, so output retention and hooks can carry on with the
+# output folder meanwhile. On a hit every file is checked against its size and modified time (a full sha256 check is
+# ResultCache.verify()) and the cached outputs are hard-linked (or copied, if the cache is on another drive) into the
+# simulation's output directory, and the simulation is reported as 'cached'; an entry whose files were changed since is
+# run again. Rows of one batch with the same key are only run once. The store is kept under settings['cache_max_mb'] by
+# deleting the least recently used entries.
+
+# List of the files in each cache entry with their sizes, modified times, and sha256, used to check the entry is
+# intact before reusing it
+cache_manifest = 'epml_cache_manifest.csv'
+# Bytes read at a time when hashing inputs
+hash_chunk = 1048576
+
+# Hash the contents of a file
+# Input:
+#	path = file to hash
+#	memo = dictionary of hashes already computed in this batch, so a weather file shared by many rows is read once
+# Returns: hex sha256 string
+def hashFile(path, memo):
+	st = os.stat(path)
+	memokey = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+	if memokey not in memo:
+		h = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(hash_chunk), b''):
+				h.update(chunk)
+		memo[memokey] = h.hexdigest()
+	return memo[memokey]
+
+# Identify the EnergyPlus version that will run, without starting it
+# Returns: string that changes whenever the executable is replaced or updated
+def epIdentity(ep_dir):
+	exe = shutil.which(ep_dir)
+	if exe is None:
+		exe = ep_dir
+	try:
+		st = os.stat(exe)
+	except (OSError):
+		return os.path.abspath(exe)
+	return os.path.realpath(exe) + '|' + str(st.st_size) + '|' + str(st.st_mtime_ns)
+
+# Cache key of one simulation
+# Input: idf, wfile = input paths, epid = epIdentity(), memo = hashFile() memo, flags = runFlags()
+# Returns: hex sha256 string, or None if an input, or a file it references, cannot be read (the simulation then just
+#	runs and fails as usual)
+def cacheKey(idf, wfile, epid, memo, flags):
+	try:
+		parts = ['epml-cache-2', hashFile(idf, memo), hashFile(wfile, memo), epid] + flags
+		names = scheduleFiles(idf)
+		for name in names:
+			path = referencedFile(name, idf)
+			if path is None:
+				return None
+			parts = parts + [name, hashFile(path, memo)]
+		if any(not os.path.isabs(name) for name in names):
+			parts.append(os.path.dirname(os.path.abspath(idf)))
+	except (IOError, OSError):
+		return None
+	return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+# Copy a file and hash it in the same pass
+# Returns: hex sha256 string of the contents
+def copyHashed(src, dest):
+	h = hashlib.sha256()
+	with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+		for chunk in iter(lambda: fsrc.read(hash_chunk), b''):
+			h.update(chunk)
+			fdest.write(chunk)
+	shutil.copystat(src, dest)
+	return h.hexdigest()
+
+# Hard link a file, or copy it if linking is not possible (different drive, FAT32, etc.)
+def linkOrCopy(src, dest):
+	if os.path.lexists(dest):
+		os.remove(dest)
+	try:
+		os.link(src, dest)
+	except (OSError):
+		shutil.copy2(src, dest)
+
+# Outputs that are hard-linked to the cache must not be overwritten in place by a new run, or the cached copy would
+# change too. Remove them from the output directory before EnergyPlus starts.
+def unlinkShared(outdir):
+	try:
+		names = os.listdir(outdir)
+	except (OSError):
+		return
+	for name in names:
+		path = os.path.join(outdir, name)
+		try:
+			if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+				os.remove(path)
+		except (OSError):
+			pass
+
+# Content-addressed store of simulation outputs
+class ResultCache:
+	# Input: folder = cache directory, maxbytes = size limit, 0 = no limit
+	def __init__(self, folder, maxbytes):
+		self.folder = folder
+		self.maxbytes = maxbytes
+		# key -> [size in bytes, last used time]
+		self.entries = {}
+		# Stores run on one background thread (see submit()), and the write-back threads store too
+		self.lock = threading.Lock()
+		self.pool = ThreadPoolExecutor(max_workers=1)
+		self.snapshots = 0
+		os.makedirs(folder, exist_ok=True)
+		for key in os.listdir(folder):
+			path = os.path.join(folder, key)
+			if not os.path.isfile(os.path.join(path, cache_manifest)):
+				continue
+			size = 0
+			for name in os.listdir(path):
+				try:
+					size = size + os.path.getsize(os.path.join(path, name))
+				except (OSError):
+					pass
+			self.entries[key] = [size, os.path.getmtime(path)]
+
+	def totalSize(self):
+		return sum(e[0] for e in self.entries.values())
+
+	# Read the list of files in an entry and check they are all there with the right sizes and modified times. A file
+	# changed in place since it was stored (e.g. through a hard link in an output folder) fails the check. Entries
+	# stored by older versions have no modified times, so they get the full check of verify().
+	# Input: key = entry, full = True to also check the sha256 of every file
+	# Returns: list of file names, or None if the entry is missing or damaged
+	def files(self, key, full=False):
+		path = os.path.join(self.folder, key)
+		try:
+			with open(os.path.join(path, cache_manifest), newline='') as f:
+				rows = list(csv.reader(f))
+			for row in rows:
+				filepath = os.path.join(path, row[0])
+				st = os.stat(filepath)
+				if st.st_size != int(row[1]):
+					return None
+				if len(row) == 4 and not full:
+					if st.st_mtime_ns != int(row[2]):
+						return None
+				elif hashFile(filepath, {}) != row[-1]:
+					return None
+		except (IOError, OSError, ValueError, IndexError):
+			return None
+		return [row[0] for row in rows]
+
+	# Check every file of an entry against its sha256; reads the whole entry
+	# Returns: list of file names, or None if the entry is missing or damaged
+	def verify(self, key):
+		return self.files(key, True)
+
+	# Copy a cached result into an output directory
+	# Returns: True on a cache hit
+	def restore(self, key, outdir):
+		if key not in self.entries:
+			return False
+		names = self.files(key)
+		if names is None:
+			print('WARNING: Cache entry ', key, ' is damaged or was changed, running the simulation again')
+			self.remove(key)
+			return False
+		path = os.path.join(self.folder, key)
+		try:
+			os.makedirs(outdir, exist_ok=True)
+			for name in names:
+				linkOrCopy(os.path.join(path, name), os.path.join(outdir, name))
+		except (IOError, OSError) as e:
+			print('WARNING: Could not use cached result for ', outdir, ': ', e)
+			return False
+		now = time.time()
+		os.utime(path, (now, now))
+		self.entries[key][1] = now
+		return True
+
+	# Add the outputs of a successful simulation to the cache, then evict old entries if over the size limit
+	# The outputs are copied, not linked, so later changes to the output folder do not reach the cache. Reads and
+	# writes the whole output folder, so it runs on a background thread (see submit() and WriteBack).
+	def store(self, key, outdir):
+		path = os.path.join(self.folder, key)
+		tmp = path + '.tmp' + str(os.getpid()) + '-' + str(threading.get_ident())
+		try:
+			names = sorted(n for n in os.listdir(outdir) if os.path.isfile(os.path.join(outdir, n)))
+			os.makedirs(tmp, exist_ok=True)
+			size = 0
+			rows = []
+			for name in names:
+				digest = copyHashed(os.path.join(outdir, name), os.path.join(tmp, name))
+				st = os.stat(os.path.join(tmp, name))
+				rows.append([name, st.st_size, st.st_mtime_ns, digest])
+				size = size + st.st_size
+			with open(os.path.join(tmp, cache_manifest), 'w', newline='') as f:
+				csv.writer(f).writerows(rows)
+			with self.lock:
+				if os.path.exists(path):
+					shutil.rmtree(path)
+				os.rename(tmp, path)
+				self.entries[key] = [size, time.time()]
+				self.evict()
+		except (IOError, OSError) as e:
+			print('WARNING: Could not add ', outdir, ' to the cache: ', e)
+			shutil.rmtree(tmp, ignore_errors=True)
+
+	# Start adding the outputs of a successful simulation to the cache in the background. The files are hard-linked
+	# into a snapshot folder first, so the output folder can be cleaned up or postprocessed while they are copied. If
+	# they cannot be linked (e.g. the cache is on another drive), they are copied now instead.
+	def submit(self, key, outdir):
+		self.snapshots = self.snapshots + 1
+		snapshot = os.path.join(self.folder, key + '.snap' + str(os.getpid()) + '-' + str(self.snapshots))
+		try:
+			os.makedirs(snapshot)
+			for name in os.listdir(outdir):
+				if os.path.isfile(os.path.join(outdir, name)):
+					os.link(os.path.join(outdir, name), os.path.join(snapshot, name))
+		except (OSError):
+			shutil.rmtree(snapshot, ignore_errors=True)
+			self.store(key, outdir)
+			return
+		self.pool.submit(self.storeSnapshot, key, snapshot)
+
+	def storeSnapshot(self, key, snapshot):
+		self.store(key, snapshot)
+		shutil.rmtree(snapshot, ignore_errors=True)
+
+	# Wait for the stores still running in the background
+	def finish(self):
+		self.pool.shutdown(wait=True)
+
+	def remove(self, key):
+		shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+		self.entries.pop(key, None)
+
+	# Delete least recently used entries until the cache fits in maxbytes
+	def evict(self):
+		if self.maxbytes <= 0:
+			return
+		total = self.totalSize()
+		for key in sorted(self.entries, key=lambda k: self.entries[k][1]):
+			if total <= self.maxbytes:
+				break
+			total = total - self.entries[key][0]
+			self.remove(key)
+
+# Open the cache and work out which simulations of a batch need to run
+# Input: pending = list of SimRun, settings = settings dictionary, events = progress queue,
+#	retention = OutputRetention or None, which cleans up the restored outputs
+# Returns: [ResultCache, list of SimRun to run]. Cache hits are restored and reported here; rows that repeat an
+#	earlier row's key are added to that row's duplicates list instead of being run.
+def checkCache(pending, settings, events, retention=None):
+	try:
+		cache = ResultCache(settings['cache_dir'], settings['cache_max_mb'] * 1048576)
+	except (IOError, OSError) as e:
+		print('WARNING: Cannot open cache ', settings['cache_dir'], ': ', e)
+		return [None, pending]
+	epid = epIdentity(settings['ep_dir'])
+	memo = {}
+	flags = runFlags(settings)
+	# Hash the inputs on a few threads; hashlib releases the GIL so large files hash in parallel
+	with ThreadPoolExecutor(max_workers=min(8, getMaxJobs(0))) as ex:
+		keys = list(ex.map(lambda r: cacheKey(r.sim, r.wfile, epid, memo, flags), pending))
+	torun = []
+	leaders = {}
+	hits = 0
+	for r, key in zip(pending, keys):
+		r.cachekey = key
+		if key is None:
+			torun.append(r)
+		elif key in leaders:
+			leaders[key].duplicates.append(r)
+		elif cache.restore(key, r.outdir):
+			print(r.sim, ' unchanged, using cached result')
+			report(events, r.i, r.sim, status_cached, 0)
+			if retention is not None:
+				retention.submit([r.outdir])
+			hits = hits + 1
+		else:
+			leaders[key] = r
+			torun.append(r)
+	print('Cache: ', hits, ' reused, ', len(pending) - hits - len(torun), ' duplicates, ', len(torun), ' to run')
+	return [cache, torun]
+
+# A simulation under the supervisor finished: store it in the cache and give its result to any duplicate rows
+# Input: r = SimRun, status = final status, cache = ResultCache or None, events = progress queue,
+#	copy = False if the outputs are already in the duplicates' output folders (see WriteBack)
+# Returns: number of duplicate rows that failed
+def finishCached(r, status, cache, events, copy=True):
+	if status == status_ok and cache is not None and r.cachekey is not None:
+		cache.submit(r.cachekey, r.outdir)
+	failed = 0
+	for d in r.duplicates:
+		if status == status_ok and copy and os.path.abspath(d.outdir) != os.path.abspath(r.outdir):
+			try:
+				os.makedirs(d.outdir, exist_ok=True)
+				for name in os.listdir(r.outdir):
+					if os.path.isfile(os.path.join(r.outdir, name)):
+						linkOrCopy(os.path.join(r.outdir, name), os.path.join(d.outdir, name))
+			except (IOError, OSError) as e:
+				print('ERROR: Could not copy results of ', r.sim, ' to ', d.outdir, ': ', e)
+				report(events, d.i, d.sim, status_failed)
+				failed = failed + 1
+				continue
+		if status == status_ok:
+			report(events, d.i, d.sim, status_cached, 0)
+		else:
+			report(events, d.i, d.sim, status, r.simreturncode)
+			if status != status_cancelled:
+				failed = failed + 1
+	return failed
+
+# Input staging ==============================================================================================
+# Hundreds of simulations in a batch often read the same few .epw files from a network share. With
+# settings['stage_dir'] set, every unique .epw and every file referenced by a Schedule:File object is copied once into
+# that local folder, named by the sha256 of its contents, and the simulations read the local copies, so startup reads
+# from the share grow with the number of unique inputs rather than the number of simulations. A copy is checked
+# against the sha256 of the original before it is used, and each staged file is hashed again the first time a batch
+# uses it, so a damaged copy is replaced instead of used. At the end of each batch the files used least recently are
+# deleted until the folder fits in stage_max_mb.
+# An .idf with Schedule:File objects is run from a copy in the stage folder with the file names replaced by the
+# staged copies. EnergyPlus is then started in the original .idf's folder, so any other relative file names in the
+# .idf are still found there.
+
+# Local content-addressed copies of the inputs of a batch
+class InputStage:
+	# Input: folder = stage folder, maxbytes = size limit, 0 = no limit
+	def __init__(self, folder, maxbytes):
+		self.folder = folder
+		self.maxbytes = maxbytes
+		os.makedirs(folder, exist_ok=True)
+		# hashFile() memo of the originals
+		self.memo = {}
+		# Staged file names checked in this batch, and original path -> staged path (None if it could not be staged)
+		self.verified = set()
+		self.staged = {}
+		# .idf path -> [staged .idf or None, folder to run EnergyPlus in or None]
+		self.idfs = {}
+
+	# Returns: True if the staged file exists and its contents match its name
+	def check(self, dest, key):
+		name = os.path.basename(dest)
+		if name in self.verified:
+			return True
+		try:
+			if hashFile(dest, {}) != key:
+				print('WARNING: Damaged staged file ', dest, ', copying it again')
+				os.remove(dest)
+				return False
+		except (IOError, OSError):
+			return False
+		self.verified.add(name)
+		return True
+
+	# Copy one file into the stage folder, unless a copy with the same contents is already there
+	# Returns: path of the staged copy, or None if it cannot be staged (the original is then used)
+	def stageFile(self, path):
+		src = os.path.abspath(path)
+		if src in self.staged:
+			return self.staged[src]
+		dest = None
+		try:
+			key = hashFile(src, self.memo)
+			dest = os.path.join(self.folder, key + os.path.splitext(src)[1].lower())
+			if not self.check(dest, key):
+				tmp = dest + '.tmp' + str(os.getpid()) + '-' + str(threading.get_ident())
+				shutil.copyfile(src, tmp)
+				if hashFile(tmp, {}) != key:
+					os.remove(tmp)
+					raise IOError('the copy does not match the original')
+				os.replace(tmp, dest)
+				self.verified.add(os.path.basename(dest))
+			# Last used time, for eviction
+			os.utime(dest)
+		except (IOError, OSError) as e:
+			print('WARNING: Could not stage ', src, ', reading it from where it is: ', e)
+			dest = None
+		self.staged[src] = dest
+		return dest
+
+	# Stage the .idf of one simulation if it has Schedule:File objects, after stageFile() has run on their files
+	# Returns: [staged .idf or None, folder to run EnergyPlus in or None]
+	def stageIdf(self, idf):
+		if idf in self.idfs:
+			return self.idfs[idf]
+		self.idfs[idf] = [None, None]
+		try:
+			names = {}
+			for name in scheduleFiles(idf):
+				path = referencedFile(name, idf)
+				if path is not None and self.staged.get(os.path.abspath(path)) is not None:
+					names[name] = os.path.abspath(self.staged[os.path.abspath(path)])
+			if len(names) == 0:
+				return self.idfs[idf]
+			with open(idf, 'rb') as f:
+				data = replaceFields(f.read(), names)
+			key = hashlib.sha256(data).hexdigest()
+			dest = os.path.join(self.folder, key + '.idf')
+			if not self.check(dest, key):
+				tmp = dest + '.tmp' + str(os.getpid())
+				with open(tmp, 'wb') as f:
+					f.write(data)
+				os.replace(tmp, dest)
+				self.verified.add(os.path.basename(dest))
+			os.utime(dest)
+			self.idfs[idf] = [dest, os.path.dirname(os.path.abspath(idf))]
+		except (IOError, OSError) as e:
+			print('WARNING: Could not stage ', idf, ', running it from where it is: ', e)
+		return self.idfs[idf]
+
+	# Stage the inputs of some simulations, copying the unique files on a few threads, and point them at the copies
+	# Input: runs = list of SimRun
+	def stageRuns(self, runs):
+		files = set()
+		for r in runs:
+			if len(r.wfile) > 0:
+				files.add(os.path.abspath(r.wfile))
+			try:
+				for name in scheduleFiles(r.sim):
+					path = referencedFile(name, r.sim)
+					if path is not None:
+						files.add(os.path.abspath(path))
+			except (IOError, OSError):
+				pass
+		files = sorted(f for f in files if f not in self.staged)
+		if len(files) > 0:
+			with ThreadPoolExecutor(max_workers=min(8, max(1, len(files)))) as ex:
+				list(ex.map(self.stageFile, files))
+		for r in runs:
+			wfile = self.staged.get(os.path.abspath(r.wfile))
+			if len(r.wfile) > 0 and wfile is not None:
+				r.runwfile = wfile
+			idf, cwd = self.stageIdf(r.sim)
+			if idf is not None:
+				r.runidf = idf
+				r.runcwd = cwd
+
+	# Delete the staged files used least recently until the folder fits in maxbytes; files used in this batch are kept
+	# Prints what the batch staged
+	def finish(self):
+		used = sum(1 for f in self.staged.values() if f is not None)
+		print('Input staging: ', used, ' unique input files for ', len(self.idfs), ' .idf files in ', self.folder)
+		if self.maxbytes <= 0:
+			return
+		files = []
+		for name in os.listdir(self.folder):
+			path = os.path.join(self.folder, name)
+			try:
+				st = os.stat(path)
+			except (OSError):
+				continue
+			files.append([st.st_mtime, st.st_size, name])
+		total = sum(f[1] for f in files)
+		for mtime, size, name in sorted(files):
+			if total <= self.maxbytes:
+				break
+			if name in self.verified:
+				continue
+			try:
+				os.remove(os.path.join(self.folder, name))
+				total = total - size
+			except (OSError):
+				pass
+
+# Returns: InputStage for a batch, or None if stage_dir is blank
+def startStage(settings):
+	if len(settings['stage_dir']) == 0:
+		return None
+	try:
+		return InputStage(settings['stage_dir'], settings['stage_max_mb'] * 1048576)
+	except (IOError, OSError) as e:
+		print('WARNING: Cannot open stage folder ', settings['stage_dir'], ': ', e)
+		return None
+
+# Output retention ===========================================================================================
+# Each simulation leaves .eso, .audit, .rdd, .mtd, .shd, CSVs and more in its output folder. With settings['retention']
+# on, the output folder of each successful or cached simulation is cleaned up as soon as it finishes, on background
+# threads while the rest of the batch runs: files matching retention_keep are left as they are, files matching
+# retention_compress are gzip compressed as a stream (so a multi GB .eso never has to fit in memory) and the originals
+# removed, and every other file is deleted. Subfolders are left alone. Clean up starts after the result cache has
+# taken its copy, so cached results stay complete.
+
+# Threads compressing at once. zlib releases the GIL, so these overlap with each other and with the supervisor.
+retention_threads = 2
+# gzip level: 6 is several times faster than 9 on .eso files for a few percent larger files
+compress_level = 6
+
+# Clean up one output folder
+# Input: outdir = output folder, keep, compress = lists of glob patterns of file names
+# Returns: bytes saved
+def applyRetention(outdir, keep, compress):
+	try:
+		names = os.listdir(outdir)
+	except (OSError):
+		return 0
+	saved = 0
+	for name in names:
+		path = os.path.join(outdir, name)
+		# Files compressed by an earlier run are kept
+		if not os.path.isfile(path) or name.endswith('.gz') or matchesAny(name, name, keep):
+			continue
+		try:
+			size = os.path.getsize(path)
+			if matchesAny(name, name, compress):
+				tmp = path + '.gz.tmp'
+				with open(path, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=compress_level) as dest:
+					shutil.copyfileobj(src, dest, 1048576)
+				os.replace(tmp, path + '.gz')
+				size = size - os.path.getsize(path + '.gz')
+			os.remove(path)
+			saved = saved + size
+		except (IOError, OSError) as e:
+			print('WARNING: Could not clean up ', path, ': ', e)
+	return saved
+
+# Background clean up of the output folders of one batch
+class OutputRetention:
+	def __init__(self, settings):
+		self.keep = splitPatterns(settings['retention_keep'])
+		self.compress = splitPatterns(settings['retention_compress'])
+		self.pool = ThreadPoolExecutor(max_workers=retention_threads)
+		# Bytes saved in each folder cleaned up so far
+		self.saved = []
+		self.seen = set()
+
+	# Queue output folders for clean up; each folder is only cleaned once per batch
+	def submit(self, outdirs):
+		for outdir in outdirs:
+			key = os.path.abspath(outdir)
+			if key not in self.seen:
+				self.seen.add(key)
+				self.pool.submit(self.clean, outdir)
+
+	# Clean up one folder now, on the calling thread (e.g. a scratch folder before it is written back)
+	def clean(self, outdir):
+		self.saved.append(applyRetention(outdir, self.keep, self.compress))
+
+	# Wait for the clean ups still running and print the space saved
+	# Returns: bytes saved in the batch
+	def finish(self):
+		self.pool.shutdown(wait=True)
+		saved = sum(self.saved)
+		print('Output retention: cleaned up ', len(self.saved), ' output folders, saved ', round(saved / 1048576, 1), ' MB')
+		return saved
+
+# Returns: OutputRetention for a batch, or None if retention is off
+def startRetention(settings):
+	if not settings['retention']:
+		return None
+	return OutputRetention(settings)
+
+# Scratch runs ===============================================================================================
+# With settings['scratch_dir'] set (e.g. a tmpfs or local SSD), EnergyPlus writes to a folder there instead of the
+# output folder next to the .idf, so the many small writes of a running simulation never cross the network. Once the
+# simulation has its final status, a pool of writeback_jobs threads writes the outputs back: each file is copied into
+# a hidden staging folder inside the output folder, then renamed into place. A rename within one drive is atomic, so
+# no half written file ever shows up in the output folder, and eplusout.err is renamed last, so once it says EnergyPlus
+# completed every other output is already there. The scratch folder is then deleted. If the write-back fails, the
+# outputs are left in the scratch folder and the simulation counts as failed. The status of a simulation is only
+# reported once its write-back is done.
+
+writeback_stage = '.epml-writeback'
+
+# Returns: folder EnergyPlus writes to for SimRun r, its output folder or a folder under scratch_dir
+def runDir(settings, r):
+	if len(settings['scratch_dir']) == 0:
+		return r.outdir
+	return os.path.join(settings['scratch_dir'], 'epml-' + str(os.getpid()) + '-' + str(r.i) + '-' + os.path.basename(r.outdir))
+
+# Write the outputs in a scratch folder back to one or more output folders, then delete the scratch folder
+# Input: rundir = scratch folder, outdirs = list of output folders, retention = OutputRetention to clean up the scratch
+#	folder with first, or None
+# Returns: True if every output folder was written
+def writeBack(rundir, outdirs, retention=None):
+	if retention is not None:
+		retention.clean(rundir)
+	try:
+		names = sorted(n for n in os.listdir(rundir) if os.path.isfile(os.path.join(rundir, n)))
+		names.sort(key=lambda n: n == 'eplusout.err')
+		for outdir in outdirs:
+			stage = os.path.join(outdir, writeback_stage)
+			shutil.rmtree(stage, ignore_errors=True)
+			os.makedirs(stage)
+			for name in names:
+				shutil.copy2(os.path.join(rundir, name), os.path.join(stage, name))
+			for name in names:
+				os.replace(os.path.join(stage, name), os.path.join(outdir, name))
+			os.rmdir(stage)
+	except (IOError, OSError) as e:
+		print('ERROR: Could not write the outputs in ', rundir, ' back to ', ', '.join(outdirs), ': ', e)
+		return False
+	shutil.rmtree(rundir, ignore_errors=True)
+	return True
+
+# Background write-back of the scratch folders of one batch
+class WriteBack:
+	# Input: settings = settings dictionary, retention = OutputRetention or None
+	def __init__(self, settings, retention):
+		self.pool = ThreadPoolExecutor(max_workers=max(1, settings['writeback_jobs']))
+		self.retention = retention
+		# [SimRun, final status, Future] of each write-back not collected yet
+		self.jobs = []
+
+	# Start writing back a simulation that reached its final status. A successful result is added to the cache from
+	# the scratch folder first, and also written to the output folders of its duplicate rows.
+	# Input: r = SimRun, status = final status, cache = ResultCache or None
+	def submit(self, r, status, cache=None):
+		outdirs = [r.outdir]
+		retention = None
+		if status == status_ok:
+			for d in r.duplicates:
+				if os.path.abspath(d.outdir) not in [os.path.abspath(o) for o in outdirs]:
+					outdirs.append(d.outdir)
+			retention = self.retention
+		else:
+			cache = None
+		self.jobs.append([r, status, self.pool.submit(self.run, r, outdirs, retention, cache)])
+
+	# Runs on a write-back thread: store the scratch folder in the cache, then write it back
+	# Returns: same as writeBack()
+	def run(self, r, outdirs, retention, cache):
+		if cache is not None and r.cachekey is not None:
+			cache.store(r.cachekey, r.rundir)
+		return writeBack(r.rundir, outdirs, retention)
+
+	# Returns: True while write-backs have not been collected
+	def busy(self):
+		return len(self.jobs) > 0
+
+	# Input: wait = True to wait for every write-back
+	# Returns: list of [SimRun, final status] whose write-back is done; the status is failed if it did not work
+	def collect(self, wait=False):
+		done = []
+		for job in self.jobs[:]:
+			r, status, future = job
+			if not wait and not future.done():
+				continue
+			self.jobs.remove(job)
+			if not future.result() and status == status_ok:
+				status = status_failed
+			done.append([r, status])
+		return done
+
+	# Wait for every write-back and stop the threads
+	# Returns: same as collect()
+	def finish(self):
+		done = self.collect(True)
+		self.pool.shutdown()
+		return done
+
+# Returns: WriteBack for a batch, or None if scratch_dir is blank
+def startWriteBack(settings, retention):
+	if len(settings['scratch_dir']) == 0:
+		return None
+	return WriteBack(settings, retention)
+
+# Simulation hooks ===========================================================================================
+# Postprocessing of each simulation as soon as it succeeds, while the rest of the batch keeps running, instead of
+# waiting for the slowest simulation and then running everything in runAfter(). Either or both of:
+#	settings['sim_hook'] = shell command, run in the output folder with {idf}, {epw}, {outdir}, and {index} replaced by
+#		the simulation's .idf, .epw, output folder, and row number, e.g. python summary.py {outdir}. The values are
+#		quoted for the shell, so they must not be put in quotes again.
+#	settings['sim_hook_python'] = Python function as module:function or path/to/file.py:function, called as
+#		function(idf, epw, outdir) in its own Python process for each simulation; it fails if it raises an exception
+#		(including SystemExit) or returns False
+# Hooks run in a pool of sim_hook_jobs threads, so however fast simulations finish, no more than that many hooks run
+# at once. Each hook runs as its own process, like pre/postprocessing code, so it cannot crash or block the launcher or
+# print into its log. With output retention on, a folder is cleaned up before its hook runs, so hooks see the files
+# retention keeps. The output and exit status of each hook go to epml_hook.log in the output folder, and the batch counts
+# as failed if any hook fails. Results restored from the cache are not postprocessed again.
+
+sim_hook_log = 'epml_hook.log'
+
+# Runs the Python hook in its own process: python -c hook_runner <module or .py file> <function> <idf> <epw> <outdir>
+hook_runner = """import importlib, importlib.util, os, sys, traceback
+modname, funcname = sys.argv[1:3]
+print('Run >> ' + funcname + '(' + ', '.join(repr(p) for p in sys.argv[3:6]) + ')', flush=True)
+try:
+	if modname.endswith('.py'):
+		found = importlib.util.spec_from_file_location('epml_hook_' + os.path.splitext(os.path.basename(modname))[0], modname)
+		module = importlib.util.module_from_spec(found)
+		found.loader.exec_module(module)
+	else:
+		module = importlib.import_module(modname)
+	value = getattr(module, funcname)(*sys.argv[3:6])
+except BaseException:
+	traceback.print_exc()
+	sys.exit(1)
+print('Returned: ' + repr(value))
+sys.exit(1 if value is False else 0)"""
+
+# Check the Python function named by settings['sim_hook_python']
+# Input: spec = module:function or path/to/file.py:function
+# Returns: [module name or absolute .py path, function name]
+# Raises ValueError if spec is not in either form or the .py file does not exist
+def checkHook(spec):
+	modname, sep, funcname = spec.rpartition(':')
+	if len(sep) == 0 or len(modname) == 0 or len(funcname) == 0:
+		raise ValueError('use module:function or path/to/file.py:function')
+	if modname.endswith('.py'):
+		if not os.path.isfile(modname):
+			raise ValueError(modname + ' does not exist')
+		modname = os.path.abspath(modname)
+	return [modname, funcname]
+
+# Returns: value quoted to be one argument of a shell command line
+def shellQuote(value):
+	if os.name == 'nt':
+		return subprocess.list2cmdline([value])
+	return shlex.quote(value)
+
+# Run one hook process, writing its output to log
+# Input: cmd = command line (string for the shell or list), log = open log file, cwd = folder to run it in or None
+# Returns: True if it exited with 0
+def runHookProcess(cmd, log, cwd=None):
+	log.flush()
+	try:
+		rc = subprocess.run(cmd, shell=isinstance(cmd, str), cwd=cwd, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT).returncode
+	except (OSError) as e:
+		log.write(str(e) + '\n')
+		rc = None
+	log.write('Exit status: ' + str(rc) + '\n')
+	return rc == 0
+
+# Run the hooks of one simulation, writing their output to epml_hook.log in its output folder
+# Input: command = shell command ('' = none), func = [module, function] from checkHook() or None, i = row number,
+#	idf, epw, outdir = paths
+# Returns: True if every hook worked
+def runSimHook(command, func, i, idf, epw, outdir):
+	try:
+		with open(os.path.join(outdir, sim_hook_log), 'w') as log:
+			ok = True
+			if len(command) > 0:
+				line = command.replace('{idf}', shellQuote(idf)).replace('{epw}', shellQuote(epw)).replace('{outdir}', shellQuote(outdir)).replace('{index}', str(i))
+				log.write('Run >> ' + line + '\n')
+				ok = runHookProcess(line, log, outdir)
+			if func is not None and ok:
+				ok = runHookProcess([pythonExecutable(), '-c', hook_runner] + func + [idf, epw, outdir], log)
+	except (IOError, OSError) as e:
+		print('ERROR: Could not write ', sim_hook_log, ' in ', outdir, ': ', e)
+		return False
+	return ok
+
+# Background postprocessing of the simulations of one batch
+class SimHooks:
+	# Input: settings = settings dictionary, func = [module, function] from checkHook() or None
+	def __init__(self, settings, func):
+		self.command = settings['sim_hook']
+		self.func = func
+		self.pool = ThreadPoolExecutor(max_workers=max(1, settings['sim_hook_jobs']))
+		# Output folder -> [row number, .idf, True if the hooks worked, seconds], of every hook that has run
+		self.results = {}
+		self.seen = set()
+		self.stopped = False
+		# [SimRun, list of Future] of each tracked simulation not collected yet
+		self.jobs = []
+		# Every Future submitted, so finish() sees hooks that raised instead of returning
+		self.futures = []
+
+	# Queue the hooks of a simulation that succeeded and of its duplicate rows
+	# Input: r = SimRun, retention = OutputRetention to clean up the output folders with first, or None, track = True
+	#	to get the result back from collect() (e.g. to report it to a coordinator)
+	def submit(self, r, retention=None, track=False):
+		futures = []
+		for s in [r] + r.duplicates:
+			key = os.path.abspath(s.outdir)
+			if key not in self.seen:
+				self.seen.add(key)
+				futures.append(self.pool.submit(self.run, s.i, s.sim, s.wfile, key, retention))
+		self.futures.extend(futures)
+		if track:
+			self.jobs.append([r, futures])
+
+	# Returns: True if the hooks worked, False if they failed or were skipped because the batch stopped
+	def run(self, i, sim, wfile, outdir, retention):
+		if self.stopped:
+			return False
+		start = time.time()
+		ok = False
+		try:
+			if retention is not None:
+				retention.clean(outdir)
+			ok = runSimHook(self.command, self.func, i, os.path.abspath(sim), os.path.abspath(wfile), outdir)
+		finally:
+			# Recorded even if the hook raised, so a failure is never counted as success
+			self.results[outdir] = [i, sim, ok, time.time() - start]
+			if not ok:
+				print('ERROR: Postprocessing hook failed for ', sim, ', see ', os.path.join(outdir, sim_hook_log))
+		return ok
+
+	# Returns: True while tracked simulations have not been collected
+	def busy(self):
+		return len(self.jobs) > 0
+
+	# Returns: list of [SimRun, True if all its hooks worked] of the tracked simulations whose hooks are done
+	def collect(self):
+		done = []
+		for job in self.jobs[:]:
+			r, futures = job
+			if all(f.done() for f in futures):
+				self.jobs.remove(job)
+				done.append([r, all(f.exception() is None and f.result() for f in futures)])
+		return done
+
+	# Wait for the hooks still running and print how they went
+	# Input: cancel = True to skip the hooks that have not started
+	# Returns: True if every hook that ran worked
+	def finish(self, cancel=False):
+		self.stopped = cancel
+		self.pool.shutdown(wait=True)
+		failed = [v for v in self.results.values() if not v[2]]
+		print('Postprocessing hooks: ', len(self.results) - len(failed), ' of ', len(self.results), ' worked')
+		errors = [f.exception() for f in self.futures if f.exception() is not None]
+		for e in errors:
+			print('ERROR: Postprocessing hook raised ', repr(e))
+		return len(failed) == 0 and len(errors) == 0
+
+# Returns: SimHooks for a batch, or None if there are no hooks
+# Raises ValueError from checkHook() if sim_hook_python is not a function name
+def startHooks(settings):
+	if len(settings['sim_hook']) == 0 and len(settings['sim_hook_python']) == 0:
+		return None
+	func = None
+	if len(settings['sim_hook_python']) > 0:
+		func = checkHook(settings['sim_hook_python'])
+	return SimHooks(settings, func)
+
+# Run history ================================================================================================
+# Wall time and peak memory (RSS) of every successful simulation are kept in settings['history_file'], keyed by the .idf
+# path and a hash of its contents, so later batches know roughly what each simulation needs. If a model was edited
+# since its last run, the last run of the same path is used as an estimate.
+
+history_columns = ['Filepath', 'Hash', 'Runtime', 'PeakMemoryMB']
+# Seconds between saves of the history file during a batch (it is always saved at the end)
+history_save_time = 60
+
+class RunHistory:
+	# Input: path = history .csv file, blank = do not keep history
+	def __init__(self, path):
+		self.path = path
+		# (absolute .idf path, hash) -> [run time in s, peak memory in MB or None]
+		self.rows = {}
+		# absolute .idf path -> last row recorded for it
+		self.bypath = {}
+		self.memo = {}
+		self.saved = time.time()
+		self.changed = False
+		if len(path) == 0 or not os.path.isfile(path):
+			return
+		try:
+			with open(path, newline='') as f:
+				for row in csv.DictReader(f):
+					mem = None
+					if len(row['PeakMemoryMB']) > 0:
+						mem = float(row['PeakMemoryMB'])
+					self.rows[(row['Filepath'], row['Hash'])] = [float(row['Runtime']), mem]
+					self.bypath[row['Filepath']] = self.rows[(row['Filepath'], row['Hash'])]
+		except (IOError, OSError, KeyError, ValueError) as e:
+			print('WARNING: Cannot read run history ', path, ': ', e)
+
+	def key(self, idf):
+		try:
+			return (os.path.abspath(idf), hashFile(idf, self.memo))
+		except (IOError, OSError):
+			return (os.path.abspath(idf), '')
+
+	# Returns: [run time in s, peak memory in MB or None] from the last run of this .idf, or None if it never ran
+	def lookup(self, idf):
+		k = self.key(idf)
+		if k in self.rows:
+			return self.rows[k]
+		return self.bypath.get(k[0])
+
+	def record(self, idf, runtime, peakmem):
+		k = self.key(idf)
+		self.rows[k] = [runtime, peakmem]
+		self.bypath[k[0]] = self.rows[k]
+		self.changed = True
+		if time.time() - self.saved > history_save_time:
+			self.save()
+
+	# Write the history file (to a temporary file first, so a crash cannot leave it half written)
+	def save(self):
+		self.saved = time.time()
+		if len(self.path) == 0 or not self.changed:
+			return
+		tmp = self.path + '.tmp'
+		try:
+			with open(tmp, 'w', newline='') as f:
+				writer = csv.writer(f)
+				writer.writerow(history_columns)
+				for (idf, h), (runtime, mem) in self.rows.items():
+					writer.writerow([idf, h, round(runtime, 1), '' if mem is None else round(mem)])
+			os.replace(tmp, self.path)
+			self.changed = False
+		except (IOError, OSError) as e:
+			print('WARNING: Cannot save run history ', self.path, ': ', e)
+
+# Run time assumed for a simulation whose .idf cannot be read, in seconds
+default_runtime = 600
+
+# Estimate the run time of each simulation. Simulations that ran before get their last run time from the history; the
+# rest get an estimate from their .idf contents (epml_idf), calibrated against the history.
+# Input: sims = list of .idf paths, history = RunHistory
+# Returns: [list of estimated seconds, number of simulations that had history]
+def estimateRuntimes(sims, history):
+	looked = {sim: history.lookup(sim) for sim in set(sims)}
+	rows = [looked[sim] for sim in sims]
+	known = sum(1 for row in rows if row is not None)
+	estimates = [None if row is None else row[0] for row in rows]
+	unknown = [i for i in range(len(sims)) if estimates[i] is None]
+	if len(unknown) > 0:
+		paths = sorted(set(sims[i] for i in unknown))
+		static = dict(zip(paths, RuntimeEstimator(history).estimateMany(paths)))
+		for i in unknown:
+			t = static[sims[i]]
+			estimates[i] = default_runtime if t is None else t
+	return [estimates, known]
+
+# Predict how long a batch takes when the longest simulations are started first on maxjobs slots
+# Input: runtimes = list of seconds, maxjobs = slots
+# Returns: seconds until the last simulation finishes
+def predictMakespan(runtimes, maxjobs):
+	slots = [0] * max(1, min(maxjobs, len(runtimes)))
+	for t in sorted(runtimes, reverse=True):
+		heapq.heapreplace(slots, slots[0] + t)
+	return max(slots)
+
+# Estimate a batch before it runs, for display
+# Input: sims = list of .idf paths, settings = dictionary of settings
+# Returns: [list of estimated seconds per simulation, predicted seconds for the whole batch]
+def estimateBatch(sims, settings):
+	estimates = estimateRuntimes(sims, RunHistory(settings['history_file']))[0]
+	if settings['sp'] == 'series':
+		return [estimates, sum(estimates)]
+	if settings['sp'] == 'parallel':
+		return [estimates, max(estimates, default=0)]
+	return [estimates, predictMakespan(estimates, getMaxJobs(settings['jobs']))]
+
+# Admission control ==========================================================================================
+# Before each launch the supervisor checks the machine has room for another simulation, and holds the queue until it
+# does (e.g. other users' jobs on a shared server, or output filling the drive):
+#	max_load = 1 minute load average per CPU core, in percent (0 = no check; Linux/macOS only)
+#	min_free_mem_mb = memory that must stay free after the next simulation and every running one reach their peak
+#		memory from the run history (Linux only, from /proc/meminfo)
+#	min_free_disk_mb = free space on the drive of the next simulation's output folder
+# No check holds the queue while none of this batch's simulations are running, so a batch cannot wait forever for memory
+# or disk space it will never get; with too little disk space the simulation is started with a warning. Parallel mode
+# is not checked at all: co-simulation peers must all start, and holding some of them back could leave the others
+# waiting for them forever.
+
+# Peak memory assumed for a simulation with no history, in MB
+default_peak_mem_mb = 512
+# Seconds between memory readings of each running simulation
+mem_check_time = 5
+
+# Returns: [available, total] memory in MB, or None if unknown (not Linux)
+def memoryMB():
+	try:
+		with open('/proc/meminfo') as f:
+			info = dict(line.split(':', 1) for line in f if ':' in line)
+		return [int(info['MemAvailable'].split()[0]) / 1024, int(info['MemTotal'].split()[0]) / 1024]
+	except (IOError, OSError, KeyError, ValueError):
+		return None
+
+# Memory of a running process in MB
+# Input: pid = process id, field = 'VmRSS' for current or 'VmHWM' for peak resident memory
+# Returns: MB, or None if unknown (not Linux, or the process has ended)
+def processMemoryMB(pid, field='VmRSS'):
+	try:
+		with open('/proc/' + str(pid) + '/status') as f:
+			for line in f:
+				if line.startswith(field + ':'):
+					return int(line.split()[1]) / 1024
+	except (IOError, OSError, ValueError):
+		pass
+	return None
+
+# Returns: 1 minute load average per core in percent, or None if unknown (Windows)
+def loadPercent():
+	try:
+		return os.getloadavg()[0] * 100 / getMaxJobs(0)
+	except (AttributeError, OSError):
+		return None
+
+# Free space on the drive holding path (or its nearest existing parent folder), in MB
+def freeDiskMB(path):
+	path = os.path.abspath(path)
+	while not os.path.exists(path) and os.path.dirname(path) != path:
+		path = os.path.dirname(path)
+	try:
+		return shutil.disk_usage(path).free / 1048576
+	except (OSError):
+		return None
+
+class Admission:
+	# Input: settings = settings dictionary, history = RunHistory
+	def __init__(self, settings, history):
+		self.settings = settings
+		self.history = history
+		# Reason the queue is being held, '' if it is not
+		self.held = ''
+
+	# Returns: expected peak memory of a simulation in MB
+	def expectedMemory(self, r):
+		row = self.history.lookup(r.model)
+		if row is None or row[1] is None:
+			return default_peak_mem_mb
+		return row[1]
+
+	# Returns: '' if a simulation can start now, else why it has to wait
+	# Input: running = list of running SimRun, outdir = output folder and expectedmem = peak memory (MB) of the next simulation
+	def check(self, running, outdir, expectedmem):
+		s = self.settings
+		disk = ''
+		if s['min_free_disk_mb'] > 0:
+			# With a scratch folder, EnergyPlus writes there (see Scratch runs)
+			folder = outdir
+			if len(s['scratch_dir']) > 0:
+				folder = s['scratch_dir']
+			free = freeDiskMB(folder)
+			if free is not None and free < s['min_free_disk_mb']:
+				disk = 'only ' + str(round(free)) + ' MB free disk space for ' + folder
+		if len(running) == 0:
+			if len(disk) > 0:
+				print('WARNING: Starting a simulation with ', disk)
+			return ''
+		if len(disk) > 0:
+			return disk
+		if s['max_load'] > 0:
+			load = loadPercent()
+			if load is not None and load > s['max_load']:
+				return 'CPU load ' + str(round(load)) + '% per core'
+		mem = memoryMB()
+		if mem is not None:
+			# Memory the running simulations will still take as they reach their peak
+			growth = 0
+			for r2 in running:
+				now = processMemoryMB(r2.proc.pid)
+				if now is not None:
+					growth = growth + max(0, r2.expectedmem - now)
+			need = expectedmem + s['min_free_mem_mb']
+			if mem[0] - growth < need:
+				return 'only ' + str(round(mem[0] - growth)) + ' MB memory free, next simulation needs ' + str(round(need)) + ' MB'
+		return ''
+
+	# Check whether simulation r can start, printing when the queue is held and when it starts again
+	# Input: r = next SimRun, running = list of running SimRun
+	# Returns: True if it can start
+	def admit(self, r, running):
+		return self.report(self.check(running, r.outdir, self.expectedMemory(r)))
+
+	# Same for a simulation that is not known yet (cluster workers, before asking for a job)
+	# Input: running = list of running SimRun, outdir = a folder on the output drive
+	def admitAny(self, running, outdir):
+		return self.report(self.check(running, outdir, default_peak_mem_mb))
+
+	# Print only when the queue starts or stops being held, not every time the numbers change
+	def report(self, reason):
+		if len(reason) > 0 and len(self.held) == 0:
+			print('Holding launches: ', reason)
+		elif len(reason) == 0 and len(self.held) > 0:
+			print('Resuming launches')
+		self.held = reason
+		return len(reason) == 0
+
+# Supervisor =================================================================================================
+# Series, parallel and pool modes are run by one supervisor loop in this process. It starts EnergyPlus directly (one process
+# per simulation, no shell or launch script in between), so it gets the real return code of every simulation.
+# It also handles what the old run_TEMPLATE.py launch codes did: re-running a failed simulation up to
+# settings['retries'] times in case of warmup anomaly errors, then running the failsafe .idf so a co-simulation
+# waiting on this model does not get stuck. A simulation that only completed with the failsafe still counts as failed.
+
+# Number of attempts for the failsafe .idf
+failsafe_attempts = 2
+# Seconds between stall checks of each running simulation
+stall_check_time = 10
+
+# EnergyPlus command line flags used for every simulation of a batch (also part of the cache key)
+# Returns: list of flags
+def runFlags(settings):
+	if settings['readvars']:
+		return ['--readvars']
+	return []
+
+# Create the EnergyPlus command for one simulation, as a list of arguments for subprocess.Popen
+def buildRunCmd(ep_dir, outdir, wfile, idf, flags):
+	return [ep_dir] + flags + ['--output-directory', outdir, '-w', wfile, idf]
+
+# One simulation handled by the supervisor
+class SimRun:
+	def __init__(self, i, sim, wfile):
+		self.i = i
+		self.sim = sim
+		self.wfile = wfile
+		self.outdir = remExt(sim,'.idf')
+		# Folder EnergyPlus writes to, set by launch() (see Scratch runs)
+		self.rundir = self.outdir
+		# Inputs EnergyPlus reads and the folder it runs in (None = the current one); staged copies if set by InputStage
+		self.runidf = sim
+		self.runwfile = wfile
+		self.runcwd = None
+		# .idf the run history is kept under: the simulation itself, or the template of a sweep variant
+		self.model = sim
+		# Run time in seconds of the last run
+		self.runtime = None
+		# Runs of the simulation .idf so far, and of the failsafe .idf
+		self.attempts = 0
+		self.failsafe_runs = 0
+		self.proc = None
+		self.simlog = None
+		self.watch = None
+		self.returncode = None
+		# Return code of the last run of the simulation itself (not the failsafe)
+		self.simreturncode = None
+		# Run the failsafe .idf on the next launch
+		self.failsafe_next = False
+		# Kind of the last failure, reruns so far for each kind, and earliest time for the next rerun
+		self.failclass = None
+		self.reruns = {}
+		self.notbefore = 0
+		# Why the last run was killed by the watchdog ('' = it was not), and when its outputs last grew
+		self.timedout = ''
+		self.lastsizes = None
+		self.lastgrowth = 0
+		self.lastcheck = 0
+		# Peak memory (MB) expected from the run history, and highest seen in the current run
+		self.expectedmem = default_peak_mem_mb
+		self.peakmem = None
+		self.lastmemcheck = 0
+		# Cache key, and later rows of the batch with the same key that get this simulation's result
+		self.cachekey = None
+		self.duplicates = []
+		# When a cluster worker claimed the simulation (see epml_cluster.runWorker())
+		self.started = None
+
+	# Start EnergyPlus for this simulation, or for the failsafe .idf if failsafe is True
+	# Console output goes to epml_stdout.log in the output directory (see SimLog); reruns are appended to it.
+	# Returns: True if the process started
+	def launch(self, settings, failsafe=False):
+		idf = self.runidf
+		if failsafe:
+			idf = settings['failsafe']
+			self.failsafe_runs = self.failsafe_runs + 1
+		else:
+			self.attempts = self.attempts + 1
+		firstlaunch = self.attempts + self.failsafe_runs == 1
+		if firstlaunch:
+			self.rundir = runDir(settings, self)
+		if self.runcwd is None:
+			runcmd = buildRunCmd(settings['ep_dir'], self.rundir, self.runwfile, idf, runFlags(settings))
+		else:
+			# Started in another folder, so every path is made absolute (ep_dir only if it is not found on the PATH)
+			ep_dir = settings['ep_dir']
+			if os.path.exists(ep_dir):
+				ep_dir = os.path.abspath(ep_dir)
+			runcmd = buildRunCmd(ep_dir, os.path.abspath(self.rundir), os.path.abspath(self.runwfile), os.path.abspath(idf), runFlags(settings))
+		print(subprocess.list2cmdline(runcmd))
+		try:
+			# A scratch folder left over from an earlier batch is started over
+			if firstlaunch and self.rundir != self.outdir:
+				shutil.rmtree(self.rundir, ignore_errors=True)
+			if not os.path.exists(self.rundir):
+				os.makedirs(self.rundir)
+			elif firstlaunch:
+				unlinkShared(self.rundir)
+			self.proc = subprocess.Popen(runcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.runcwd, **popenGroup())
+		except (IOError, OSError) as e:
+			print('ERROR: Could not start EnergyPlus for ', self.sim, ': ', e)
+			self.proc = None
+			return False
+		firstrun = self.attempts == 1 and self.failsafe_runs == 0
+		self.simlog = SimLog(self.proc.stdout, os.path.join(self.rundir, stdout_name), settings['log_max_kb'] * 1024, settings['log_backups'], not firstrun)
+		# A rerun's watch starts after the earlier attempts' output, or their 'Starting Simulation' line would end its
+		# warmup at once and release the next launch
+		self.watch = ProgressWatch(self.rundir, self.proc, self.simlog.start)
+		self.timedout = ''
+		self.lastsizes = None
+		self.lastgrowth = self.watch.launched
+		self.lastcheck = 0
+		self.peakmem = None
+		self.lastmemcheck = 0
+		return True
+
+	# Read the peak memory of the running EnergyPlus process every mem_check_time seconds
+	def checkMemory(self):
+		now = time.time()
+		if now - self.lastmemcheck < mem_check_time:
+			return
+		self.lastmemcheck = now
+		mem = processMemoryMB(self.proc.pid, 'VmHWM')
+		if mem is not None and (self.peakmem is None or mem > self.peakmem):
+			self.peakmem = mem
+
+	# Watchdog: check a running simulation against the wall-clock timeout, and for stalls, where none of eplusout.eso,
+	# eplusout.err, and epml_stdout.log have changed size for stall_min minutes (e.g. stuck in an HVAC iteration loop)
+	# Input: settings = settings dictionary
+	# Returns: '' if the run is fine, else why it should be killed
+	def overdue(self, settings):
+		now = time.time()
+		if settings['timeout_min'] > 0 and now - self.watch.launched > settings['timeout_min'] * 60:
+			return 'timed out after ' + str(settings['timeout_min']) + ' min'
+		if settings['stall_min'] <= 0 or now - self.lastcheck < stall_check_time:
+			return ''
+		self.lastcheck = now
+		sizes = []
+		for name in ['eplusout.eso', 'eplusout.err', stdout_name]:
+			try:
+				sizes.append(os.path.getsize(os.path.join(self.rundir, name)))
+			except (OSError):
+				sizes.append(-1)
+		if sizes != self.lastsizes:
+			self.lastsizes = sizes
+			self.lastgrowth = now
+		elif now - self.lastgrowth > settings['stall_min'] * 60:
+			return 'stalled, no output for ' + str(settings['stall_min']) + ' min'
+		return ''
+
+# Failure classes =============================================================================================
+# A failed simulation is only worth rerunning if the failure might not happen again. After each failure the end of
+# the .err file is read and the failure is put in one of these classes, each with its own rerun budget and backoff:
+#	transient = warmup convergence anomalies, the reason the old run_TEMPLATE.py reran everything (retries, backoff)
+#	input = any other Severe/Fatal error in the .idf; rerunning gives the same error (retries_input, backoff_input)
+#	infra = EnergyPlus did not write an .err file for this run (missing .idf/.epw/output folder, exit code 1 from the
+#		command line checks) or it died without a fatal error (killed, out of memory) (retries_infra, backoff_infra)
+#	timeout = killed by the watchdog for running too long or stalling (retries_timeout, backoff_timeout)
+
+failure_transient = 'transient'
+failure_input = 'input'
+failure_infra = 'infra'
+failure_timeout = 'timeout'
+
+# Settings keys of the rerun budget and backoff of each class
+failure_settings = {failure_transient: ['retries', 'backoff'], failure_input: ['retries_input', 'backoff_input'], failure_infra: ['retries_infra', 'backoff_infra'], failure_timeout: ['retries_timeout', 'backoff_timeout']}
+
+# Text in a Severe or Fatal line of the .err that marks a warmup anomaly (lower case)
+transient_markers = ['warmup', 'did not converge']
+# Bytes read from the end of the .err file; severe and fatal errors are always near the end
+err_tail = 262144
+
+# Classify why a simulation failed
+# Input: r = SimRun whose last run ended with a non-zero return code
+# Returns: failure_transient, failure_input, or failure_infra
+def classifyFailure(r):
+	errfile = os.path.join(r.rundir, 'eplusout.err')
+	try:
+		# An .err file left over from an earlier run does not count
+		if r.watch is None or os.path.getmtime(errfile) < r.watch.launched:
+			return failure_infra
+		with open(errfile, 'rb') as f:
+			f.seek(max(0, os.path.getsize(errfile) - err_tail))
+			tail = f.read().decode('utf-8', 'replace').lower()
+	except (IOError, OSError):
+		return failure_infra
+	errors = [line for line in tail.splitlines() if '** severe  **' in line or '**  fatal  **' in line]
+	if len(errors) == 0:
+		return failure_infra
+	for line in errors:
+		for marker in transient_markers:
+			if marker in line:
+				return failure_transient
+	return failure_input
+
+# Decide what to do after a simulation's process ended
+# Input: r = SimRun, settings = settings dictionary
+# Returns: 'ok', 'retry', 'failsafe', or 'failed'. For 'retry', r.notbefore is set to when the rerun may start.
+def nextStep(r, settings):
+	if r.returncode == 0:
+		if r.failsafe_runs > 0:
+			print(r.sim, ' failsafe only success!')
+			return status_failed
+		return status_ok
+	# Could not even start EnergyPlus: rerunning will not help
+	if r.proc is None:
+		r.failclass = failure_infra
+		return status_failed
+	if r.failsafe_runs == 0:
+		if len(r.timedout) > 0:
+			r.failclass = failure_timeout
+		else:
+			r.failclass = classifyFailure(r)
+		retrykey, backoffkey = failure_settings[r.failclass]
+		n = r.reruns.get(r.failclass, 0)
+		if n < settings[retrykey]:
+			r.reruns[r.failclass] = n + 1
+			wait = settings[backoffkey] * 2 ** n
+			r.notbefore = time.time() + wait
+			print('Warning: ', r.sim, ' failed (', r.failclass, ') -> rerunning in ', wait, ' s')
+			return 'retry'
+	failsafe = settings['failsafe']
+	if r.failsafe_runs < failsafe_attempts and len(failsafe) > 0 and os.path.isfile(failsafe):
+		print('ERROR: ', r.sim, ' failed (', r.failclass, '), running failsafe to protect overall simulation.')
+		return 'failsafe'
+	if r.failclass == failure_timeout:
+		return status_timeout
+	return status_failed
+
+# Check the inputs of a batch before it starts (see epml_idf.validateIdf()) and print the problems found
+# Input: sims2run, wfiles = lists of strings, settings = settings dictionary
+# Returns: dictionary of index -> list of problems, only for simulations that cannot run; empty if validate is off
+def checkInputs(sims2run, wfiles, settings):
+	if not settings['validate']:
+		return {}
+	invalid, warned = validateMany(sims2run, wfiles, settings['ep_dir'], not settings['readvars'])
+	for i in sorted(invalid):
+		print('ERROR: Not running ', sims2run[i], ': ', '; '.join(invalid[i]))
+	for i in sorted(warned):
+		print('WARNING: ', sims2run[i], ': ', '; '.join(warned[i]))
+	return invalid
+
+# A simulation under the supervisor has its final status (and its outputs are in its output folder): report and
+# record it, and give its result to the cache, duplicate rows, output retention, and postprocessing hooks
+# Input: r = SimRun, status = final status, history = RunHistory, cache = ResultCache or None, retention =
+#	OutputRetention or None, events = progress queue, copy = see finishCached(), sweep = Sweep whose variant .idf is
+#	deleted now, or None, hooks = SimHooks or None
+# Returns: number of rows that failed, this simulation and its duplicates
+def finishRun(r, status, history, cache, retention, events, copy=True, sweep=None, hooks=None):
+	report(events, r.i, r.sim, status, r.simreturncode)
+	if status == status_ok:
+		history.record(r.model, r.runtime, r.peakmem)
+	if sweep is not None:
+		sweep.remove(r.i)
+	failed = finishCached(r, status, cache, events, copy)
+	# Hooks clean up each folder themselves before they run (see Simulation hooks)
+	if status == status_ok and hooks is not None:
+		hooks.submit(r, retention)
+	elif status == status_ok and retention is not None:
+		retention.submit([r.outdir] + [d.outdir for d in r.duplicates])
+	if status == status_ok or status == status_cancelled:
+		return failed
+	if r.failclass == failure_infra:
+		print('ERROR: EnergyPlus could not run ', r.sim, ', check the EnergyPlus, output-directory, weather, and sim filepaths')
+	elif r.failclass == failure_input:
+		print('ERROR: Simulation ', r.sim, ' has input errors, check .err file!')
+	elif r.failclass == failure_timeout:
+		print('ERROR: Simulation ', r.sim, ' was killed by the watchdog, check .err file and timeout settings!')
+	else:
+		print('WARNING: Simulation ', r.sim, ' has errors, check .err file!')
+	return failed + 1
+
+# Run simulations under the supervisor
+# Input:
+#	sims2run and wfiles are lists of strings
+#	settings = settings dictionary from loadSettings()
+#	maxjobs = most simulations running at once
+#	events, cancel = optional progress queue and cancel event
+#	usecache = reuse unchanged results from the cache and run duplicate rows once (see Result cache)
+#	longestfirst = start the simulations expected to take longest first (see Run history)
+#	admit = hold launches while the machine has no room for them (see Admission control)
+#	sweep = epml_sweep.Sweep if sims2run are its variants, or None. Each variant is written just before its first
+#		launch and deleted once it is done. The variants are not on disk beforehand, so they are not checked one by
+#		one (the sweep checks its template) and the result cache is not used. Run time estimates and the run history
+#		use the template, so every variant is estimated from the template's runs and the history gets one row per
+#		sweep instead of one per temporary variant.
+#		With a stage folder, each variant's inputs are staged right after it is written.
+# Returns: True if every simulation returned 0 or was cached and every postprocessing hook worked, else False
+def run_ep_supervised(sims2run,wfiles,settings,maxjobs,events=None,cancel=None,usecache=False,longestfirst=False,sweep=None,admit=True):
+	dtime = settings['dtime']
+	try:
+		hooks = startHooks(settings)
+	except Exception as e:
+		print('ERROR: Cannot load postprocessing hook ', settings['sim_hook_python'], ': ', e)
+		return False
+
+	# Queue of SimRun, skipping blank entries
+	pending = deque(SimRun(i,sim,wfile) for i,(sim,wfile) in enumerate(zip(sims2run,wfiles)) if not len(sim) == 0)
+	numSims = len(pending)
+	print("Queued ", numSims, " E+ sims, running up to ", maxjobs, " at once:")
+	for r in pending:
+		report(events, r.i, r.sim, status_queued)
+	invalid = {}
+	if sweep is None:
+		invalid = checkInputs(sims2run, wfiles, settings)
+	for r in pending:
+		if r.i in invalid:
+			report(events, r.i, r.sim, status_invalid)
+	pending = deque(r for r in pending if r.i not in invalid)
+	if sweep is not None:
+		for r in pending:
+			r.model = sweep.template
+	cache = None
+	retention = startRetention(settings)
+	# With a scratch folder, finished simulations are written back before their status is reported (see Scratch runs)
+	writeback = startWriteBack(settings, retention)
+	if usecache and sweep is None:
+		cache, torun = checkCache(list(pending), settings, events, retention)
+		pending = deque(torun)
+	history = RunHistory(settings['history_file'])
+	admission = None
+	if admit:
+		admission = Admission(settings, history)
+	stage = startStage(settings)
+	# Sweep variants are staged as they are written
+	if stage is not None and sweep is None:
+		stage.stageRuns(list(pending))
+	if len(pending) > 0:
+		estimates, known = estimateRuntimes([r.model for r in pending], history)
+		# Longest first, so a long simulation does not start last and leave the other slots idle at the end.
+		# sorted() keeps the original order for equal estimates, e.g. when nothing has run before.
+		if longestfirst:
+			pending = deque(r for t, r in sorted(zip(estimates, pending), key=lambda x: -x[0]))
+		print('Predicted makespan: ', round(predictMakespan(estimates, maxjobs) / 60, 1), ' min (', known, ' of ', len(estimates), ' simulations have run before)')
+
+	running = []
+	# Reruns waiting for their backoff time
+	waiting = []
+	# Progress of the most recently launched simulation, for launch pacing
+	watch = None
+	errorcount = len(invalid)
+	worked = len(invalid) == 0
+
+	while len(pending) > 0 or len(running) > 0 or len(waiting) > 0 or (writeback is not None and writeback.busy()):
+		# Cancelled: stop everything that is running and drop the rest of the queue
+		if cancelled(cancel):
+			for r in running:
+				killProcess(r.proc)
+				r.simlog.close()
+				if writeback is None:
+					report(events, r.i, r.sim, status_cancelled, r.proc.returncode)
+					finishCached(r, status_cancelled, cache, events)
+					if sweep is not None:
+						sweep.remove(r.i)
+				else:
+					# The outputs of killed runs still go back, e.g. for their .err files
+					writeback.submit(r, status_cancelled)
+			if writeback is not None:
+				for r, step in writeback.finish():
+					finishRun(r, step, history, None, None, events, False, sweep)
+			for r in list(pending) + waiting:
+				report(events, r.i, r.sim, status_cancelled)
+				finishCached(r, status_cancelled, cache, events)
+				# Reruns waiting for their backoff time were written before their first launch
+				if sweep is not None:
+					sweep.remove(r.i)
+			print('Batch cancelled!')
+			history.save()
+			if hooks is not None:
+				hooks.finish(True)
+			if stage is not None:
+				stage.finish()
+			if retention is not None:
+				retention.finish()
+			if cache is not None:
+				cache.finish()
+			return False
+
+		# Collect any simulations that have finished and free their slots
+		for r in running[:]:
+			rc = r.proc.poll()
+			if rc is None:
+				r.checkMemory()
+				r.timedout = r.overdue(settings)
+				if len(r.timedout) == 0:
+					continue
+				print('ERROR: ', r.sim, ' ', r.timedout, ', killing it')
+				killProcess(r.proc)
+				rc = r.proc.returncode
+			r.simlog.close()
+			running.remove(r)
+			r.returncode = rc
+			if not r.failsafe_next:
+				r.simreturncode = rc
+			print(r.sim, " returned: ", rc)
+			step = nextStep(r, settings)
+			# Reruns go to the front of the queue so they start as soon as there is a free slot, after any backoff
+			if step == 'retry' or step == 'failsafe':
+				r.failsafe_next = step == 'failsafe'
+				if step == 'retry' and r.notbefore > time.time():
+					waiting.append(r)
+				else:
+					pending.appendleft(r)
+				continue
+			r.runtime = time.time() - r.watch.launched
+			if writeback is not None:
+				writeback.submit(r, step, cache)
+				continue
+			failed = finishRun(r, step, history, cache, retention, events, True, sweep, hooks)
+			errorcount = errorcount + failed
+			worked = worked and failed == 0
+		if writeback is not None:
+			# Cache, duplicates and retention were handled by the write-back
+			for r, step in writeback.collect():
+				failed = finishRun(r, step, history, None, None, events, False, sweep, hooks)
+				errorcount = errorcount + failed
+				worked = worked and failed == 0
+
+		for r in waiting[:]:
+			if r.notbefore <= time.time():
+				waiting.remove(r)
+				pending.appendleft(r)
+
+		# Fill free slots from the front of the queue, one warmup at a time, while the machine has room
+		while len(pending) > 0 and len(running) < maxjobs and paceReady(watch, dtime) and (admission is None or admission.admit(pending[0], running)):
+			r = pending.popleft()
+			if admission is not None:
+				r.expectedmem = admission.expectedMemory(r)
+			if sweep is not None and r.attempts + r.failsafe_runs == 0:
+				if not sweep.write(r.i):
+					report(events, r.i, r.sim, status_failed)
+					errorcount = errorcount + 1
+					worked = False
+					continue
+				# The variant's weather and Schedule:File inputs, staged from where the template finds them
+				if stage is not None:
+					stage.stageRuns([r])
+				# Relative file names in the template are found from the template's folder
+				r.runcwd = os.path.dirname(sweep.template)
+			if not r.launch(settings, r.failsafe_next):
+				if sweep is not None:
+					sweep.remove(r.i)
+				report(events, r.i, r.sim, status_failed)
+				errorcount = errorcount + 1 + finishCached(r, status_failed, cache, events)
+				worked = False
+				continue
+			running.append(r)
+			watch = r.watch
+			report(events, r.i, r.sim, status_running)
+
+		if len(running) > 0 or len(waiting) > 0 or len(pending) > 0 or (writeback is not None and writeback.busy()):
+			time.sleep(pool_poll_time)
+
+	history.save()
+	if writeback is not None:
+		writeback.finish()
+	if hooks is not None and not hooks.finish():
+		worked = False
+	if stage is not None:
+		stage.finish()
+	if retention is not None:
+		retention.finish()
+	if cache is not None:
+		cache.finish()
+	print("Done running simulations! ", numSims - errorcount, " of ", numSims, " succeeded.\n")
+
+	return worked
+
+# Run simulations one at a time, waiting for each to finish before starting the next
+# Same as the original series mode: no reruns or failsafe.
+# Input/Returns: same as run_ep_supervised()
+def run_ep_series(sims2run,wfiles,settings,events=None,cancel=None,sweep=None):
+	seriessettings = dict(settings)
+	for retrykey, backoffkey in failure_settings.values():
+		seriessettings[retrykey] = 0
+	seriessettings['failsafe'] = ''
+	seriessettings['dtime'] = 0
+	return run_ep_supervised(sims2run,wfiles,seriessettings,1,events,cancel,settings['use_cache'],sweep=sweep)
+
+# Run all simulations in parallel
+# Every simulation is started, one warmup at a time, without waiting for earlier ones to finish.
+# Needed for co-simulation where all models must run at the same time, so the result cache and admission control are
+# never used here.
+# Input/Returns: same as run_ep_supervised()
+def run_ep_parallel(sims2run,wfiles,settings,events=None,cancel=None,sweep=None):
+	return run_ep_supervised(sims2run,wfiles,settings,max(1,len(sims2run)),events,cancel,sweep=sweep,admit=False)
+
+# Get the number of simulations allowed to run at once in pool mode
+# Input: n = jobs setting; 0 or less means use every CPU core
+# Returns: int >= 1
+def getMaxJobs(n):
+	if n > 0:
+		return n
+	# os.cpu_count() can return None on some platforms
+	cores = os.cpu_count()
+	if cores is None:
+		return 1
+	return cores
+
+# Seconds between checks for finished simulations. Small enough that a freed slot is refilled almost
+# immediately, large enough that polling does not use a noticeable amount of CPU.
+pool_poll_time = 0.5
+
+# Run simulations through a bounded worker pool
+# Keeps at most getMaxJobs(settings['jobs']) EnergyPlus processes running at once and starts the next queued simulation
+# as soon as one finishes, so throughput is limited by the number of cores instead of a fixed wait time.
+# Input/Returns: same as run_ep_supervised()
+def run_ep_pool(sims2run,wfiles,settings,events=None,cancel=None,sweep=None):
+	return run_ep_supervised(sims2run,wfiles,settings,getMaxJobs(settings['jobs']),events,cancel,settings['use_cache'],settings['longest_first'],sweep)
+
+# Batch journal ==============================================================================================
+# Every batch started from the GUI or command line keeps an append-only journal (settings['journal']) so it can be
+# resumed after the launcher crashes, the computer restarts, or the window is closed part way through. The journal
+# starts with the run mode and the settings that change the outputs (journal_settings) and the list of simulations in
+# the batch, then has one short line per status change:
+#	<index>,<status>,<return code>
+# Each line is flushed and fsynced as it is written so no status is lost. The lines are only a few bytes and 'queued'
+# is implied by the list at the top, so this stays cheap even for tens of thousands of simulations.
+# Resuming runs every simulation whose last status is not ok or cached again, with the journal's settings unless the
+# user set them for the resume (so e.g. a parallel co-simulation batch is not resumed in series by accident), and adds
+# to the same journal. The EnergyPlus folder is not recorded: it only locates the program, can move between runs, and
+# the result cache already keys on the EnergyPlus version.
+
+journal_version = ['epml-journal', '2']
+# Journals written before the settings were recorded; they are resumed with the current settings
+journal_old_versions = [['epml-journal', '1']]
+# Settings recorded in the journal and used again when the batch is resumed
+journal_settings = ['sp', 'readvars', 'failsafe']
+
+# Writes the journal and passes each progress event on to another queue (e.g. the GUI's)
+class BatchJournal:
+	# Input:
+	#	path = journal file, blank = no journal (events are just passed on)
+	#	sims2run, wfiles = the batch, to start a new journal. Leave as None to add to an existing journal when resuming.
+	#	events = optional queue.Queue that also receives every event
+	#	settings = settings dictionary of the batch, recorded when starting a new journal (see journal_settings)
+	def __init__(self, path, sims2run=None, wfiles=None, events=None, settings=None):
+		self.events = events
+		self.file = None
+		if len(path) == 0:
+			return
+		try:
+			if sims2run is None:
+				self.file = open(path, 'a', newline='')
+				self.write([['resume', round(time.time())]])
+			else:
+				self.file = open(path, 'w', newline='')
+				rows = [journal_version, ['batch', round(time.time()), len(sims2run)]]
+				if settings is not None:
+					rows.append(['settings'] + [x for key in journal_settings for x in [key, settings[key]]])
+				rows.extend(['sim', i, sim, wfile] for i, (sim, wfile) in enumerate(zip(sims2run, wfiles)))
+				rows.append(['start'])
+				self.write(rows)
+		except (IOError, OSError) as e:
+			print('WARNING: Cannot write batch journal ', path, ', this batch cannot be resumed: ', e)
+			self.close()
+
+	def write(self, rows):
+		csv.writer(self.file).writerows(rows)
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	# Same as queue.Queue.put(), so it can be passed to run_ep() as events
+	def put(self, event):
+		i, sim, status, rc = event
+		if self.file is not None and status != status_queued:
+			try:
+				self.write([[i, status, '' if rc is None else rc]])
+			except (IOError, OSError, ValueError) as e:
+				print('WARNING: Batch journal stopped: ', e)
+				self.close()
+		if self.events is not None:
+			self.events.put(event)
+
+	def close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+# Read a batch journal
+# Input: path = journal file
+# Returns: [list of .idf paths, list of .epw paths, dictionary of index -> last status, dictionary of the recorded
+#	journal_settings as strings (empty for older journals)]
+# Raises ValueError if it is not a journal or the list of simulations was not completely written
+def readJournal(path):
+	idfs = []
+	epws = []
+	states = {}
+	saved = {}
+	started = False
+	known = [status_running, status_ok, status_failed, status_cancelled, status_cached, status_timeout, status_invalid]
+	with open(path, newline='') as f:
+		rows = csv.reader(f)
+		if next(rows, None) not in [journal_version] + journal_old_versions:
+			raise ValueError(path + ' is not a MultiLaunch batch journal')
+		for row in rows:
+			if len(row) == 0:
+				continue
+			if row[0] == 'settings' and not started:
+				saved = dict(zip(row[1::2], row[2::2]))
+			elif row[0] == 'sim' and len(row) == 4:
+				idfs.append(row[2])
+				epws.append(row[3])
+			elif row[0] == 'start':
+				started = True
+			# Skip a line cut off by a crash while it was being written
+			elif len(row) == 3 and row[0].isdigit() and row[1] in known:
+				states[int(row[0])] = row[1]
+	if not started:
+		raise ValueError(path + ' is incomplete, the batch never started')
+	return [idfs, epws, states, saved]
+
+# Get the simulations of a journaled batch that still need to run, and the settings to run them with
+# Input: path = journal file, settings = current settings dictionary, explicit = keys of journal_settings the user set
+#	for this resume (e.g. a command line flag), which keep their current value
+# Returns: [list of .idf paths, list of .epw paths, settings] for the whole batch, with finished simulations blanked out
+#	so progress events keep the same index as in the original batch. settings is a copy of the current settings with
+#	the journal's value of each journal_settings key not in explicit.
+# Raises ValueError if there is nothing to resume, IOError/OSError if the journal cannot be read
+def resumeList(path, settings, explicit=()):
+	idfs, epws, states, saved = readJournal(path)
+	runsettings = dict(settings)
+	if len(saved) == 0:
+		print('WARNING: ', path, ' does not record the settings of its batch, resuming with the current ones')
+	kinds = {f[0]: f[3] for f in setting_fields}
+	for key, value in saved.items():
+		if key not in journal_settings:
+			continue
+		if kinds[key] == 'int':
+			value = int(value)
+		elif kinds[key] == 'bool':
+			value = 'T' in value
+		if value == settings[key]:
+			continue
+		if key in explicit:
+			print('WARNING: Resuming with ', key, ' = ', settings[key], ' as set, the batch was started with ', value)
+		else:
+			print('WARNING: Resuming with the batch\'s ', key, ' = ', value, ', not the current ', settings[key])
+			runsettings[key] = value
+	done = 0
+	for i in range(len(idfs)):
+		if states.get(i) in [status_ok, status_cached]:
+			idfs[i] = ''
+			done = done + 1
+	if done == len(idfs):
+		raise ValueError('Every simulation in the last batch already finished, nothing to resume')
+	print('Resuming batch: ', done, ' of ', len(idfs), ' simulations already finished')
+	return [idfs, epws, runsettings]
+
+# Run a batch using the current series/parallel/pool setting
+# Input:
+#	sims2run and wfiles are lists of strings
+#	settings = settings dictionary from loadSettings()
+#	events = optional queue.Queue that receives progress events
+#	cancel = optional threading.Event, set it to cancel the batch
+#	sweep = epml_sweep.Sweep if sims2run are its variants, or None
+# Returns: True if all simulations succeeded, else False
+def run_ep(sims2run,wfiles,settings,events=None,cancel=None,sweep=None):
+	if settings['aggregate']:
+		events = StatusRecorder(events)
+	sp = settings['sp']
+	if sp == 'parallel':
+		print('run parallel')
+		worked = run_ep_parallel(sims2run,wfiles,settings,events,cancel,sweep)
+	elif sp == 'pool':
+		print('run pool')
+		worked = run_ep_pool(sims2run,wfiles,settings,events,cancel,sweep)
+	else:
+		print('run series')
+		worked = run_ep_series(sims2run,wfiles,settings,events,cancel,sweep)
+	if settings['aggregate'] and not cancelled(cancel):
+		aggregateResults(events.succeeded(sims2run), settings)
+	return worked
+
+# Passes progress events on (if there is a queue) and keeps the last status of each simulation
+class StatusRecorder:
+	def __init__(self, events=None):
+		self.events = events
+		self.states = {}
+
+	def put(self, event):
+		self.states[event[0]] = event[2]
+		if self.events is not None:
+			self.events.put(event)
+
+	# Returns: the .idf paths that finished ok or were restored from the cache
+	def succeeded(self, sims2run):
+		return [sims2run[i] for i in sorted(self.states) if self.states[i] in [status_ok, status_cached]]
+
+# Combine the outputs of a batch into the results store (settings['results_store'], see epml_results.py)
+# Runs epml_results.py as its own process, which parses the CSV files in a pool of getMaxJobs(jobs) processes.
+# Output folders whose eplusout.err does not say EnergyPlus completed successfully are skipped.
+# Input: sims2run = list of .idf paths of successful simulations, settings = settings dictionary
+# Returns: True if the store was written
+def aggregateResults(sims2run, settings):
+	if not settings['readvars']:
+		print('WARNING: Not combining outputs into ', settings['results_store'], ': readvars is off, so there are no CSV files. Use epml_results.querySql() or "python -m epml query" on the eplusout.sql files instead.')
+		return False
+	outdirs = []
+	seen = set()
+	for sim in sims2run:
+		outdir = remExt(sim, '.idf')
+		if not len(sim) == 0 and outdir not in seen:
+			seen.add(outdir)
+			outdirs.append(outdir)
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'epml_results.py')
+	cmd = [sys.executable, script, '--store', settings['results_store'], '--columns', settings['results_columns'], '--jobs', str(getMaxJobs(settings['jobs']))]
+	try:
+		done = subprocess.run(cmd, input='\n'.join(outdirs), capture_output=True, text=True)
+	except (OSError) as e:
+		print('ERROR: Cannot combine outputs: ', e)
+		return False
+	print(done.stdout)
+	if not done.returncode == 0:
+		print('ERROR: Combining outputs into ', settings['results_store'], ' failed: ', done.stderr)
+		return False
+	return True
+
+# Pre/postprocessing =========================================================================================
+# The preprocessing code runs before a batch, and the postprocessing code after it only if every simulation worked.
+# Each box of code is written to a temporary script and run whole by its own process: the console code by one Bash
+# shell (cmd.exe on Windows), so variables and cd carry over from line to line, and the Python code by another Python
+# interpreter, with the settings dictionary as `settings`. User code then cannot block, crash, or use up the memory of
+# the launcher. The output is passed on to the log as it is printed. A script still running after code_timeout_min
+# minutes, or when the batch is cancelled, is killed along with everything it started. The Python code only runs if
+# the console code exited with 0.
+
+# Runs the Python code in the script process: python -c code_runner <script .py> <settings .json>
+code_runner = "import json, sys\nsettings = json.load(open(sys.argv[2]))\nexec(compile(open(sys.argv[1]).read(), sys.argv[1], 'exec'), {'__name__': '__main__', 'settings': settings})"
+# Seconds between checks for timeout and cancel while a script runs
+code_poll_time = 0.5
+
+# Returns: Python interpreter for the Python code; when running as a packaged executable, sys.executable is the
+# launcher itself, so the python on the PATH is used
+def pythonExecutable():
+	if getattr(sys, 'frozen', False):
+		return shutil.which('python') or shutil.which('python3') or 'python'
+	return sys.executable
+
+# Print a script's output line by line as it is printed; runs on its own thread
+def passOutput(pipe):
+	for line in pipe:
+		print(line.decode(errors='replace').rstrip('\r\n'))
+	pipe.close()
+
+# Run one box of pre/postprocessing code as a script in its own process
+# Input:
+#	name = what the code is, for the log
+#	cmd = command line to run the script with, the script path is added to the end, then args
+#	code = the script, suffix = its file extension
+#	timeout = minutes before it is killed (0 = no limit), cancel = cancel event or None
+# Returns: True if it exited with 0; True if there is no code
+def runScript(name, cmd, code, suffix, timeout, cancel=None, args=()):
+	if len(code.strip()) == 0:
+		return True
+	fd, path = tempfile.mkstemp(prefix='epml_', suffix=suffix)
+	try:
+		with os.fdopen(fd, 'w') as f:
+			f.write(code + '\n')
+		print('Run ', name, ' >> ', path)
+		try:
+			p = subprocess.Popen(cmd + [path] + list(args), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **popenGroup())
+		except (OSError) as e:
+			print('ERROR: Cannot run ', name, ': ', e)
+			return False
+		reader = threading.Thread(target=passOutput, args=(p.stdout,), daemon=True)
+		reader.start()
+		start = time.time()
+		stopped = ''
+		try:
+			while p.poll() is None:
+				if cancelled(cancel):
+					stopped = 'cancelled'
+				elif timeout > 0 and time.time() - start > timeout * 60:
+					stopped = 'killed after ' + str(timeout) + ' min'
+				if len(stopped) > 0:
+					killProcess(p)
+					break
+				try:
+					p.wait(code_poll_time)
+				except (subprocess.TimeoutExpired):
+					pass
+		except (BaseException):
+			# e.g. Ctrl+C on the command line; the script is in its own process group, so it would not get it
+			killProcess(p)
+			raise
+		reader.join()
+	finally:
+		os.remove(path)
+	if len(stopped) > 0:
+		print('ERROR: ', name, ' was ', stopped)
+		return False
+	if not p.returncode == 0:
+		print('ERROR: ', name, ' exited with status ', p.returncode)
+		return False
+	return True
+
+# Run the console code and then the Python code of one pre/postprocessing step
+# Input: name = 'Preprocessing' or 'Postprocessing', code, codepy = console and Python code, settings = settings
+#	dictionary, cancel = cancel event or None
+# Returns: True if both worked
+def runCode(name, code, codepy, settings, cancel=None):
+	if os.name == 'nt':
+		shell = ['cmd', '/c']
+		suffix = '.bat'
+	else:
+		shell = [shutil.which('bash') or '/bin/sh']
+		suffix = '.sh'
+	if not runScript(name + ' console code', shell, code, suffix, settings['code_timeout_min'], cancel):
+		return False
+	if len(codepy.strip()) == 0:
+		return True
+	fd, settingsfile = tempfile.mkstemp(prefix='epml_settings_', suffix='.json')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(settings, f)
+		return runScript(name + ' Python code', [pythonExecutable(), '-c', code_runner], codepy, '.py', settings['code_timeout_min'], cancel, [settingsfile])
+	finally:
+		os.remove(settingsfile)
+
+# Run preprocessing code
+# Returns: True if it worked; the batch should not start if not
+def runBefore(settings, cancel=None):
+	return runCode('Preprocessing', settings['precode'], settings['precodepy'], settings, cancel)
+
+# Run postprocessing code
+# Returns: True if it worked; the batch counts as failed if not
+def runAfter(settings, cancel=None):
+	return runCode('Postprocessing', settings['postcode'], settings['postcodepy'], settings, cancel)
@@ -0,0 +1,392 @@
+# epml_idf.py
+# EnergyPlus MultiLaunch IDF Scanner
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Reads .idf files without EnergyPlus: counts the objects in each model and pulls out the few fields MultiLaunch needs,
+# then checks for problems that would stop EnergyPlus and estimates how long each model will take to simulate. Used by
+# the engine to skip broken models and order batches, and by the GUI to show both before a batch starts.
+# Does not import tkinter.
+
+
+# Import
+import argparse
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# Scanning ===================================================================================================
+# An .idf is a list of objects; each object is comma separated fields ending in ';' and '!' starts a comment. The scan
+# reads the file as bytes, drops comments, and splits it into objects, which is fast enough for very large folders.
+# Only the class name of most objects is looked at. Results are kept in scan_memo for files that have not changed.
+
+comment_re = re.compile(rb'![^\n]*')
+
+# Objects whose fields are kept, lower case
+keep_classes = ['version', 'timestep', 'runperiod', 'output:variable', 'output:meter', 'output:meter:meteronly', 'schedule:file']
+
+# (absolute path, size, modified time) -> summary, so files are only scanned again when they change
+scan_memo = {}
+
+# Scan one .idf file
+# Input: path = .idf file
+# Returns: summary dictionary:
+#	counts = {lower case class name: number of objects}
+#	objects = {class name in keep_classes: list of objects, each a list of field strings (without the class name)}
+#	unterminated = text after the last ';' that is not a comment, '' if none (an object missing its ';')
+# Raises IOError/OSError if the file cannot be read
+def scanIdf(path):
+	st = os.stat(path)
+	memokey = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+	if memokey in scan_memo:
+		return scan_memo[memokey]
+	with open(path, 'rb') as f:
+		data = f.read()
+	data = comment_re.sub(b'', data)
+	parts = data.split(b';')
+	counts = {}
+	objects = {}
+	for part in parts[:-1]:
+		head = part.split(b',', 1)
+		name = head[0].strip().lower().decode('latin-1')
+		if len(name) == 0:
+			continue
+		counts[name] = counts.get(name, 0) + 1
+		if name in keep_classes:
+			fields = []
+			if len(head) > 1:
+				fields = [x.strip().decode('latin-1') for x in head[1].split(b',')]
+			objects.setdefault(name, []).append(fields)
+	summary = {'counts': counts, 'objects': objects, 'unterminated': parts[-1].strip().decode('latin-1')[:80]}
+	scan_memo[memokey] = summary
+	return summary
+
+# Threads used by mapChunks(), and most items handed to each thread at once; one item at a time costs more in thread
+# handoffs than the work for small files, but chunks are kept small enough that every thread gets several of them
+scan_threads = 8
+max_chunk_size = 256
+
+# Call f on every item on a few threads, a chunk of items at a time
+# Returns: list of results in the same order as items
+def mapChunks(f, items):
+	size = max(1, min(max_chunk_size, math.ceil(len(items) / (scan_threads * 4))))
+	chunks = [items[n:n + size] for n in range(0, len(items), size)]
+	with ThreadPoolExecutor(max_workers=scan_threads) as ex:
+		return [r for chunk in ex.map(lambda c: [f(x) for x in c], chunks) for r in chunk]
+
+# Parsing holds the GIL and takes roughly 7 ms per 700 kB .idf, so threads only overlap the file reads. With at least
+# this many files not in scan_memo, scanMany() parses them in a pool of processes instead, one per CPU core, so 10,000
+# large models take seconds rather than a minute. The pool runs in a Python process of its own (this file run as a
+# script, like epml_results.py), since worker processes started from the GUI would import the GUI script again.
+process_scan_min = 200
+
+# Returns: [scan_memo key, summary] of one .idf, or None if it cannot be read; runs in a worker process
+def scanEntry(path):
+	try:
+		summary = scanIdf(path)
+	except (IOError, OSError):
+		return None
+	st = os.stat(path)
+	return [[os.path.abspath(path), st.st_size, st.st_mtime_ns], summary]
+
+# Scan .idf files in a pool of processes and add them to scan_memo. If that cannot run (e.g. in a packaged executable,
+# where sys.executable is not Python), scanMany() just scans them on threads.
+# Input: paths = list of .idf paths
+def scanProcesses(paths):
+	if getattr(sys, 'frozen', False):
+		return
+	try:
+		done = subprocess.run([sys.executable, os.path.abspath(__file__)], input='\n'.join(paths).encode('utf-8'), capture_output=True)
+	except (OSError) as e:
+		print('WARNING: Cannot start the .idf scan processes, scanning on threads: ', e)
+		return
+	if not done.returncode == 0:
+		print('WARNING: .idf scan processes failed, scanning on threads: ', done.stderr.decode(errors='replace'))
+		return
+	for line in done.stdout.decode('utf-8').splitlines():
+		memokey, summary = json.loads(line)
+		scan_memo[tuple(memokey)] = summary
+
+# Scan many .idf files. Only the files that changed since they were last scanned are read again (see scan_memo).
+# Input: paths = list of .idf paths
+# Returns: list of summaries, None for files that could not be read
+def scanMany(paths):
+	paths = list(paths)
+	def scanOrNone(path):
+		try:
+			return scanIdf(path)
+		except (IOError, OSError):
+			return None
+	def unscanned(path):
+		try:
+			st = os.stat(path)
+		except (OSError):
+			return False
+		return (os.path.abspath(path), st.st_size, st.st_mtime_ns) not in scan_memo
+	new = sorted(set(p for p, isnew in zip(paths, mapChunks(unscanned, paths)) if isnew))
+	if len(new) >= process_scan_min and (os.cpu_count() or 1) > 1:
+		scanProcesses(new)
+	return mapChunks(scanOrNone, paths)
+
+# Returns: total of the counts of every class starting with one of the prefixes
+def countPrefixes(summary, prefixes):
+	n = 0
+	for name, c in summary['counts'].items():
+		if name.startswith(prefixes):
+			n = n + c
+	return n
+
+
+# Run time estimate ==========================================================================================
+# The estimate is (simulated timesteps) x (work per timestep), where work per timestep grows with the number of zones,
+# surfaces, HVAC objects, and outputs reported every timestep. The result is in "work units", converted to seconds by
+# seconds_per_work, which is calibrated against run times this computer has actually recorded (see RuntimeEstimator).
+# ExternalInterface (co-simulation) models depend on the other programs, so they are estimated like any other model.
+
+# Class name prefixes counted as surfaces and as HVAC equipment, and surface classes matched by their whole name, whose
+# names also start other classes (e.g. Window vs WindowMaterial:Glazing, Door vs DoorConstruction)
+surface_prefixes = ('buildingsurface:', 'fenestrationsurface:', 'wall:', 'roofceiling:', 'floor:', 'ceiling:', 'shading:')
+surface_classes = {'roof', 'window', 'window:interzone', 'door', 'door:interzone', 'glazeddoor', 'glazeddoor:interzone', 'internalmass'}
+hvac_prefixes = ('airloophvac', 'zonehvac:', 'coil:', 'fan:', 'pump:', 'chiller:', 'boiler:', 'plantloop', 'condenserloop', 'airterminal:', 'coolingtower:', 'heatexchanger:', 'hvactemplate:', 'airconditioner:', 'heatpump:', 'waterheater:')
+# Relative cost of one zone, surface, HVAC object, and timestep output per timestep
+work_zone = 1.0
+work_surface = 0.2
+work_hvac = 0.5
+work_output = 0.02
+# Warmup days simulated before each environment (EnergyPlus runs 6 at least, more if it converges slowly)
+warmup_days = 6
+# Seconds per work unit before any calibration, roughly a 1 zone model for a year in 10 s
+default_seconds_per_work = 5e-5
+
+# Days from the begin month/day to the end month/day of a RunPeriod, ignoring leap years
+month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+def dayOfYear(month, day):
+	return sum(month_days[:month - 1]) + day
+
+# Number of days simulated by a RunPeriod object (EnergyPlus 8.9 and later field order: name first)
+def runPeriodDays(fields):
+	try:
+		begin = dayOfYear(int(fields[1]), int(fields[2]))
+		end = dayOfYear(int(fields[4]), int(fields[5]))
+	except (IndexError, ValueError):
+		return 365
+	if end < begin:
+		end = end + 365
+	return end - begin + 1
+
+# Estimate the work of simulating a model
+# Input: summary from scanIdf()
+# Returns: work units (float)
+def estimateWork(summary):
+	counts = summary['counts']
+	objects = summary['objects']
+	runperiods = objects.get('runperiod', [])
+	designdays = counts.get('sizingperiod:designday', 0) + counts.get('sizingperiod:weatherfiledays', 0)
+	days = sum(runPeriodDays(f) for f in runperiods) + designdays + warmup_days * (len(runperiods) + designdays)
+	# Nothing to simulate (or the periods come from somewhere the scan does not see), count it as one day
+	days = max(days, 1)
+	timestep = 6
+	for fields in objects.get('timestep', []):
+		try:
+			timestep = int(fields[0])
+		except (IndexError, ValueError):
+			pass
+	outputs = 0
+	for name in ['output:variable', 'output:meter', 'output:meter:meteronly']:
+		for fields in objects.get(name, []):
+			if len(fields) > 0 and fields[-1].lower() in ['timestep', 'detailed']:
+				outputs = outputs + 1
+	perstep = 1 + work_zone * counts.get('zone', 0) + work_surface * (countPrefixes(summary, surface_prefixes) + sum(counts.get(name, 0) for name in surface_classes)) + work_hvac * countPrefixes(summary, hvac_prefixes) + work_output * outputs
+	return days * 24 * timestep * perstep
+
+# Estimates run times in seconds from the .idf contents, calibrated against the run history
+class RuntimeEstimator:
+	# Input: history = RunHistory from epml_engine, or None to use the default calibration
+	#	Up to max_calibration models from the history that still exist are scanned; the median seconds per work unit of
+	#	their recorded run times is used for every estimate.
+	def __init__(self, history=None, max_calibration=200):
+		self.seconds_per_work = default_seconds_per_work
+		self.calibrated = 0
+		if history is None:
+			return
+		samples = [(path, row[0]) for path, row in history.bypath.items() if row[0] > 0][-max_calibration:]
+		summaries = scanMany([path for path, runtime in samples])
+		ratios = []
+		for (path, runtime), summary in zip(samples, summaries):
+			if summary is not None:
+				ratios.append(runtime / estimateWork(summary))
+		if len(ratios) > 0:
+			ratios.sort()
+			self.seconds_per_work = ratios[len(ratios) // 2]
+			self.calibrated = len(ratios)
+
+	# Returns: estimated seconds for each .idf path, None for files that could not be read
+	def estimateMany(self, paths):
+		return [None if s is None else estimateWork(s) * self.seconds_per_work for s in scanMany(paths)]
+
+# Format a number of seconds for display, e.g. '45 s', '12 min', '3.5 h'
+def formatDuration(seconds):
+	if seconds is None:
+		return '?'
+	if seconds < 60:
+		return str(round(seconds)) + ' s'
+	if seconds < 3600:
+		return str(round(seconds / 60)) + ' min'
+	return str(round(seconds / 3600, 1)) + ' h'
+
+
+# Validation =================================================================================================
+# Catches models that cannot run before a launch slot (and its reruns) is spent on them. Only problems that are sure to
+# stop EnergyPlus are reported; anything the scan cannot see (e.g. ##include files) is left for EnergyPlus to judge.
+
+# Objects every model needs, as [description, list of class names where any one will do]
+required_classes = [
+	['Building', ['building']],
+	['Timestep', ['timestep']],
+	['RunPeriod or SizingPeriod', ['runperiod', 'sizingperiod:designday', 'sizingperiod:weatherfiledays', 'sizingperiod:weatherfileconditiontype']],
+]
+
+# ep_dir -> [major, minor] version of that EnergyPlus, or None if unknown
+ep_versions = {}
+
+# Find the version of EnergyPlus, from the install folder name (e.g. EnergyPlusV9-4-0) or else from energyplus --version
+# Input: ep_dir = ep_dir setting
+# Returns: [major, minor] as strings, or None if it cannot be found
+def epVersion(ep_dir):
+	if ep_dir in ep_versions:
+		return ep_versions[ep_dir]
+	version = None
+	m = re.search(r'EnergyPlus-?V?(\d+)-(\d+)', ep_dir, re.IGNORECASE)
+	if m is not None:
+		version = [m.group(1), m.group(2)]
+	else:
+		try:
+			out = subprocess.run([ep_dir, '--version'], capture_output=True, text=True, timeout=30).stdout
+			m = re.search(r'Version (\d+)\.(\d+)', out)
+			if m is not None:
+				version = [m.group(1), m.group(2)]
+		except (OSError, subprocess.SubprocessError):
+			pass
+	ep_versions[ep_dir] = version
+	return version
+
+# Find a file referenced by an .idf (absolute, or relative to the .idf's folder or the current folder)
+# Returns: its path, or None if it does not exist
+def referencedFile(name, idf):
+	if os.path.isabs(name):
+		candidates = [name]
+	else:
+		candidates = [os.path.join(os.path.dirname(os.path.abspath(idf)), name), name]
+	for path in candidates:
+		if os.path.isfile(path):
+			return path
+	return None
+
+# Returns: True if a file referenced by an .idf exists
+def referencedFileExists(name, idf):
+	return referencedFile(name, idf) is not None
+
+# Returns: list of the file names in the Schedule:File objects of an .idf, as written in the .idf
+# Raises IOError/OSError if the .idf cannot be read
+def scheduleFiles(idf):
+	names = []
+	for fields in scanIdf(idf)['objects'].get('schedule:file', []):
+		if len(fields) > 2 and len(fields[2]) > 0 and fields[2] not in names:
+			names.append(fields[2])
+	return names
+
+# Replace file names in the fields of an .idf, leaving comments and layout as they are
+# Input: data = .idf contents as bytes, names = dictionary of field text -> new text
+# Returns: new contents as bytes
+def replaceFields(data, names):
+	lines = data.decode('latin-1').split('\n')
+	for n, line in enumerate(lines):
+		code, bang, comment = line.partition('!')
+		if not any(name in code for name in names):
+			continue
+		# Fields with their delimiters, e.g. ['  sched.csv', ',', '  !- ...']; whitespace around a field is kept
+		tokens = re.split(r'([,;])', code)
+		for t, token in enumerate(tokens):
+			if token.strip() in names:
+				tokens[t] = token[:len(token) - len(token.lstrip())] + names[token.strip()] + token[len(token.rstrip()):]
+		lines[n] = ''.join(tokens) + bang + comment
+	return '\n'.join(lines).encode('latin-1')
+
+# Check one simulation
+# Input: idf = .idf path, wfile = .epw path ('' or None = not checked), version = epVersion() or None = not checked,
+#	sqlite = True if the results will be read from eplusout.sql (readvars setting off), which needs Output:SQLite
+#	warnings = list that gets the problems that do not stop the simulation from running, e.g. no Output:SQLite (it
+#		still runs, only its results cannot be read from eplusout.sql), or None to not report them
+# Returns: list of problem strings that stop it from running, empty if none were found
+def validateIdf(idf, wfile=None, version=None, sqlite=False, warnings=None):
+	try:
+		summary = scanIdf(idf)
+	except (IOError, OSError) as e:
+		return ['cannot read .idf: ' + str(e)]
+	problems = []
+	counts = summary['counts']
+	objects = summary['objects']
+	if version is not None:
+		found = [f[0] for f in objects.get('version', []) if len(f) > 0]
+		if len(found) == 0:
+			problems.append('no Version object')
+		elif found[0].split('.')[:2] != version:
+			problems.append('Version ' + found[0] + ' does not match EnergyPlus ' + '.'.join(version))
+	for name, classes in required_classes:
+		if not any(c in counts for c in classes):
+			problems.append('no ' + name + ' object')
+	if sqlite and 'output:sqlite' not in counts and warnings is not None:
+		warnings.append('no Output:SQLite object, so no eplusout.sql to read its results from with readvars off')
+	if len(summary['unterminated']) > 0:
+		problems.append('object not terminated with ";": ' + summary['unterminated'].split('\n')[0][:40])
+	for fields in objects.get('schedule:file', []):
+		if len(fields) > 2 and len(fields[2]) > 0 and not referencedFileExists(fields[2], idf):
+			problems.append('Schedule:File not found: ' + fields[2])
+	if wfile is not None and len(wfile) > 0 and not os.path.isfile(wfile):
+		problems.append('weather file not found: ' + wfile)
+	return problems
+
+# Check many simulations at once
+# Input: idfs, wfiles = lists of paths (blank .idf entries are skipped), ep_dir = ep_dir setting ('' = no version check),
+#	sqlite = see validateIdf()
+# Returns: [dictionary of index -> list of problems, only for simulations that will not run, dictionary of index ->
+#	list of warnings from validateIdf(), only for simulations that run but have warnings]
+def validateMany(idfs, wfiles, ep_dir='', sqlite=False):
+	version = None
+	if len(ep_dir) > 0:
+		version = epVersion(ep_dir)
+	# Each distinct .idf/.epw pair is only checked once, queues often repeat them
+	pairs = sorted(set((idfs[i], wfiles[i]) for i in range(len(idfs)) if not len(idfs[i]) == 0))
+	# Parse the models first, in processes for large batches; the checks below then find them in scan_memo
+	scanMany(sorted(set(pair[0] for pair in pairs)))
+	def check(pair):
+		warnings = []
+		return [validateIdf(pair[0], pair[1], version, sqlite, warnings), warnings]
+	found = dict(zip(pairs, mapChunks(check, pairs)))
+	invalid = {}
+	warned = {}
+	for i in range(len(idfs)):
+		problems, warnings = found.get((idfs[i], wfiles[i]), [[], []])
+		if len(problems) > 0:
+			invalid[i] = problems
+		elif len(warnings) > 0:
+			warned[i] = warnings
+	return [invalid, warned]
+
+
+# Scan the .idf files named on stdin, one per line, in a pool of processes, and print one JSON line per file that could
+# be read: [[path, size, modified time], summary] (see scanProcesses())
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Scan .idf files in a pool of processes. Reads .idf paths from stdin, one per line, and prints one JSON summary per line.')
+	parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Processes scanning files at once')
+	args = parser.parse_args()
+	paths = [line.strip() for line in sys.stdin.buffer.read().decode('utf-8').splitlines() if len(line.strip()) > 0]
+	with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+		for entry in ex.map(scanEntry, paths, chunksize=max(1, min(max_chunk_size, math.ceil(len(paths) / (max(1, args.jobs) * 4))))):
+			if entry is not None:
+				sys.stdout.write(json.dumps(entry) + '\n')
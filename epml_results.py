@@ -0,0 +1,281 @@
+# epml_results.py
+# EnergyPlus MultiLaunch Results Store
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Combines the eplusout.csv and eplusmtr.csv files (from --readvars) of every successful simulation in a batch into one
+# columnar store, so one variable for every simulation can be loaded with a single read instead of parsing hundreds of
+# CSV files. The store is a folder with one sub folder per CSV file name ('eplusout', 'eplusmtr'), each holding:
+#	store.json = {"version": 1, "sims": number of simulations, "rows": number of timesteps, "dtype": "<f8"}
+#	sims.csv = Sim, Filepath, Rows: simulation id (0, 1, ...), its output folder, and how many rows its CSV had
+#	columns.csv = Column, Name, File: every column kept, and the file holding it
+#	time.csv = Row, Date/Time: the Date/Time column of the simulation with the most rows
+#	c00000.f64, c00001.f64, ... = one file per column: little endian float64, simulation by simulation, each
+#		simulation's values padded to "rows" with NaN. Missing values and columns a simulation does not have are NaN.
+# With numpy a column loads as numpy.memmap(file, dtype='<f8', mode='r', shape=(sims, rows)); without it use
+# ResultsStore.load().
+# Parsing runs in a process pool. This file is run as its own process (see epml_engine.aggregateResults()) so the
+# pool never has to import the GUI.
+# Usage:
+#	python epml_results.py --store epml_results --jobs 8 --columns "*Drybulb*;Electricity:Facility*" < outdirs.txt
+#	(outdirs.txt = one simulation output folder per line)
+# With the readvars setting off there are no CSV files; querySims() reads the same columns from the eplusout.sql files.
+
+
+# Import
+import argparse
+import array
+import csv
+import fnmatch
+import itertools
+import json
+import math
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.request import pathname2url
+
+
+store_version = 1
+# CSV files combined, each into its own table in the store
+table_files = ['eplusout.csv', 'eplusmtr.csv']
+time_column = 'Date/Time'
+nan_bytes = array.array('d', [math.nan]).tobytes()
+
+# Returns: column file name for column number n
+def columnFile(n):
+	return 'c' + str(n).zfill(5) + '.f64'
+
+# Returns: True if EnergyPlus finished the simulation in this output folder successfully
+def simSucceeded(outdir):
+	try:
+		with open(os.path.join(outdir, 'eplusout.err'), 'rb') as f:
+			f.seek(0, os.SEEK_END)
+			f.seek(max(0, f.tell() - 4096))
+			return b'EnergyPlus Completed Successfully' in f.read()
+	except (IOError, OSError):
+		return False
+
+# First pass over one CSV: the column names and the number of rows
+# Returns: [list of column names without Date/Time, number of rows], or None if it cannot be read
+def countCsv(path):
+	try:
+		with open(path, newline='') as f:
+			header = next(csv.reader(f), None)
+			if header is None:
+				return None
+			rows = sum(1 for line in f)
+	except (IOError, OSError):
+		return None
+	return [[name.strip() for name in header[1:]], rows]
+
+# Returns: array('d') of a column of strings, NaN where a value is blank or not a number
+def parseColumn(strings):
+	try:
+		return array.array('d', map(float, strings))
+	except (ValueError):
+		# Blank cells, e.g. a daily variable in a CSV with hourly ones; only then is each value checked
+		values = array.array('d')
+		for x in strings:
+			try:
+				values.append(float(x))
+			except (ValueError):
+				values.append(math.nan)
+		return values
+
+# Second pass over one CSV: parse it and write this simulation's slice of every column file
+# Input: job = [CSV path, table folder, simulation id, rows in the store, list of column names in the store]
+def writeCsv(job):
+	path, table, sim, rows, columns = job
+	with open(path, newline='') as f:
+		reader = csv.reader(f)
+		header = [name.strip() for name in next(reader)]
+		# Columns of the CSV as tuples of strings
+		cells = list(itertools.zip_longest(*reader, fillvalue=''))
+	where = {name: i for i, name in enumerate(header)}
+	data = {}
+	for name in columns:
+		if name in where and where[name] < len(cells):
+			data[name] = parseColumn(cells[where[name]])
+	for n, name in enumerate(columns):
+		values = data.get(name, array.array('d'))
+		del values[rows:]
+		if sys.byteorder == 'big':
+			values.byteswap()
+		with open(os.path.join(table, columnFile(n)), 'r+b') as f:
+			f.seek(sim * rows * 8)
+			f.write(values.tobytes() + nan_bytes * (rows - len(values)))
+
+# Build one table of the store
+# Input: outdirs = output folders of the successful simulations, table = folder to write, filename = CSV in each
+#	output folder, patterns = glob patterns of columns to keep (empty = all), ex = ProcessPoolExecutor
+# Returns: [number of simulations, number of columns, number of rows]
+def buildTable(outdirs, table, filename, patterns, ex):
+	paths = [os.path.join(d, filename) for d in outdirs]
+	counted = list(ex.map(countCsv, paths, chunksize=8))
+	sims = [[d, p, c[1]] for d, p, c in zip(outdirs, paths, counted) if c is not None]
+	if len(sims) == 0:
+		return [0, 0, 0]
+	# Every column any simulation has, in order of first appearance
+	columns = []
+	seen = set()
+	for c in counted:
+		if c is None:
+			continue
+		for name in c[0]:
+			if name not in seen and (len(patterns) == 0 or any(fnmatch.fnmatchcase(name, p) for p in patterns)):
+				seen.add(name)
+				columns.append(name)
+	rows = max(s[2] for s in sims)
+
+	os.makedirs(table, exist_ok=True)
+	for name in os.listdir(table):
+		if name.endswith('.f64') or name == 'store.json':
+			os.remove(os.path.join(table, name))
+	for n in range(len(columns)):
+		with open(os.path.join(table, columnFile(n)), 'wb') as f:
+			f.truncate(len(sims) * rows * 8)
+	jobs = [[p, table, i, rows, columns] for i, (d, p, r) in enumerate(sims)]
+	list(ex.map(writeCsv, jobs))
+
+	with open(os.path.join(table, 'sims.csv'), 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['Sim', 'Filepath', 'Rows'])
+		for i, (d, p, r) in enumerate(sims):
+			writer.writerow([i, d, r])
+	with open(os.path.join(table, 'columns.csv'), 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['Column', 'Name', 'File'])
+		for n, name in enumerate(columns):
+			writer.writerow([n, name, columnFile(n)])
+	longest = max(sims, key=lambda s: s[2])[1]
+	with open(longest, newline='') as src, open(os.path.join(table, 'time.csv'), 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['Row', time_column])
+		reader = csv.reader(src)
+		next(reader)
+		for n, row in enumerate(reader):
+			writer.writerow([n, row[0].strip() if len(row) > 0 else ''])
+	# Written last, so a store without store.json is incomplete
+	with open(os.path.join(table, 'store.json'), 'w') as f:
+		json.dump({'version': store_version, 'sims': len(sims), 'rows': rows, 'dtype': '<f8'}, f)
+	return [len(sims), len(columns), rows]
+
+# Build the whole store
+# Input: outdirs = simulation output folders (failed ones are skipped), store = folder, patterns = glob patterns of
+#	columns to keep (empty = all), jobs = processes
+# Returns: True if at least one simulation was stored
+def buildStore(outdirs, store, patterns, jobs):
+	ok = [d for d in outdirs if simSucceeded(d)]
+	print('Combining outputs of ', len(ok), ' of ', len(outdirs), ' simulations into ', store)
+	stored = False
+	with ProcessPoolExecutor(max_workers=max(1, jobs)) as ex:
+		for filename in table_files:
+			table = os.path.join(store, os.path.splitext(filename)[0])
+			nsims, ncols, rows = buildTable(ok, table, filename, patterns, ex)
+			print(filename, ': ', nsims, ' simulations, ', ncols, ' columns, ', rows, ' rows')
+			stored = stored or nsims > 0
+	return stored
+
+
+# Reading the store ==========================================================================================
+
+# One table of a store, e.g. ResultsStore('epml_results/eplusout')
+class ResultsStore:
+	def __init__(self, table):
+		self.table = table
+		with open(os.path.join(table, 'store.json')) as f:
+			self.meta = json.load(f)
+		with open(os.path.join(table, 'columns.csv'), newline='') as f:
+			self.files = {row['Name']: row['File'] for row in csv.DictReader(f)}
+		with open(os.path.join(table, 'sims.csv'), newline='') as f:
+			self.sims = [row['Filepath'] for row in csv.DictReader(f)]
+
+	# Returns: list of column names, optionally only those matching a glob pattern
+	def columns(self, pattern='*'):
+		return [name for name in self.files if fnmatch.fnmatchcase(name, pattern)]
+
+	# Returns: list of Date/Time strings, one per row
+	def times(self):
+		with open(os.path.join(self.table, 'time.csv'), newline='') as f:
+			return [row[time_column] for row in csv.DictReader(f)]
+
+	# Load one column for every simulation (or only some) with one read
+	# Input: name = column name, sims = list of simulation ids, None = all
+	# Returns: list of array('d'), one per simulation
+	def load(self, name, sims=None):
+		rows = self.meta['rows']
+		with open(os.path.join(self.table, self.files[name]), 'rb') as f:
+			data = array.array('d')
+			data.frombytes(f.read())
+		if sys.byteorder == 'big':
+			data.byteswap()
+		if sims is None:
+			sims = range(self.meta['sims'])
+		return [data[s * rows:(s + 1) * rows] for s in sims]
+
+
+# SQLite outputs =============================================================================================
+# EnergyPlus writes eplusout.sql when the .idf has an Output:SQLite object. Reading it needs no ReadVarsESO run, so
+# with readvars off this is how results are read. Columns are named like the CSV columns, "Key:Name [Units](Frequency)",
+# so the same glob patterns select them, e.g. "*Drybulb*" or "Electricity:Facility*".
+
+sql_file = 'eplusout.sql'
+
+# Returns: CSV style column name of one ReportDataDictionary row
+def sqlColumnName(key, name, units, frequency):
+	if key is not None and len(key) > 0:
+		name = key + ':' + name
+	return name + ' [' + (units or '') + '](' + (frequency or '') + ')'
+
+# Read the columns matching any of the patterns from one eplusout.sql. Warmup days are left out.
+# Input: path = .sql file, patterns = list of glob patterns (empty = all)
+# Returns: dictionary of column name -> [list of Date/Time strings, array('d') of values], or None if it cannot be read
+def querySql(path, patterns):
+	try:
+		# Read only, so many threads or processes can read it at once, and a missing file is not created
+		db = sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?mode=ro', uri=True)
+	except (sqlite3.Error):
+		return None
+	try:
+		names = {}
+		for index, key, name, units, frequency in db.execute('SELECT ReportDataDictionaryIndex, KeyValue, Name, Units, ReportingFrequency FROM ReportDataDictionary'):
+			column = sqlColumnName(key, name, units, frequency)
+			if len(patterns) == 0 or any(fnmatch.fnmatchcase(column, p) for p in patterns):
+				names[index] = column
+		found = {}
+		if len(names) == 0:
+			return found
+		rows = db.execute('SELECT r.ReportDataDictionaryIndex, t.Month, t.Day, t.Hour, t.Minute, r.Value FROM ReportData r JOIN Time t ON r.TimeIndex = t.TimeIndex'
+			+ ' WHERE (t.WarmupFlag IS NULL OR t.WarmupFlag = 0) AND r.ReportDataDictionaryIndex IN (' + ','.join(str(i) for i in names) + ')'
+			+ ' ORDER BY r.ReportDataDictionaryIndex, r.TimeIndex')
+		for index, month, day, hour, minute, value in rows:
+			if index not in found:
+				found[index] = [[], array.array('d')]
+			found[index][0].append(' %02d/%02d  %02d:%02d:00' % (month or 0, day or 0, hour or 0, minute or 0))
+			found[index][1].append(math.nan if value is None else value)
+		return {names[i]: found.get(i, [[], array.array('d')]) for i in names}
+	except (sqlite3.Error):
+		return None
+	finally:
+		db.close()
+
+# Read the same columns from the eplusout.sql of many simulations at once. sqlite3 releases the GIL while it reads, so
+# a thread pool is enough.
+# Input: outdirs = simulation output folders, patterns = list of glob patterns (empty = all), jobs = threads
+# Returns: list of querySql() results, one per output folder, None where there is no readable eplusout.sql
+def querySims(outdirs, patterns, jobs=8):
+	with ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+		return list(ex.map(lambda d: querySql(os.path.join(d, sql_file), patterns), outdirs))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Combine eplusout.csv/eplusmtr.csv of many simulations into one columnar store. Reads output folders from stdin, one per line.')
+	parser.add_argument('--store', required=True, help='Store folder to write')
+	parser.add_argument('--columns', default='', help='";" separated glob patterns of columns to keep (default: all)')
+	parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Processes parsing CSV files at once')
+	args = parser.parse_args()
+	outdirs = [line.strip() for line in sys.stdin if len(line.strip()) > 0]
+	patterns = [p.strip() for p in args.columns.split(';') if len(p.strip()) > 0]
+	sys.exit(0 if buildStore(outdirs, args.store, patterns, args.jobs) else 1)
@@ -0,0 +1,200 @@
+# epml_sweep.py
+# EnergyPlus MultiLaunch Parametric Sweeps
+# Author(s):    Brian Woo-Shem
+# Version:      0.50
+# Last Updated: 2023-06-05
+# Runs one template .idf many times with different values in place of placeholders such as PPPP (as the old
+# run_TEMPLATE.py did). Each variant .idf is written just before its simulation starts and deleted once it is done, and
+# the values of each point are worked out from its number when needed, so a 50,000 point sweep never has more than a
+# few variants on disk or in memory.
+# Sweep file (JSON), paths relative to the sweep file:
+#	{
+#		"template": "model.idf",
+#		"weather": "weather.epw",
+#		"folder": "model_sweep",
+#		"method": "grid",
+#		"parameters": {"PPPP": [0.1, 0.2, 0.3], "QQQQ": ["Concrete", "Brick"]},
+#		"samples": 1000,
+#		"seed": 1
+#	}
+#	folder = where the variants (sweep-00000.idf, ...), their output folders, and sweep.csv go (default: template name
+#		+ _sweep)
+#	method = grid: every combination of the values (the last parameter changes fastest)
+#		list: point i uses the i-th value of every parameter (lists of equal length)
+#		random: "samples" points, each parameter uniform between its [min, max]
+#		lhs: "samples" Latin hypercube points between each parameter's [min, max]
+#	seed = random and lhs only; the same seed gives the same points (default 0)
+# sweep.csv in the folder lists the values of every point: Sim, Filepath, then one column per placeholder.
+# The variants are written to the sweep folder but run in the template's folder, and the relative file names of
+# Schedule:File objects are written into each variant as full paths from the template's folder, so they point at the
+# same files wherever the variant is.
+# Usage:
+#	python -m epml sweep model_sweep.json --mode pool --jobs 8
+
+
+# Import
+import csv
+import json
+import os
+import random
+from epml_idf import validateIdf, epVersion, scheduleFiles, replaceFields
+
+
+sweep_methods = ['grid', 'list', 'random', 'lhs']
+sweep_table = 'sweep.csv'
+
+# Returns: text written in place of a placeholder for one value
+def formatValue(v):
+	if isinstance(v, float):
+		return format(v, '.10g')
+	return str(v)
+
+# One parametric sweep, read from a sweep file
+# Raises ValueError (or KeyError for a missing entry) if the sweep file is not valid, IOError/OSError if it or the
+# template cannot be read
+class Sweep:
+	def __init__(self, path):
+		with open(path) as f:
+			spec = json.load(f)
+		base = os.path.dirname(os.path.abspath(path))
+		self.template = os.path.join(base, spec['template'])
+		self.weather = os.path.join(base, spec['weather'])
+		self.folder = os.path.join(base, spec.get('folder', os.path.splitext(os.path.basename(spec['template']))[0] + '_sweep'))
+		self.method = spec.get('method', 'grid')
+		self.names = list(spec['parameters'])
+		self.values = [spec['parameters'][name] for name in self.names]
+		self.seed = spec.get('seed', 0)
+		if self.method not in sweep_methods:
+			raise ValueError('Unknown sweep method ' + str(self.method) + ', use one of ' + ', '.join(sweep_methods))
+		if len(self.names) == 0:
+			raise ValueError('Sweep has no parameters')
+		for name, v in zip(self.names, self.values):
+			if not isinstance(v, list) or len(v) == 0:
+				raise ValueError('Parameter ' + name + ' needs a list of values')
+		if self.method == 'grid':
+			self.count = 1
+			for v in self.values:
+				self.count = self.count * len(v)
+		elif self.method == 'list':
+			self.count = len(self.values[0])
+			if any(len(v) != self.count for v in self.values):
+				raise ValueError('Every parameter of a list sweep needs the same number of values')
+		else:
+			self.count = int(spec['samples'])
+			if self.count < 1:
+				raise ValueError('samples must be at least 1')
+			for name, v in zip(self.names, self.values):
+				if len(v) != 2 or not all(isinstance(x, (int, float)) for x in v):
+					raise ValueError('Parameter ' + name + ' of a ' + self.method + ' sweep needs [min, max]')
+		# Latin hypercube: the stratum of each point in each dimension, a shuffled range per parameter. These are the
+		# only per-point data kept, a few bytes per point.
+		self.strata = []
+		if self.method == 'lhs':
+			for d in range(len(self.names)):
+				order = list(range(self.count))
+				random.Random(str(self.seed) + '-lhs-' + str(d)).shuffle(order)
+				self.strata.append(order)
+		with open(self.template, 'rb') as f:
+			self.text = f.read()
+		self.width = len(str(self.count - 1))
+		# Relative Schedule:File names, as written in the template (they may contain placeholders)
+		self.relfiles = [name for name in scheduleFiles(self.template) if not os.path.isabs(name)]
+
+	# Returns: list of the values of point i, one per parameter
+	def point(self, i):
+		if self.method == 'grid':
+			found = []
+			for v in reversed(self.values):
+				i, k = divmod(i, len(v))
+				found.append(v[k])
+			return found[::-1]
+		if self.method == 'list':
+			return [v[i] for v in self.values]
+		# Each point has its own generator, so any point can be made without making the ones before it
+		rng = random.Random(str(self.seed) + '-' + str(i))
+		found = []
+		for d, (lo, hi) in enumerate(self.values):
+			u = rng.random()
+			if self.method == 'lhs':
+				u = (self.strata[d][i] + u) / self.count
+			found.append(lo + u * (hi - lo))
+		return found
+
+	# Returns: .idf path of variant i
+	def idfPath(self, i):
+		return os.path.join(self.folder, 'sweep-' + str(i).zfill(self.width) + '.idf')
+
+	# Returns: contents of variant i as bytes
+	def render(self, i):
+		text = self.text
+		point = [formatValue(v) for v in self.point(i)]
+		for name, v in zip(self.names, point):
+			text = text.replace(name.encode('latin-1'), v.encode('latin-1'))
+		if len(self.relfiles) == 0:
+			return text
+		base = os.path.dirname(self.template)
+		found = {}
+		for filename in self.relfiles:
+			for name, v in zip(self.names, point):
+				filename = filename.replace(name, v)
+			found[filename] = os.path.join(base, filename)
+		return replaceFields(text, found)
+
+	# Write variant i, to a temporary file first so a half written .idf is never run
+	# Returns: True if it was written
+	def write(self, i):
+		path = self.idfPath(i)
+		try:
+			os.makedirs(self.folder, exist_ok=True)
+			with open(path + '.tmp', 'wb') as f:
+				f.write(self.render(i))
+			os.replace(path + '.tmp', path)
+		except (IOError, OSError) as e:
+			print('ERROR: Could not write sweep variant ', path, ': ', e)
+			return False
+		return True
+
+	# Delete variant i once its simulation is done; its output folder is kept
+	def remove(self, i):
+		try:
+			os.remove(self.idfPath(i))
+		except (OSError):
+			pass
+
+	# Returns: [list of variant .idf paths, list of .epw paths], for epml_engine.run_ep()
+	def batch(self):
+		return [[self.idfPath(i) for i in range(self.count)], [self.weather] * self.count]
+
+	# Write sweep.csv, one point at a time
+	def writeTable(self):
+		os.makedirs(self.folder, exist_ok=True)
+		with open(os.path.join(self.folder, sweep_table), 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(['Sim', 'Filepath'] + self.names)
+			for i in range(self.count):
+				writer.writerow([i, self.idfPath(i)] + [formatValue(v) for v in self.point(i)])
+
+	# Check the template before the sweep starts, on its first variant, since the variants are not on disk to check
+	# one by one (see epml_idf.validateIdf())
+	# Input: settings = settings dictionary
+	# Returns: list of problem strings, empty if none were found
+	def check(self, settings):
+		problems = ['placeholder ' + name + ' not found in ' + self.template for name in self.names if name.encode('latin-1') not in self.text]
+		if not settings['validate']:
+			return problems
+		# In the sweep folder, like the variants, so file names are found as they will be when the variants run
+		path = os.path.join(self.folder, 'sweep-check-' + str(os.getpid()) + '.idf')
+		try:
+			os.makedirs(self.folder, exist_ok=True)
+			with open(path, 'wb') as f:
+				f.write(self.render(0))
+			warnings = []
+			problems = problems + validateIdf(path, self.weather, epVersion(settings['ep_dir']), not settings['readvars'], warnings)
+			for warning in warnings:
+				print('WARNING: Sweep template ', self.template, ': ', warning)
+		except (IOError, OSError) as e:
+			problems.append('cannot write ' + path + ': ' + str(e))
+		finally:
+			if os.path.exists(path):
+				os.remove(path)
+		return problems